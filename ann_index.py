@@ -0,0 +1,175 @@
+import os
+import math
+import numpy as np
+import faiss
+
+# Index types understood by make_index
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+# How LiveIndex.search combines the FAISS index with the BM25 index (see lexical_index.py):
+# dense only, reciprocal-rank fusion, weighted score fusion, or BM25 candidates rescored densely
+RETRIEVAL_MODES = ("dense", "rrf", "weighted", "prefilter")
+
+DEFAULT_INDEX_CONFIG = {
+    "type": "flat",      # one of INDEX_TYPES
+    "metric": "l2",      # "l2", or "ip" for inner product on L2-normalized vectors (cosine)
+    "nlist": 0,          # IVF cells, 0 picks ~4*sqrt(N) from the training set
+    "pq_m": 16,          # PQ sub-quantizers (must divide the embedding dimension)
+    "hnsw_m": 32,        # HNSW neighbours per node
+    "nprobe": 16,        # IVF cells visited per query
+    "ef_search": 64,     # HNSW search breadth
+    "retrieval": "dense",  # one of RETRIEVAL_MODES
+    "candidates": 50,    # hits taken from each retriever before fusion
+    "dense_weight": 0.5,  # share of the dense score in "weighted" fusion
+}
+
+
+def index_config(**overrides):
+    """Return DEFAULT_INDEX_CONFIG updated with the given non-None values."""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if config["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {config['type']!r}, expected one of {INDEX_TYPES}")
+    if config["metric"] not in ("l2", "ip"):
+        raise ValueError(f"Unknown metric {config['metric']!r}, expected 'l2' or 'ip'")
+    if config["retrieval"] not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {config['retrieval']!r}, expected one of {RETRIEVAL_MODES}")
+    return config
+
+
+def _env(name, cast=str):
+    """The environment variable name converted with cast, or None when unset (the default applies)."""
+    value = os.environ.get(name)
+    return None if value is None or value == "" else cast(value)
+
+
+def index_config_from_env():
+    """
+    index_config from the INDEX_* / IVF_* / PQ_M / HNSW_* / RETRIEVAL_* environment variables,
+    so the bot and the crawler's streaming indexer build the same index. Unset variables keep
+    the DEFAULT_INDEX_CONFIG value.
+    """
+    return index_config(
+        type=_env("INDEX_TYPE"),
+        metric=_env("INDEX_METRIC"),
+        nlist=_env("IVF_NLIST", int),
+        pq_m=_env("PQ_M", int),
+        hnsw_m=_env("HNSW_M", int),
+        nprobe=_env("IVF_NPROBE", int),
+        ef_search=_env("HNSW_EF_SEARCH", int),
+        retrieval=_env("RETRIEVAL_MODE"),
+        candidates=_env("RETRIEVAL_CANDIDATES", int),
+        dense_weight=_env("DENSE_WEIGHT", float),
+    )
+
+
+def auto_nlist(n_vectors):
+    """Pick a number of IVF cells for a corpus of n_vectors."""
+    return max(1, min(65536, int(4 * math.sqrt(n_vectors))))
+
+
+def factory_string(config, n_train):
+    """Return the faiss.index_factory description for config."""
+    nlist = config["nlist"] or auto_nlist(n_train)
+    return {
+        "flat": "Flat",
+        "hnsw": f"HNSW{config['hnsw_m']}",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_pq": f"IVF{nlist},PQ{config['pq_m']}",
+    }[config["type"]]
+
+
+def min_training_size(config, n_train):
+    """Number of vectors needed to train config (0 if it needs no training)."""
+    if config["type"] in ("flat", "hnsw"):
+        return 0
+    nlist = config["nlist"] or auto_nlist(n_train)
+    # PQ with 8-bit codes learns 256 centroids per sub-quantizer
+    return max(nlist, 256) if config["type"] == "ivf_pq" else nlist
+
+
+def make_index(config, dimension, train_vectors=None):
+    """
+    Create an ID-mapped FAISS index for config (IVF indexes map IDs themselves), trained on
+    train_vectors if the type needs it.
+    Falls back to a flat index when there are too few vectors to train (see needs_training).
+    """
+    n_train = 0 if train_vectors is None else len(train_vectors)
+    if n_train < min_training_size(config, n_train):
+        print(f"Only {n_train} vectors, too few to train a {config['type']} index, using flat until there are enough")
+        config = dict(config, type="flat")
+
+    metric = faiss.METRIC_INNER_PRODUCT if config["metric"] == "ip" else faiss.METRIC_L2
+    description = factory_string(config, n_train)
+    base_index = faiss.index_factory(dimension, description, metric)
+    if not base_index.is_trained:
+        print(f"Training {description} index on {n_train} vectors")
+        base_index.train(train_vectors)
+    if hasattr(base_index, "nlist"):
+        # IVF lists store the IDs themselves; an ID map around them breaks after the first
+        # remove_ids, since removing from the lists does not compact the positions the map expects
+        faiss_index = base_index
+    else:
+        faiss_index = faiss.IndexIDMap2(base_index)
+    set_search_params(faiss_index, config)
+    return faiss_index
+
+
+def prepare_vectors(vectors, config):
+    """Cast vectors for FAISS: contiguous float32, L2-normalized for the inner-product metric."""
+    vectors = np.array(vectors, dtype="float32", order="C")
+    if config["metric"] == "ip":
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def base_index(faiss_index):
+    """Return the index inside an ID map, downcast to its concrete type."""
+    if isinstance(faiss_index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(faiss_index.index)
+    return faiss_index
+
+
+def index_type(faiss_index):
+    """The INDEX_TYPES entry faiss_index was built as (flat when make_index fell back to it)."""
+    inner = faiss.downcast_index(base_index(faiss_index))
+    if hasattr(inner, "hnsw"):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if hasattr(inner, "nlist"):
+        return "ivf_flat"
+    return "flat"
+
+
+def needs_training(faiss_index, config, n_vectors):
+    """
+    True if faiss_index, holding n_vectors, should be rebuilt as config asks: it fell back to
+    flat for lack of training vectors and there are enough now, or its IVF cells were sized
+    (nlist 0) for a corpus under a quarter of n_vectors. Rebuilding each time the corpus grows
+    4x keeps the total rebuild work linear in its size.
+    """
+    if config["type"] not in ("ivf_flat", "ivf_pq") or n_vectors < min_training_size(config, n_vectors):
+        return False
+    if index_type(faiss_index) != config["type"]:
+        return True
+    return not config["nlist"] and auto_nlist(n_vectors) >= 2 * base_index(faiss_index).nlist
+
+
+def set_search_params(faiss_index, config):
+    """Apply the runtime search knobs (nprobe, efSearch) that fit this index type."""
+    inner = base_index(faiss_index)
+    if hasattr(inner, "nprobe"):
+        inner.nprobe = config["nprobe"]
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = config["ef_search"]
+
+
+def supports_remove(faiss_index):
+    """HNSW graphs cannot delete vectors, every other type here can."""
+    return not hasattr(base_index(faiss_index), "hnsw")
+
+
+def index_memory_bytes(faiss_index):
+    """Size of the serialized index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(faiss_index).nbytes)
@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import faiss
+# Questions are keyed on the same normalization as duplicate paragraphs, so trivial variants share a key
+from dedup import normalize_text
+
+
+class AnswerCache:
+    """
+    Bounded cache of generated answers.
+
+    Lookups first try the normalized question text, then the nearest past question in a small
+    inner-product FAISS index of normalized query embeddings (cosine similarity >= similarity_threshold).
+    Entries are evicted least-recently-used beyond max_entries and expire after ttl seconds.
+    Everything is dropped when the document index version changes.
+    """
+
+    def __init__(self, dimension, max_entries=1000, ttl=3600, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized question -> entry, least recently used first
+        self._keys = {}  # vector id -> normalized question
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self._next_id = 0
+        self._version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize_vec(vec):
+        vec = np.asarray(vec, dtype="float32").reshape(1, -1).copy()
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _sync_version(self, version):
+        """Clear the cache when the document index changed since the entries were stored."""
+        if version == self._version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._keys.clear()
+        self._index.reset()
+        self._version = version
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        del self._keys[entry["id"]]
+        self._index.remove_ids(np.array([entry["id"]], dtype="int64"))
+
+    def _get_live(self, key):
+        """Return the entry for key if present and fresh, marking it most recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["created"] > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup_exact(self, question, version):
+        """Return the cached value for this question text, or None. Misses are counted by lookup_similar."""
+        with self._lock:
+            self._sync_version(version)
+            entry = self._get_live(normalize_text(question))
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return entry["value"]
+
+    def lookup_similar(self, question, query_vec, version):
+        """Return the cached value for this question or the most similar past one, or None."""
+        with self._lock:
+            self._sync_version(version)
+            entry = self._get_live(normalize_text(question))
+            if entry is not None:
+                self.exact_hits += 1
+                return entry["value"]
+            if self._index.ntotal:
+                similarities, ids = self._index.search(self._normalize_vec(query_vec), 1)
+                if ids[0][0] != -1 and similarities[0][0] >= self.similarity_threshold:
+                    entry = self._get_live(self._keys[int(ids[0][0])])
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry["value"]
+            self.misses += 1
+            return None
+
+    def put(self, question, query_vec, value, version):
+        """Store value for question. Values computed against an older index version are dropped."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return
+            self._sync_version(version)
+            key = normalize_text(question)
+            if key in self._entries:
+                self._remove(key)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(self._normalize_vec(query_vec), np.array([entry_id], dtype="int64"))
+            self._entries[key] = {"id": entry_id, "value": value, "created": time.monotonic()}
+            self._keys[entry_id] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
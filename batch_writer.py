@@ -0,0 +1,76 @@
+"""
+Background batching shared by the crawler's sinks (MongoWriter, IndexWriter): callers queue
+items, one thread hands them over in batches.
+"""
+import time
+import queue
+import threading
+
+# Queued by stop() to end the writer thread once everything before it is written
+_CLOSE = object()
+
+
+class BatchWriter:
+    """
+    Queue items and write them from a background thread, every batch_size items or
+    flush_interval seconds after the first one of a batch, whichever comes first.
+
+    Subclasses implement _write_batch(batch) and start the thread with start() once set up;
+    max_queued > 0 bounds the queue, put() then blocks until the thread catches up.
+    """
+
+    def __init__(self, name, batch_size, flush_interval, max_queued=0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, item):
+        """Queue item for the next batch. Returns the seconds spent waiting for room in the queue."""
+        try:
+            self._queue.put_nowait(item)
+            return 0.0
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put(item)
+            return time.monotonic() - started
+
+    def _drain(self):
+        """
+        Collect up to batch_size items, for at most flush_interval seconds after the first one.
+        Returns (batch, closed) where closed means stop() was called.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                return batch, True
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, False
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _run(self):
+        closed = False
+        while not closed:
+            batch, closed = self._drain()
+            if batch:
+                self._write_batch(batch)
+
+    def stop(self):
+        """Write everything still queued and wait for the thread to end."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
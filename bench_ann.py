@@ -0,0 +1,145 @@
+"""
+Compare FAISS index types on the scraped corpus: recall@k against exact (flat) search,
+queries per second and index memory. Documents are cut into passages by the bot's chunker
+(same PASSAGE_TOKENS / PASSAGE_OVERLAP environment), so the vectors are those the live index holds.
+
+    python bench_ann.py --k 3 --metric ip --queries questions.jsonl --output ann_results.json
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+from sentence_transformers import SentenceTransformer
+from ann_index import INDEX_TYPES, index_config, make_index, set_search_params, index_memory_bytes
+from index_store import iter_documents
+from index_writer import chunker_from_env
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def load_questions(path):
+    """Read questions from a JSONL file ("question" field, or "title" for backlog-style files)."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                questions.append(record.get("question") or record.get("title"))
+    return [q for q in questions if q]
+
+
+def recall_at_k(found_ids, true_ids):
+    """Mean fraction of the exact top-k neighbours that the approximate search returned."""
+    hits = 0
+    total = 0
+    for found, truth in zip(found_ids, true_ids):
+        truth = set(int(i) for i in truth if i != -1)
+        hits += len(truth.intersection(int(i) for i in found))
+        total += len(truth)
+    return hits / total if total else 0.0
+
+
+def benchmark(config, doc_vecs, query_vecs, k, true_ids, repeats):
+    """Build one index type and measure it for each value of its search knob."""
+    ids = np.arange(len(doc_vecs), dtype="int64")
+    started = time.perf_counter()
+    faiss_index = make_index(config, doc_vecs.shape[1], doc_vecs)
+    faiss_index.add_with_ids(doc_vecs, ids)
+    build_seconds = time.perf_counter() - started
+    memory = index_memory_bytes(faiss_index)
+
+    if config["type"] in ("ivf_flat", "ivf_pq"):
+        knob, values = "nprobe", [1, 4, 16, 64]
+    elif config["type"] == "hnsw":
+        knob, values = "ef_search", [16, 32, 64, 128]
+    else:
+        knob, values = None, [None]
+
+    rows = []
+    for value in values:
+        search_config = dict(config, **{knob: value}) if knob else config
+        set_search_params(faiss_index, search_config)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            _, found_ids = faiss_index.search(query_vecs, k)
+        elapsed = (time.perf_counter() - started) / repeats
+        rows.append({
+            "type": config["type"],
+            "metric": config["metric"],
+            "knob": f"{knob}={value}" if knob else "",
+            "recall_at_k": recall_at_k(found_ids, true_ids),
+            "qps": len(query_vecs) / elapsed if elapsed else float("inf"),
+            "build_seconds": build_seconds,
+            "memory_mb": memory / 2 ** 20,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default="scraped_data/", help="folder of scraped documents, or a corpus")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="sentence-transformers model")
+    parser.add_argument("--embeddings", help=".npy file to load passage embeddings from (written if missing)")
+    parser.add_argument("--queries", help="JSONL file of questions; defaults to sampled documents")
+    parser.add_argument("--n-queries", type=int, default=200, help="passages to sample as queries")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--metric", choices=("l2", "ip"), default="l2")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nlist", type=int, default=0, help="IVF cells (0 = auto)")
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3, help="timed passes over the queries")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    embed_model = SentenceTransformer(args.model)
+    if args.embeddings and os.path.isfile(args.embeddings):
+        doc_vecs = np.load(args.embeddings)
+    else:
+        chunker = chunker_from_env(embed_model.tokenizer)
+        passages = []
+        for file_name, content in iter_documents(args.documents):
+            passages.extend(passage["content"] for passage in chunker(file_name, content).values())
+        print(f"Encoding {len(passages)} passages")
+        doc_vecs = embed_model.encode(passages, convert_to_numpy=True, show_progress_bar=True)
+        if args.embeddings:
+            np.save(args.embeddings, doc_vecs)
+    doc_vecs = np.array(doc_vecs, dtype="float32", order="C")
+
+    if args.queries:
+        query_vecs = embed_model.encode(load_questions(args.queries), convert_to_numpy=True)
+    else:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(doc_vecs), size=min(args.n_queries, len(doc_vecs)), replace=False)
+        query_vecs = doc_vecs[sample]
+    query_vecs = np.array(query_vecs, dtype="float32", order="C")
+
+    if args.metric == "ip":
+        faiss.normalize_L2(doc_vecs)
+        faiss.normalize_L2(query_vecs)
+
+    # Exact neighbours from a flat index are the ground truth
+    exact = faiss.IndexFlatIP(doc_vecs.shape[1]) if args.metric == "ip" else faiss.IndexFlatL2(doc_vecs.shape[1])
+    exact.add(doc_vecs)
+    _, true_ids = exact.search(query_vecs, args.k)
+
+    print(f"{len(doc_vecs)} passages, {len(query_vecs)} queries, k={args.k}, metric={args.metric}")
+    results = []
+    for index_type in args.types:
+        config = index_config(type=index_type, metric=args.metric, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        results.extend(benchmark(config, doc_vecs, query_vecs, args.k, true_ids, args.repeats))
+
+    print(f"{'type':<10}{'knob':<15}{'recall@k':>10}{'qps':>12}{'build s':>10}{'memory MB':>12}")
+    for row in results:
+        print(f"{row['type']:<10}{row['knob']:<15}{row['recall_at_k']:>10.3f}{row['qps']:>12.0f}"
+              f"{row['build_seconds']:>10.2f}{row['memory_mb']:>12.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"passages": len(doc_vecs), "queries": len(query_vecs), "k": args.k, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Compare the CPU inference backends of inference.py against the eager fp32 models:
+generation latency (one request at a time), batched throughput, answer agreement with eager,
+and embedding latency and cosine agreement.
+
+    python bench_inference.py --documents corpus/ --prompts 50 --threads 4 --output inference_results.json
+"""
+import json
+import time
+import random
+import argparse
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+from inference import INFERENCE_BACKENDS, configure_threads, load_embedder, load_generator
+from chunking import passages_from_file
+from context_packer import ContextPacker
+from index_store import read_documents
+
+GEN_MODEL = "google/flan-t5-base"
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+QUESTIONS = [
+    "Quels sont les documents nécessaires pour l'inscription ?",
+    "Quelles sont les dates des examens ?",
+    "Comment contacter l'administration ?",
+    "Quelles formations propose l'IHEC Carthage ?",
+    "Quelles sont les conditions d'admission en master ?",
+]
+
+
+def sample_prompts(documents, tokenizer, n_prompts, seed=0):
+    """(question, passage) pairs from random passages of the corpus."""
+    rng = random.Random(seed)
+    files = read_documents(documents)
+    names = sorted(files)
+    rng.shuffle(names)
+    prompts = []
+    for name in names:
+        for passage in passages_from_file(name, files[name], tokenizer).values():
+            prompts.append((rng.choice(QUESTIONS), passage["content"]))
+        if len(prompts) >= n_prompts:
+            break
+    return prompts[:n_prompts]
+
+
+def token_f1(answer, reference):
+    """Word-overlap F1 between two answers."""
+    answer, reference = answer.lower().split(), reference.lower().split()
+    if not answer or not reference:
+        return float(answer == reference)
+    common = sum(min(answer.count(word), reference.count(word)) for word in set(answer))
+    if not common:
+        return 0.0
+    precision, recall = common / len(answer), common / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def bench_generation(backend, tokenizer, packer, prompts, batch_size, threads, max_new_tokens):
+    started = time.perf_counter()
+    model, backend = load_generator(GEN_MODEL, backend, threads)
+    load_seconds = time.perf_counter() - started
+    input_ids = [packer.pack(question, [{"content": passage}]) for question, passage in prompts]
+
+    answers, latencies = [], []
+    with torch.inference_mode():
+        # One untimed call so lazy initialization is not counted
+        model.generate(**packer.pad(input_ids[:1]), max_new_tokens=max_new_tokens)
+        for ids in input_ids:
+            started = time.perf_counter()
+            outputs = model.generate(**packer.pad([ids]), max_new_tokens=max_new_tokens)
+            latencies.append(time.perf_counter() - started)
+            answers.append(tokenizer.decode(outputs[0], skip_special_tokens=True))
+
+        started = time.perf_counter()
+        for start in range(0, len(input_ids), batch_size):
+            model.generate(**packer.pad(input_ids[start:start + batch_size]), max_new_tokens=max_new_tokens)
+        batched_seconds = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "answers_per_second": len(input_ids) / batched_seconds,
+    }, answers
+
+
+def bench_embedding(backend, texts, reference=None):
+    model, backend = load_embedder(EMBED_MODEL, backend)
+    model.encode(texts[:1])
+    started = time.perf_counter()
+    for text in texts:
+        model.encode([text])
+    per_text_ms = (time.perf_counter() - started) * 1000 / len(texts)
+    started = time.perf_counter()
+    vectors = model.encode(texts, batch_size=32, normalize_embeddings=True)
+    texts_per_second = len(texts) / (time.perf_counter() - started)
+    row = {"backend": backend, "mean_ms": per_text_ms, "texts_per_second": texts_per_second}
+    if reference is not None:
+        row["cosine_to_eager"] = float(np.mean(np.sum(vectors * reference, axis=1)))
+    return row, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default="scraped_data/", help="folder of scraped documents, or a corpus")
+    parser.add_argument("--prompts", type=int, default=50, help="generation prompts to run per backend")
+    parser.add_argument("--batch-size", type=int, default=8, help="batch size for the throughput pass")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = one per core)")
+    parser.add_argument("--max-new-tokens", type=int, default=150)
+    parser.add_argument("--backends", nargs="+", choices=INFERENCE_BACKENDS, default=list(INFERENCE_BACKENDS))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    threads = configure_threads(args.threads or None)
+    tokenizer = AutoTokenizer.from_pretrained(GEN_MODEL)
+    packer = ContextPacker(tokenizer)
+    prompts = sample_prompts(args.documents, tokenizer, args.prompts)
+    if not prompts:
+        parser.error(f"no passages found in {args.documents}")
+    print(f"{len(prompts)} prompts, {threads} threads")
+
+    # Eager always runs first: it is the reference the others are compared to
+    backends = ["eager"] + [backend for backend in args.backends if backend != "eager"]
+    generation, embedding = [], []
+    reference_answers = reference_vectors = None
+    for backend in backends:
+        row, answers = bench_generation(backend, tokenizer, packer, prompts, args.batch_size, threads, args.max_new_tokens)
+        if reference_answers is None:
+            reference_answers = answers
+        row["requested"] = backend
+        row["exact_match"] = float(np.mean([a == r for a, r in zip(answers, reference_answers)]))
+        row["token_f1"] = float(np.mean([token_f1(a, r) for a, r in zip(answers, reference_answers)]))
+        generation.append(row)
+
+        row, vectors = bench_embedding(backend, [passage for _, passage in prompts], reference_vectors)
+        if reference_vectors is None:
+            reference_vectors = vectors
+        row["requested"] = backend
+        embedding.append(row)
+
+    print(f"{'LLM':<8}{'mean ms':>10}{'p95 ms':>10}{'answers/s':>11}{'exact':>8}{'f1':>7}{'load s':>8}")
+    for row in generation:
+        print(f"{row['requested']:<8}{row['mean_ms']:>10.0f}{row['p95_ms']:>10.0f}{row['answers_per_second']:>11.2f}"
+              f"{row['exact_match']:>8.2f}{row['token_f1']:>7.2f}{row['load_seconds']:>8.1f}")
+    print(f"{'embed':<8}{'mean ms':>10}{'texts/s':>10}{'cosine':>9}")
+    for row in embedding:
+        print(f"{row['requested']:<8}{row['mean_ms']:>10.2f}{row['texts_per_second']:>10.0f}"
+              f"{row.get('cosine_to_eager', 1.0):>9.4f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"prompts": len(prompts), "threads": threads, "generation": generation, "embedding": embedding},
+                      f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
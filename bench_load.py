@@ -0,0 +1,358 @@
+"""
+Load test: replay questions from a JSONL file against /chat and report throughput, latency
+percentiles, per-stage timings (from /chat?timings=1) and peak memory.
+
+Each line holds a "question" (or --field). Requests run in-process through Flask's test client,
+or over HTTP with --url. With --rate, requests arrive at that many per second (Poisson, open
+loop) and latency counts from the scheduled arrival, so a saturated server is not hidden by
+the client waiting; otherwise --concurrency clients send back to back. With --bulk, all the
+questions go to /chat/batch in one request instead (set ADMIN_TOKEN for a remote server).
+
+--deadline sends each request with that X-Request-Timeout: under overload the server sheds
+(503/504) or degrades answers instead of queueing, and goodput counts full answers returned
+within the deadline, the number to watch along with p99 when pushing --rate past capacity.
+
+    python bench_load.py questions.jsonl --stub --requests 500 --concurrency 16 --output load.json
+    python bench_load.py questions.jsonl --url http://localhost:5000 --rate 5 --duration 60
+    python bench_load.py questions.jsonl --stub --no-cache --rate 200 --concurrency 256 --deadline 2
+    python bench_load.py questions.jsonl --stub --no-cache --bulk
+
+--stub runs the app in-process with the fake models of stub_models.py (no download, little
+CPU) and, without --documents, a small corpus generated from the questions: fast enough for CI.
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def load_questions(path, field="question"):
+    """Questions from a JSONL file, in order."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                question = json.loads(line).get(field)
+                if isinstance(question, str) and question.strip():
+                    questions.append(question)
+    return questions
+
+
+def write_stub_documents(folder, questions):
+    """Scraped-style records whose paragraphs contain the questions, so retrieval has something to find."""
+    os.makedirs(folder, exist_ok=True)
+    for i, question in enumerate(questions):
+        record = {
+            "url": f"https://ihec.rnu.tn/stub/{i}",
+            "topic": f"stub {i}",
+            "paragraphs": [question, f"Réponse de test numéro {i} pour la question : {question}"],
+        }
+        with open(os.path.join(folder, f"stub_{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+
+
+class HttpClient:
+    """POST questions to a running server."""
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def chat(self, question, deadline=None):
+        body = json.dumps({"question": question}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if deadline:
+            headers["X-Request-Timeout"] = str(deadline)
+        req = urllib.request.Request(f"{self.url}/chat?timings=1", data=body, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def chat_batch(self, questions):
+        """Send the questions to /chat/batch as NDJSON; yield each answer line as it arrives."""
+        body = "".join(json.dumps({"question": question}) + "\n" for question in questions).encode("utf-8")
+        headers = {"Content-Type": "application/x-ndjson", "X-Admin-Token": os.environ.get("ADMIN_TOKEN", "")}
+        req = urllib.request.Request(f"{self.url}/chat/batch", data=body, headers=headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def get(self, path):
+        with urllib.request.urlopen(f"{self.url}{path}", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def peak_memory_mb(self):
+        """Peak RSS of the server process, if it runs on this machine."""
+        try:
+            pid = self.get("/stats")["pid"]
+            with open(f"/proc/{pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except (OSError, KeyError, ValueError, urllib.error.URLError):
+            pass
+        return None
+
+
+class InProcessClient:
+    """Call the Flask app directly through a test client per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def chat(self, question, deadline=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {"X-Request-Timeout": str(deadline)} if deadline else {}
+        response = client.post("/chat?timings=1", json={"question": question}, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+    def chat_batch(self, questions):
+        response = self.app.test_client().post("/chat/batch", json={"questions": questions}, buffered=False,
+                                               headers={"X-Admin-Token": os.environ.get("ADMIN_TOKEN", "")})
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat/batch answered {response.status_code}: {response.get_data(as_text=True)}")
+        # Lines may be split across chunks of the streamed body
+        pending = b""
+        for chunk in response.iter_encoded():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    def peak_memory_mb(self):
+        # ru_maxrss is in KB on Linux (bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def start_app(args):
+    """Import bot01 with the environment the arguments ask for and wait until it is ready."""
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    if args.stub:
+        os.environ["INFERENCE_BACKEND"] = "stub"
+        os.environ["EMBED_BACKEND"] = "stub"
+        # Never re-encode the real index with stub vectors
+        os.environ["INDEX_FOLDER"] = os.path.join(workdir, "index")
+    if args.documents:
+        os.environ["DOCUMENTS_FOLDER"] = os.environ["CORPUS_FOLDER"] = args.documents
+    elif args.stub:
+        documents = os.path.join(workdir, "documents")
+        write_stub_documents(documents, args.questions_list)
+        os.environ["DOCUMENTS_FOLDER"] = os.environ["CORPUS_FOLDER"] = documents
+    if not args.cache:
+        os.environ["CACHE_MAX_ENTRIES"] = "0"
+
+    started = time.perf_counter()
+    import bot01
+    if not bot01.startup.wait(args.startup_timeout):
+        raise SystemExit(f"App not ready: {bot01.startup.status()}")
+    print(f"App ready in {time.perf_counter() - started:.1f}s")
+    return InProcessClient(bot01.app)
+
+
+def run(client, questions, n_requests, concurrency, rate, duration, deadline=None, seed=0):
+    """Send the questions (cycling through them) and return one record per request."""
+    rng = random.Random(seed)
+    records = []
+    records_lock = threading.Lock()
+    # Closed loop: at most concurrency requests queued or in flight
+    slots = threading.Semaphore(concurrency)
+
+    def send(question, scheduled):
+        status, body = None, None
+        try:
+            status, body = client.chat(question, deadline)
+        except Exception as e:
+            body = {"error": str(e)}
+        finally:
+            if rate <= 0:
+                slots.release()
+        record = {
+            "latency": time.perf_counter() - scheduled,
+            "status": status,
+            "timings": (body or {}).get("timings", {}),
+            "degraded": (body or {}).get("degraded"),
+        }
+        with records_lock:
+            records.append(record)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        arrival = started
+        for i in range(n_requests):
+            if rate > 0:
+                arrival += rng.expovariate(rate)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                scheduled = arrival
+            else:
+                scheduled = None
+            if duration and time.perf_counter() - started > duration:
+                break
+            question = questions[i % len(questions)]
+            if scheduled is None:
+                # Closed loop: latency counts from when a client picks the request up
+                slots.acquire()
+                pool.submit(lambda q=question: send(q, time.perf_counter()))
+            else:
+                pool.submit(send, question, scheduled)
+    return records, time.perf_counter() - started
+
+
+def run_bulk(client, questions):
+    """Answer all the questions with one /chat/batch request."""
+    started = time.perf_counter()
+    first = None
+    answers = errors = 0
+    for line in client.chat_batch(questions):
+        if first is None:
+            first = time.perf_counter() - started
+        if "answer" in line:
+            answers += 1
+        else:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": 1,
+        "questions": len(questions),
+        "answers": answers,
+        "errors": errors,
+        "seconds": elapsed,
+        "first_answer_seconds": first,
+        "throughput": answers / elapsed if elapsed else 0.0,
+    }
+
+
+def summarize(records, elapsed, deadline=None):
+    """Throughput, goodput (full answers within the deadline), latency percentiles in ms and mean / p95 per stage."""
+    ok = [record for record in records if record["status"] == 200]
+    statuses = {}
+    degraded = {}
+    for record in records:
+        statuses[str(record["status"])] = statuses.get(str(record["status"]), 0) + 1
+        if record["degraded"]:
+            degraded[record["degraded"]] = degraded.get(record["degraded"], 0) + 1
+    good = [record for record in ok if not record["degraded"] and (not deadline or record["latency"] <= deadline)]
+    latencies = np.array([record["latency"] for record in ok]) * 1000
+    summary = {
+        "requests": len(records),
+        "ok": len(ok),
+        "statuses": statuses,
+        "degraded": degraded,
+        "seconds": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "goodput": len(good) / elapsed if elapsed else 0.0,
+    }
+    if len(latencies):
+        summary["latency_ms"] = {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        }
+    stages = {}
+    for record in ok:
+        for stage, ms in record["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+    summary["stages_ms"] = {stage: {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+                            for stage, values in stages.items()}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def save_results(args, summary):
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key != "questions_list"}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config,
+                       "results": summary}, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL file with one question per line")
+    parser.add_argument("--field", default="question", help="JSON field holding the question")
+    parser.add_argument("--url", help="server to load over HTTP (default: run the app in-process)")
+    parser.add_argument("--stub", action="store_true", help="in-process with the offline stub models")
+    parser.add_argument("--documents", help="documents folder or corpus for the in-process app")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="disable the answer cache of the in-process app")
+    parser.add_argument("--requests", type=int, default=0, help="requests to send (default: one per question)")
+    parser.add_argument("--duration", type=float, default=0, help="stop sending after this many seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at most")
+    parser.add_argument("--rate", type=float, default=0, help="arrivals per second (0: closed loop)")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests sent first")
+    parser.add_argument("--bulk", action="store_true", help="send every question in one /chat/batch request")
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP timeout per request (seconds)")
+    parser.add_argument("--deadline", type=float, default=0,
+                        help="X-Request-Timeout sent with each request, and the goodput deadline (seconds)")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions, args.field)
+    if not questions:
+        parser.error(f"no {args.field!r} found in {args.questions}")
+    if args.url and (args.stub or args.documents):
+        parser.error("--stub and --documents configure the in-process app, not a server at --url")
+    args.questions_list = questions
+
+    client = HttpClient(args.url, args.timeout) if args.url else start_app(args)
+    for question in questions[:args.warmup]:
+        client.chat(question)
+
+    if args.bulk:
+        summary = run_bulk(client, [questions[i % len(questions)] for i in range(args.requests or len(questions))])
+        summary["peak_memory_mb"] = client.peak_memory_mb()
+        print(f"{summary['answers']}/{summary['questions']} answered in {summary['seconds']:.1f}s: "
+              f"{summary['throughput']:.2f} answers/s, first after {summary['first_answer_seconds'] or 0:.1f}s")
+        save_results(args, summary)
+        return
+
+    n_requests = args.requests or (10 ** 9 if args.duration else len(questions))
+    records, elapsed = run(client, questions, n_requests, args.concurrency, args.rate, args.duration, args.deadline)
+    summary = summarize(records, elapsed, args.deadline)
+    summary["peak_memory_mb"] = client.peak_memory_mb()
+
+    print(f"{summary['ok']}/{summary['requests']} ok in {elapsed:.1f}s: {summary['throughput']:.2f} answers/s, "
+          f"goodput {summary['goodput']:.2f}/s, statuses {summary['statuses']}, degraded {summary['degraded']}")
+    if "latency_ms" in summary:
+        latency = summary["latency_ms"]
+        print(f"latency ms: p50 {latency['p50']:.0f}, p95 {latency['p95']:.0f}, p99 {latency['p99']:.0f}, "
+              f"max {latency['max']:.0f}")
+    for stage, values in summary["stages_ms"].items():
+        print(f"  {stage:<10}{values['mean']:>10.1f} ms mean{values['p95']:>10.1f} ms p95")
+    if summary["peak_memory_mb"] is not None:
+        print(f"peak memory {summary['peak_memory_mb']:.0f} MB")
+    save_results(args, summary)
+
+
+
+if __name__ == "__main__":
+    main()
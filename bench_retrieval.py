@@ -0,0 +1,137 @@
+"""
+Compare dense-only retrieval with the BM25 hybrid modes: hit rate@k, MRR and latency per query.
+
+Queries come from a JSONL file with a "question" and the expected "file" (or "url") per line.
+Without one, known-item queries are sampled from the corpus: a few consecutive words of a
+passage, preferring spans with codes, dates or numbers, must retrieve a passage of its file.
+
+    python bench_retrieval.py --documents corpus/ --k 3 --output retrieval_results.json
+"""
+import json
+import time
+import random
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from ann_index import RETRIEVAL_MODES, index_config
+from chunking import passages_from_file, source_file
+from index_store import LiveIndex
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def load_labelled_queries(path):
+    """Read (question, expected file or URL) pairs from a JSONL file."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("question") and (record.get("file") or record.get("url")):
+                    queries.append((record["question"], record.get("file") or record.get("url")))
+    return queries
+
+
+def sample_queries(live_index, n_queries, words=8, seed=0):
+    """Known-item queries: spans of words from random passages, labelled with their file."""
+    rng = random.Random(seed)
+    names = list(live_index._docs)
+    rng.shuffle(names)
+    queries = []
+    for name in names:
+        passage = live_index.passages.get(name)
+        tokens = passage["content"].split() if passage else []
+        if len(tokens) < words:
+            continue
+        starts = list(range(len(tokens) - words + 1))
+        # Prefer spans holding a token with digits, the exact terms dense retrieval tends to miss
+        with_digits = [i for i in starts if any(c.isdigit() for t in tokens[i:i + words] for c in t)]
+        start = rng.choice(with_digits or starts)
+        queries.append((" ".join(tokens[start:start + words]), source_file(name)))
+        if len(queries) >= n_queries:
+            break
+    return queries
+
+
+def is_hit(doc, target):
+    """True if a retrieved passage comes from the expected file or URL."""
+    return target in (source_file(doc["name"]), doc.get("url"))
+
+
+def benchmark(live_index, embed_model, queries, k, mode):
+    """Search every query one at a time in the given retrieval mode."""
+    live_index.config["retrieval"] = mode
+    query_vecs = embed_model.encode([question for question, _ in queries], convert_to_numpy=True)
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    for (question, target), query_vec in zip(queries, query_vecs):
+        started = time.perf_counter()
+        top_docs = live_index.search(query_vec[None, :], k, [question])[0]
+        latencies.append(time.perf_counter() - started)
+        for rank, doc in enumerate(top_docs):
+            if is_hit(doc, target):
+                hits += 1
+                reciprocal_ranks += 1.0 / (rank + 1)
+                break
+    latencies = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "hit_rate_at_k": hits / len(queries),
+        "mrr": reciprocal_ranks / len(queries),
+        "mean_ms": float(latencies.mean()),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default="scraped_data/", help="folder of scraped documents, or a corpus")
+    parser.add_argument("--index-folder", default="bench_index/", help="where the benchmark index is cached")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="sentence-transformers model")
+    parser.add_argument("--queries", help="JSONL file of questions with their expected file or URL")
+    parser.add_argument("--n-queries", type=int, default=200, help="known-item queries to sample")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--metric", choices=("l2", "ip"), default="l2")
+    parser.add_argument("--candidates", type=int, default=50, help="hits per retriever before fusion")
+    parser.add_argument("--dense-weight", type=float, default=0.5)
+    parser.add_argument("--modes", nargs="+", choices=RETRIEVAL_MODES, default=list(RETRIEVAL_MODES))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    embed_model = SentenceTransformer(args.model)
+
+    def chunk_file(file_name, content):
+        return passages_from_file(file_name, content, embed_model.tokenizer)
+
+    config = index_config(metric=args.metric, candidates=args.candidates, dense_weight=args.dense_weight)
+    live_index = LiveIndex(embed_model, args.model, args.index_folder, config, chunk_file)
+    live_index.sync_folder(args.documents)
+
+    if args.queries:
+        queries = load_labelled_queries(args.queries)
+    else:
+        queries = sample_queries(live_index, args.n_queries)
+    if not queries:
+        parser.error("no queries to run")
+
+    # Time the BM25 index on its own, the part hybrid modes add to each query
+    started = time.perf_counter()
+    for question, _ in queries:
+        live_index.lexical.search(question, args.candidates)
+    lexical_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"{len(live_index)} passages, {len(queries)} queries, k={args.k}, BM25 alone {lexical_ms:.2f} ms/query")
+    results = [benchmark(live_index, embed_model, queries, args.k, mode) for mode in args.modes]
+    print(f"{'mode':<12}{'hit@k':>8}{'mrr':>8}{'mean ms':>10}{'p95 ms':>10}")
+    for row in results:
+        print(f"{row['mode']:<12}{row['hit_rate_at_k']:>8.3f}{row['mrr']:>8.3f}{row['mean_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"passages": len(live_index), "queries": len(queries), "k": args.k,
+                       "lexical_ms": lexical_ms, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
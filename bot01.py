@@ -1,97 +1,547 @@
 import os
+import json
+import time
+import functools
+import contextlib
+import threading
 import torch
-import faiss
-import numpy as np
-from flask import Flask, request, jsonify
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from flask import Flask, Response, request, jsonify, g
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from index_store import ARTIFACTS_FOLDER, LiveIndex
+from ann_index import index_config_from_env
+from chunking import PASSAGE_TOKENS, PASSAGE_OVERLAP, make_chunker
+from scheduler import BatchScheduler, ConcurrencyLimit, QueueFull, DeadlineExceeded
+from answer_cache import AnswerCache
+from context_packer import ContextPacker
+from corpus_store import is_corpus
+from inference import configure_threads, load_embedder, load_generator, load_generation_tokenizer, embedding_model_id
+from readiness import Startup
+from metrics import Registry, StageTimer, format_server_timing
 
 app = Flask(__name__)
 
 # Folder containing the documents
-DOCUMENTS_FOLDER = "scraped_data/"  # Replace with the path to your folder
+DOCUMENTS_FOLDER = os.environ.get("DOCUMENTS_FOLDER", "scraped_data/")  # Replace with the path to your folder
+
+# Corpus written by the crawler (see corpus_store.py), used instead of DOCUMENTS_FOLDER when present
+CORPUS_FOLDER = os.environ.get("CORPUS_FOLDER", "corpus/")
+if is_corpus(CORPUS_FOLDER):
+    DOCUMENTS_FOLDER = CORPUS_FOLDER
 
 # Base URL for IHEC Carthage (no longer used for file paths)
 # BASE_URL = "https://ihec.rnu.tn/"  # This can be removed if not needed elsewhere
 
-# 1) Load embeddings model (Sentence Transformers)
-embed_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+# Folder where embeddings and the FAISS index are cached between restarts
+INDEX_FOLDER = os.environ.get("INDEX_FOLDER", ARTIFACTS_FOLDER)
+
+# CPU inference: eager (fp32 PyTorch), int8 (dynamically quantized) or onnx (ONNX Runtime),
+# for the LLM and, unless EMBED_BACKEND says otherwise, the embedding model. See inference.py
+# (stub runs tiny fake models offline, for load tests)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "eager")
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", INFERENCE_BACKEND)
 
-# 2) Prepare data from the folder
-doc_texts = []
-# Removed pdf_links_array as PDF links are not applicable anymore
-# Removed urls_array as URLs are not applicable anymore
+# Under gunicorn (see gunicorn.conf.py) this module is loaded once in the master process, which
+# forks the workers afterwards so they share the model weights and the index copy-on-write.
+# The master runs single-threaded: thread pools do not survive a fork, and each worker sizes
+# its own in start_worker()
+PRELOAD_FORK = os.environ.get("PRELOAD_FORK") == "1"
+TORCH_THREADS = configure_threads(1 if PRELOAD_FORK else int(os.environ.get("TORCH_THREADS", "0")) or None)
 
-# Read all files in the folder
-for filename in os.listdir(DOCUMENTS_FOLDER):
-    file_path = os.path.join(DOCUMENTS_FOLDER, filename)
-    if os.path.isfile(file_path):
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-            doc_texts.append(content)
-            # Removed pdf_links_array and urls_array append operations
+# Heavy components are loaded in background threads (see `startup` below) so the server
+# answers /health at once; they are None until loaded
+embed_model = None
+tokenizer = None
+context_packer = None
+live_index = None
+answer_cache = None
+gen_model = None
 
-# 3) Compute embeddings for each doc
-doc_embeddings = embed_model.encode(doc_texts, convert_to_numpy=True)
+# 1) Embeddings model (Sentence Transformers)
+embed_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
 
-# 4) Build FAISS index
-dimension = doc_embeddings.shape[1]
-faiss_index = faiss.IndexFlatL2(dimension)
-faiss_index.add(doc_embeddings)
+# Index type: flat (exact), hnsw, ivf_flat or ivf_pq; metric l2 or ip (cosine). See ann_index.py
+# RETRIEVAL_MODE adds BM25 keyword search: rrf or weighted fusion, or prefilter (BM25 candidates
+# rescored by the dense index); dense uses embeddings only
+# (settings read from the environment by ann_index.index_config_from_env)
+INDEX_CONFIG = index_config_from_env()
 
-# 5) Load local LLM for generating final answers
+# Scraped records are indexed as overlapping passages of at most PASSAGE_TOKENS tokens
+PASSAGE_TOKENS = int(os.environ.get("PASSAGE_TOKENS", PASSAGE_TOKENS))
+PASSAGE_OVERLAP = int(os.environ.get("PASSAGE_OVERLAP", PASSAGE_OVERLAP))
+
+# Generation tokenizer, loaded before the index so passages are tokenized once at ingest time;
+# prompts are then packed from cached token IDs up to MAX_INPUT_TOKENS
 model_name = "google/flan-t5-base"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-gen_model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+MAX_INPUT_TOKENS = int(os.environ.get("MAX_INPUT_TOKENS", "512"))
+MAX_NEW_TOKENS = int(os.environ.get("MAX_NEW_TOKENS", "150"))  # Increased max tokens for more detailed answers
+# /chat/stream gives up when the LLM produces no text for this long (seconds)
+STREAM_TOKEN_TIMEOUT = float(os.environ.get("STREAM_TOKEN_TIMEOUT", "60"))
+
+# Poll the folder for new crawls (seconds, 0 disables the watcher)
+WATCH_INTERVAL = int(os.environ.get("WATCH_INTERVAL", "0"))
+
+# How often to check for an index saved by another process: another gunicorn worker, or the
+# crawler indexing pages as it scrapes them (scrap.py --index) (seconds)
+INDEX_FOLLOW_INTERVAL = float(os.environ.get("INDEX_FOLLOW_INTERVAL", "5"))
+
+# Sync the index with DOCUMENTS_FOLDER at startup; 0 when the crawler is the only one feeding
+# the index (scrap.py --index --output none), as the folder then does not hold the pages
+SYNC_DOCUMENTS = os.environ.get("SYNC_DOCUMENTS", "1") != "0"
+
+# Token required by the /admin endpoints (leave unset to allow local calls only)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Cache of past answers, matched by normalized question or by query embedding similarity
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "3600"))  # seconds
+CACHE_SIMILARITY = float(os.environ.get("CACHE_SIMILARITY", "0.95"))  # cosine similarity
+# Cached answers are dropped whenever the index changes; with CACHE_KEEP_ON_ADDITIONS=1 they are
+# kept while passages are only added (e.g. during a crawl), and may then miss the new pages until CACHE_TTL
+CACHE_KEEP_ON_ADDITIONS = os.environ.get("CACHE_KEEP_ON_ADDITIONS", "0") == "1"
+
+# Prometheus metrics served on /metrics: per-stage latency histograms (encode, cache, search,
+# prompt, tokenize, generate, queue, total), token and error counters. See metrics.py
+metrics = Registry("ihec_chat", {"pid": os.getpid})
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in each stage of answering a question", ("stage",))
+request_seconds = metrics.histogram("request_seconds", "HTTP request latency", ("endpoint",))
+requests_total = metrics.counter("requests_total", "HTTP requests answered", ("endpoint", "status"))
+errors_total = metrics.counter("errors_total", "Requests that failed with a server error", ("endpoint",))
+input_tokens_total = metrics.counter("input_tokens_total", "Encoder tokens fed to the LLM")
+output_tokens_total = metrics.counter("output_tokens_total", "Tokens generated by the LLM")
+# Goodput: /chat answers returned before their deadline, per answer mode (full, short, retrieval_only)
+goodput_total = metrics.counter("goodput_total", "Answers returned before their deadline", ("mode",))
+shed_total = metrics.counter("shed_total", "/chat requests turned away: queue_full or deadline", ("reason",))
+
+def load_embeddings():
+    global embed_model, EMBED_BACKEND
+    embed_model, EMBED_BACKEND = load_embedder(embed_model_name, EMBED_BACKEND)
+
+def load_tokenizer():
+    global tokenizer, context_packer
+    tokenizer = load_generation_tokenizer(model_name, INFERENCE_BACKEND)
+    context_packer = ContextPacker(tokenizer, MAX_INPUT_TOKENS)
+
+def load_index():
+    """2) + 3) + 4) Load the cached FAISS index and sync it with the folder, only encoding new or changed passages."""
+    global live_index, answer_cache
+    # Scraped records are cut into passages with their topic, path, file links and LLM token IDs
+    chunker = make_chunker(embed_model.tokenizer, context_packer, PASSAGE_TOKENS, PASSAGE_OVERLAP)
+    index = LiveIndex(embed_model, embedding_model_id(embed_model_name, EMBED_BACKEND), INDEX_FOLDER, INDEX_CONFIG, chunker)
+    if SYNC_DOCUMENTS:
+        index.sync_folder(DOCUMENTS_FOLDER)
+    # Under gunicorn each worker starts its own threads after the fork
+    if not PRELOAD_FORK:
+        index.follow(INDEX_FOLLOW_INTERVAL)
+        if WATCH_INTERVAL > 0 and SYNC_DOCUMENTS:
+            index.watch(DOCUMENTS_FOLDER, WATCH_INTERVAL)
+    answer_cache = AnswerCache(index.dimension, CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_SIMILARITY)
+    live_index = index
+
+def cache_version():
+    """Index version the answer cache is keyed on (see CACHE_KEEP_ON_ADDITIONS)."""
+    return live_index.stale_version if CACHE_KEEP_ON_ADDITIONS else live_index.version
 
-def get_top_k_docs(query, k=3):
+def load_llm():
+    """5) Load local LLM for generating final answers."""
+    global gen_model, INFERENCE_BACKEND
+    gen_model, INFERENCE_BACKEND = load_generator(model_name, INFERENCE_BACKEND, TORCH_THREADS)
+    print(f"Inference: {INFERENCE_BACKEND} LLM, {EMBED_BACKEND} embeddings, {TORCH_THREADS} threads")
+
+# Question answered once before reporting ready, so kernels, caches and thread pools are warm
+WARMUP_QUESTION = "Quels sont les documents nécessaires pour l'inscription ?"
+
+def warmup():
+    """Run one retrieval and generation end to end, bypassing the answer cache."""
+    top_docs = get_top_k_docs(WARMUP_QUESTION, k=3)
+    generate_answer(WARMUP_QUESTION, top_docs)
+
+def get_top_k_docs_batch(queries, k=3, timer=None):
+    """Return top-k relevant documents for each query with one batched encode and search."""
+    timer = timer or StageTimer(stage_seconds)
+    with timer.stage("encode"):
+        query_vecs = embed_model.encode(queries, convert_to_numpy=True)
+    with timer.stage("search"):
+        return live_index.search(query_vecs, k, queries)
+
+def get_top_k_docs(query, k=3, timer=None):
     """Return top-k relevant documents from the FAISS index."""
-    query_vec = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = faiss_index.search(query_vec, k)
-    top_docs = []
-    for idx in indices[0]:
-        top_docs.append({
-            "content": doc_texts[idx],
-            # Removed pdf_links and url since they're not used
-        })
-    return top_docs
-
-def generate_answer(query, context):
-    """Use the local LLM to generate an answer based on the retrieved context."""
-    # Add IHEC Carthage-specific context to the prompt
-    prompt = (
-        f"You are an assistant for IHEC Carthage, a university in Tunisia. "
-        f"Answer the following question based on the provided context and ensure the response is relevant to IHEC Carthage:\n\n"
-        f"Question: {query}\n\n"
-        f"Context: {context}\n\n"
-        f"Answer:"
-    )
-    inputs = tokenizer([prompt], return_tensors="pt", truncation=True)
-    outputs = gen_model.generate(**inputs, max_new_tokens=150)  # Increased max tokens for more detailed answers
-    answer = tokenizer.batch_decode(outputs, skip_special_tokens=True)[0]
-    return answer
+    return get_top_k_docs_batch([query], k, timer)[0]
+
+def generate_answers(queries, top_docs_batch, batch_size=None, timer=None, max_new_tokens=MAX_NEW_TOKENS):
+    """
+    Generate answers for several questions with padded, batched generate calls.
+    When the inputs are split into batches of batch_size they are sorted by length first,
+    so each batch pads to similar lengths.
+    """
+    answers = [None] * len(queries)
+    for chunk, decoded in generate_answer_batches(queries, top_docs_batch, batch_size, timer, max_new_tokens):
+        for i, answer in zip(chunk, decoded):
+            answers[i] = answer
+    return answers
+
+def run_generate(inputs, max_new_tokens):
+    """One batched generate call (on the calling thread, so in the scheduler worker for /chat/batch)."""
+    with torch.inference_mode():
+        return gen_model.generate(**inputs, max_new_tokens=max_new_tokens)
+
+def generate_answer_batches(queries, top_docs_batch, batch_size=None, timer=None, max_new_tokens=MAX_NEW_TOKENS,
+                            call=None):
+    """
+    Like generate_answers, but yield (positions in queries, answers) as each batch is generated.
+    call(fn) runs each generate call, e.g. on another thread (default: here).
+    """
+    timer = timer or StageTimer(stage_seconds)
+    with timer.stage("prompt"):
+        input_ids = [context_packer.pack(query, top_docs) for query, top_docs in zip(queries, top_docs_batch)]
+    input_tokens_total.inc(sum(len(ids) for ids in input_ids))
+    order = list(range(len(input_ids)))
+    if batch_size and len(input_ids) > batch_size:
+        order.sort(key=lambda i: len(input_ids[i]))
+    else:
+        batch_size = len(input_ids)
+
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        with timer.stage("tokenize"):
+            inputs = context_packer.pad([input_ids[i] for i in chunk])
+        with timer.stage("generate"):
+            generate = functools.partial(run_generate, inputs, max_new_tokens)
+            outputs = call(generate) if call else generate()
+        # Padding (also T5's decoder start token) is not generated text
+        output_tokens_total.inc(int((outputs != tokenizer.pad_token_id).sum()))
+        with timer.stage("tokenize"):
+            decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        yield chunk, decoded
+
+def generate_answer(query, top_docs):
+    """Use the local LLM to generate an answer based on the retrieved passages."""
+    return generate_answers([query], [top_docs])[0]
+
+class StopOnEvent(StoppingCriteria):
+    """Stops generate() at the next decoding step once event is set."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool)
+
+def stream_answer(query, top_docs, timer=None, max_new_tokens=MAX_NEW_TOKENS, deadline=None):
+    """
+    Yield pieces of the answer as soon as the LLM decodes them, stopping at deadline (a
+    time.monotonic() value). Errors in the generation thread are raised here, and queue.Empty
+    when no text came for STREAM_TOKEN_TIMEOUT seconds. Closing the generator early (the
+    client left) stops the generation, and returns once its thread has finished.
+    """
+    timer = timer or StageTimer(stage_seconds)
+    with timer.stage("prompt"):
+        input_ids = context_packer.pack(query, top_docs)
+    input_tokens_total.inc(len(input_ids))
+    with timer.stage("tokenize"):
+        inputs = context_packer.pad([input_ids])
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                    timeout=STREAM_TOKEN_TIMEOUT)
+    stop = threading.Event()
+    options = {"max_new_tokens": max_new_tokens, "stopping_criteria": StoppingCriteriaList([StopOnEvent(stop)])}
+    if deadline is not None:
+        options["max_time"] = max(0.0, deadline - time.monotonic())
+    failed = []
+
+    def generate():
+        try:
+            # inference_mode is per thread, enter it in the generation thread itself
+            with torch.inference_mode():
+                gen_model.generate(**inputs, streamer=streamer, **options)
+        except Exception as e:
+            failed.append(e)
+            # Otherwise the consumer waits for text that never comes
+            streamer.end()
+
+    started = time.perf_counter()
+    pieces = []
+    generation = threading.Thread(target=generate, name="stream-generate", daemon=True)
+    generation.start()
+    try:
+        for text in streamer:
+            if text:
+                pieces.append(text)
+                yield text
+    finally:
+        # Whoever limits concurrent streams counts this one until the LLM is really done with it
+        stop.set()
+        generation.join()
+    if failed:
+        raise failed[0]
+    timer.add("generate", time.perf_counter() - started)
+    output_tokens_total.inc(len(context_packer.tokenize_passages(["".join(pieces)])[0]))
+
+def overload_mode(queue_depth):
+    """How to answer while queue_depth questions wait: "full", "short" (fewer new tokens) or "retrieval_only"."""
+    if RETRIEVAL_ONLY_QUEUE_DEPTH and queue_depth >= RETRIEVAL_ONLY_QUEUE_DEPTH:
+        return "retrieval_only"
+    if DEGRADE_QUEUE_DEPTH and queue_depth >= DEGRADE_QUEUE_DEPTH:
+        return "short"
+    return "full"
+
+def retrieval_answer(top_docs):
+    """Answer without the LLM: the best matching passage (the sources follow it in the response)."""
+    return top_docs[0]["content"][:500] if top_docs else ""
+
+def answer_batch(items):
+    """
+    Retrieve and answer a batch of (question, deadline) items, returning (answer, top_docs, timings,
+    mode) per question, or None for questions whose deadline passed during retrieval (they are not
+    generated); timings holds the seconds spent in each stage by the whole batch.
+    While questions pile up behind this batch, answers are shortened or left to retrieval (see
+    overload_mode); only full answers are cached.
+    """
+    queries = [query for query, _ in items]
+    mode = overload_mode(current_load())
+    timer = StageTimer(stage_seconds)
+    version = cache_version()
+    with timer.stage("encode"):
+        query_vecs = embed_model.encode(queries, convert_to_numpy=True)
+    with timer.stage("cache"):
+        results = [answer_cache.lookup_similar(query, query_vec, version) for query, query_vec in zip(queries, query_vecs)]
+    modes = ["full"] * len(queries)
+
+    # Only search and generate for questions the cache could not answer
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        with timer.stage("search"):
+            top_docs_batch = live_index.search(query_vecs[misses], k=3, queries=[queries[i] for i in misses])
+        now = time.monotonic()
+        live = [(i, top_docs) for i, top_docs in zip(misses, top_docs_batch)
+                if items[i][1] is None or items[i][1] > now]
+        answers = []
+        if mode == "retrieval_only":
+            answers = [retrieval_answer(top_docs) for _, top_docs in live]
+        elif live:
+            max_new_tokens = DEGRADED_MAX_NEW_TOKENS if mode == "short" else MAX_NEW_TOKENS
+            answers = generate_answers([queries[i] for i, _ in live], [top_docs for _, top_docs in live],
+                                       timer=timer, max_new_tokens=max_new_tokens)
+        for (i, top_docs), answer in zip(live, answers):
+            results[i] = (answer, top_docs)
+            modes[i] = mode
+            if mode == "full":
+                answer_cache.put(queries[i], query_vecs[i], results[i], version)
+    return [None if result is None else (*result, timer.seconds, answer_mode)
+            for result, answer_mode in zip(results, modes)]
+
+def answer_bulk(queries, batch_size, use_cache=True):
+    """
+    Answer many questions at once for /chat/batch: one batched encode and search for all of
+    them, then generation in batches of similar prompt lengths. Yields (position, answer,
+    top_docs, cached) as soon as each batch is done, cache hits first. Answers are cached.
+    Each generate call runs on the /chat scheduler's worker, between /chat batches (see
+    BatchScheduler.call), so the LLM is only ever used by that thread and /chat/stream.
+    """
+    timer = StageTimer(stage_seconds)
+    version = cache_version()
+    with timer.stage("encode"):
+        query_vecs = embed_model.encode(queries, batch_size=64, convert_to_numpy=True)
+    misses = list(range(len(queries)))
+    if use_cache:
+        with timer.stage("cache"):
+            cached = [answer_cache.lookup_similar(query, query_vec, version) for query, query_vec in zip(queries, query_vecs)]
+        for i, result in enumerate(cached):
+            if result is not None:
+                yield (i, *result, True)
+        misses = [i for i, result in enumerate(cached) if result is None]
+    if not misses:
+        return
+
+    with timer.stage("search"):
+        top_docs_batch = live_index.search(query_vecs[misses], k=3, queries=[queries[i] for i in misses])
+    for chunk, answers in generate_answer_batches([queries[i] for i in misses], top_docs_batch, batch_size, timer,
+                                                  call=chat_scheduler.call):
+        for j, answer in zip(chunk, answers):
+            i = misses[j]
+            answer_cache.put(queries[i], query_vecs[i], (answer, top_docs_batch[j]), version)
+            yield i, answer, top_docs_batch[j], False
+
+# Concurrent /chat requests are collected for up to BATCH_MAX_WAIT_MS and answered together
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+# Request threads per process (gunicorn's gthread threads, see gunicorn.conf.py). A waiting /chat
+# request holds one, so the queue can never be deeper than the threads left once a batch is
+# being answered: the thresholds below default to shares of that, otherwise overload would
+# pile up in gunicorn's connection backlog, where no deadline runs, instead of being shed here
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "64"))
+_WAITING_THREADS = max(1, WEB_THREADS - BATCH_MAX_SIZE)
+
+# Load shedding for /chat. Each request gets REQUEST_TIMEOUT seconds (or less, with an
+# X-Request-Timeout header): past it the question is dropped from the queue, or not generated
+# if it was still being retrieved, and answered 504. Beyond CHAT_MAX_QUEUED waiting questions
+# new ones get 503 with Retry-After at once. From DEGRADE_QUEUE_DEPTH waiting questions answers
+# get at most DEGRADED_MAX_NEW_TOKENS tokens, and from RETRIEVAL_ONLY_QUEUE_DEPTH the LLM is
+# skipped and the best passage is returned with the sources (0 disables each of these)
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "30"))
+CHAT_MAX_QUEUED = int(os.environ.get("CHAT_MAX_QUEUED", str(max(1, 3 * _WAITING_THREADS // 4))))
+DEGRADE_QUEUE_DEPTH = int(os.environ.get("DEGRADE_QUEUE_DEPTH", str(max(1, _WAITING_THREADS // 4))))
+RETRIEVAL_ONLY_QUEUE_DEPTH = int(os.environ.get("RETRIEVAL_ONLY_QUEUE_DEPTH", str(max(1, _WAITING_THREADS // 2))))
+DEGRADED_MAX_NEW_TOKENS = int(os.environ.get("DEGRADED_MAX_NEW_TOKENS", "48"))
+
+def make_chat_scheduler():
+    return BatchScheduler(answer_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="chat-scheduler",
+                          max_queued=CHAT_MAX_QUEUED)
+
+chat_scheduler = make_chat_scheduler()
+
+# /chat/stream decodes each answer on its own thread, outside the batch scheduler: at most
+# STREAM_MAX_ACTIVE streams at once, further ones get 503 with Retry-After. Streams obey the
+# same deadline (generation stops there) and overload modes as /chat
+STREAM_MAX_ACTIVE = int(os.environ.get("STREAM_MAX_ACTIVE", str(BATCH_MAX_SIZE)))
+stream_limit = ConcurrencyLimit(STREAM_MAX_ACTIVE)
+
+def current_load():
+    """Questions competing for the LLM: waiting for a /chat batch or being streamed."""
+    return chat_scheduler.depth() + stream_limit.active()
+
+# /chat/batch: questions per request, and per generate call (bigger batches than /chat, since
+# nobody waits on a single answer). Bulk generate calls run with low priority on the /chat
+# scheduler's worker, so a /chat batch waits for at most one of them
+BULK_MAX_QUESTIONS = int(os.environ.get("BULK_MAX_QUESTIONS", "1000"))
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "16"))
+
+metrics.callback("ready", "1 once every component is loaded and warmed up", lambda: int(startup.is_ready()))
+metrics.callback("queue_depth", "Questions waiting for the batch scheduler", lambda: chat_scheduler.depth())
+metrics.callback("active_streams", "Answers being streamed by /chat/stream", lambda: stream_limit.active())
+metrics.callback("passages", "Passages in the retrieval index", lambda: len(live_index))
+metrics.callback("cache_hits_total", "Questions answered from the answer cache",
+                 lambda: answer_cache.stats()["exact_hits"] + answer_cache.stats()["semantic_hits"], kind="counter")
+metrics.callback("cache_misses_total", "Questions the answer cache could not answer",
+                 lambda: answer_cache.stats()["misses"], kind="counter")
+
+# The index (after the embedding model and tokenizer) and the LLM load concurrently
+startup = Startup()
+startup.add("embeddings", load_embeddings)
+startup.add("tokenizer", load_tokenizer)
+startup.add("index", load_index, after=("embeddings", "tokenizer"))
+startup.add("llm", load_llm)
+if not PRELOAD_FORK:
+    startup.add("warmup", warmup, after=("index", "llm"))
+startup.start()
+
+def start_worker(num_threads):
+    """
+    Called by gunicorn in each worker right after the fork: size its thread pool, restart the
+    threads that did not survive the fork, then warm up before reporting ready.
+    """
+    global TORCH_THREADS, chat_scheduler
+    TORCH_THREADS = configure_threads(num_threads)
+    chat_scheduler = make_chat_scheduler()
+    if live_index is not None:
+        live_index.follow(INDEX_FOLLOW_INTERVAL)
+        if WATCH_INTERVAL > 0 and SYNC_DOCUMENTS:
+            live_index.watch(DOCUMENTS_FOLDER, WATCH_INTERVAL)
+    startup.add("warmup", warmup, after=("index", "llm"))
+    startup.start()
+
+def requires_ready(view):
+    """Answer 503 (with Retry-After) until every component is loaded."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not startup.is_ready():
+            response = jsonify({"error": "Service is starting up", **startup.status()})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Count every request and its latency per endpoint (the whole stream is not included for /chat/stream)."""
+    endpoint = request.endpoint or "unknown"
+    request_seconds.observe(time.perf_counter() - g.get("started", time.perf_counter()), endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 500:
+        errors_total.inc(endpoint=endpoint)
+    return response
+
+def request_deadline():
+    """time.monotonic() by which /chat must answer: REQUEST_TIMEOUT, or the client's shorter X-Request-Timeout."""
+    timeouts = [REQUEST_TIMEOUT] if REQUEST_TIMEOUT > 0 else []
+    try:
+        client_timeout = float(request.headers["X-Request-Timeout"])
+        if client_timeout > 0:
+            timeouts.append(client_timeout)
+    except (KeyError, ValueError):
+        pass
+    return time.monotonic() + min(timeouts) if timeouts else None
+
+def shed(reason, status, message, retry_after=None):
+    """Turn a /chat request away without answering it."""
+    shed_total.inc(reason=reason)
+    response = jsonify({"error": message})
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return response, status
+
+def wants_timings():
+    """Per-request stage breakdown in the JSON response, with ?timings=1."""
+    return request.args.get("timings", "").lower() in ("1", "true", "yes")
+
+@app.route("/health")
+def health():
+    """Liveness: the process is up and serving HTTP, whether or not the models are loaded."""
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/ready")
+def ready():
+    """Readiness: per-component load status, 200 once everything is loaded and warmed up."""
+    status = startup.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 @app.route("/chat", methods=["POST"])
+@requires_ready
 def chat():
     """
     Expects a JSON payload:
     {
       "question": "What documents are required for registration?"
     }
+    The Server-Timing header breaks the answer time down per stage; add ?timings=1 to also
+    get it (in milliseconds) in the response. Stages are timed for the whole batch the question
+    was answered in, and "queue" is the rest: time spent waiting for the batch.
+    Under overload the answer may be shortened or retrieval only ("degraded" says which), or the
+    request refused: 503 with Retry-After when the queue is full, 504 past its deadline.
     """
     data = request.get_json()
     user_query = data.get("question", "")
     if not user_query.strip():
         return jsonify({"error": "Empty question"}), 400
+    deadline = request_deadline()
 
-    # 1) Semantic search to get top docs
-    top_docs = get_top_k_docs(user_query, k=3)
-
-    # 2) Prepare context from top docs (up to 1000 chars each to pass to LLM)
-    combined_context = "\n\n".join([doc["content"][:1000] for doc in top_docs])
-
-    # 3) Generate LLM answer
-    answer = generate_answer(user_query, combined_context)
+    # 1) - 3) Semantic search, context and LLM answer, batched with concurrent requests
+    # (repeated questions are answered straight from the cache)
+    started = time.perf_counter()
+    mode = "full"
+    cached = answer_cache.lookup_exact(user_query, cache_version())
+    if cached is not None:
+        answer, top_docs = cached
+        timings = {"cache": time.perf_counter() - started}
+        stage_seconds.observe(timings["cache"], stage="cache")
+    else:
+        try:
+            result = chat_scheduler.submit((user_query, deadline), deadline)
+        except QueueFull as e:
+            return shed("queue_full", 503, "Server overloaded, retry later", e.retry_after)
+        except DeadlineExceeded:
+            result = None
+        if result is None:
+            return shed("deadline", 504, "Deadline exceeded before the answer was generated")
+        answer, top_docs, timings, mode = result
+        timings = dict(timings)
+        timings["queue"] = max(0.0, time.perf_counter() - started - sum(timings.values()))
+        stage_seconds.observe(timings["queue"], stage="queue")
+    timings["total"] = time.perf_counter() - started
+    stage_seconds.observe(timings["total"], stage="total")
 
     # 4) Prepare text snippets as sources
     sources = [doc["content"][:500] for doc in top_docs]  # Up to 500 chars each
@@ -101,8 +551,206 @@ def chat():
         "answer": answer,
         "sources": sources
     }
+    if mode != "full":
+        response["degraded"] = mode
+    if deadline is None or time.monotonic() <= deadline:
+        goodput_total.inc(mode=mode)
+    if wants_timings():
+        response["timings"] = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+
+    return jsonify(response), 200, {"Server-Timing": format_server_timing(timings)}
+
+def read_bulk_questions():
+    """Questions of a /chat/batch request: a JSON {"questions": [...]} body or NDJSON lines of {"question": ...}."""
+    if request.mimetype in ("application/x-ndjson", "application/jsonl", "application/json-lines"):
+        lines = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        return [json.loads(line).get("question") for line in lines]
+    data = request.get_json(silent=True) or {}
+    questions = data.get("questions")
+    return questions if isinstance(questions, list) else None
+
+@app.route("/chat/batch", methods=["POST"])
+@requires_ready
+def chat_batch():
+    """
+    Answer many questions in one call, for offline evaluation or to pre-fill the answer cache
+    (admin only, like /admin/reindex). Expects a JSON payload
+    {
+      "questions": ["Quelles sont les dates des examens ?", "..."]
+    }
+    or an application/x-ndjson body with one {"question": "..."} per line. Answers stream back
+    as NDJSON, one {"index", "question", "answer", "sources", "cached"} line per question in the
+    order they are ready; add ?cache=0 to generate every answer even if cached.
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        questions = read_bulk_questions()
+    except (ValueError, AttributeError):
+        return jsonify({"error": "Invalid NDJSON line"}), 400
+    if not questions:
+        return jsonify({"error": "No questions"}), 400
+    if len(questions) > BULK_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BULK_MAX_QUESTIONS} questions per request"}), 413
+    use_cache = request.args.get("cache", "1").lower() not in ("0", "false", "no")
+
+    def lines():
+        valid = [i for i, question in enumerate(questions) if isinstance(question, str) and question.strip()]
+        for i in sorted(set(range(len(questions))) - set(valid)):
+            yield json.dumps({"index": i, "error": "Empty question"}) + "\n"
+        try:
+            for j, answer, top_docs, cached in answer_bulk([questions[i] for i in valid], BULK_BATCH_SIZE, use_cache):
+                i = valid[j]
+                yield json.dumps({
+                    "index": i,
+                    "question": questions[i],
+                    "answer": answer,
+                    "sources": [doc["content"][:500] for doc in top_docs],
+                    "cached": cached,
+                }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Error answering batch: {e}")
+            errors_total.inc(endpoint="chat_batch")
+            yield json.dumps({"error": "An error occurred while generating the answers."}) + "\n"
+
+    return Response(lines(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+@requires_ready
+def chat_stream():
+    """
+    Same payload as /chat, but answers as a text/event-stream:
+    a "sources" event first, then one "token" event per decoded piece of text,
+    and a final "done" event with the full answer (or an "error" event).
+    Overload is handled as for /chat: 503 with Retry-After when STREAM_MAX_ACTIVE answers are
+    already streaming, a shortened or retrieval only answer ("degraded" in the "done" event),
+    and an "error" event when the deadline passed before generation started.
+    """
+    data = request.get_json()
+    user_query = data.get("question", "")
+    if not user_query.strip():
+        return jsonify({"error": "Empty question"}), 400
+    timings = wants_timings()
+    deadline = request_deadline()
+
+    cached = answer_cache.lookup_exact(user_query, cache_version())
+    slot = None
+    if cached is None:
+        mode = overload_mode(current_load())
+        try:
+            slot = stream_limit.acquire()
+        except QueueFull as e:
+            return shed("queue_full", 503, "Server overloaded, retry later", e.retry_after)
+
+    def events():
+        timer = StageTimer(stage_seconds)
+        started = time.perf_counter()
+        try:
+            if cached is not None:
+                answer, top_docs = cached
+                yield sse_event("sources", [doc["content"][:500] for doc in top_docs])
+                yield sse_event("token", {"text": answer})
+                yield sse_event("done", {"answer": answer})
+                return
+
+            top_docs = get_top_k_docs(user_query, k=3, timer=timer)
+            yield sse_event("sources", [doc["content"][:500] for doc in top_docs])
+            if deadline is not None and time.monotonic() >= deadline:
+                shed_total.inc(reason="deadline")
+                yield sse_event("error", {"error": "Deadline exceeded before the answer was generated"})
+                return
+
+            if mode == "retrieval_only":
+                pieces = [retrieval_answer(top_docs)]
+                yield sse_event("token", {"text": pieces[0]})
+            else:
+                pieces = []
+                max_new_tokens = DEGRADED_MAX_NEW_TOKENS if mode == "short" else MAX_NEW_TOKENS
+                # Closed explicitly when the client disconnects, so generation stops before the slot is released
+                with contextlib.closing(stream_answer(user_query, top_docs, timer, max_new_tokens, deadline)) as texts:
+                    for text in texts:
+                        pieces.append(text)
+                        yield sse_event("token", {"text": text})
+            timer.add("total", time.perf_counter() - started)
+            done = {"answer": "".join(pieces)}
+            if mode != "full":
+                done["degraded"] = mode
+            if timings:
+                done["timings"] = timer.milliseconds()
+            if deadline is None or time.monotonic() <= deadline:
+                goodput_total.inc(mode=mode)
+            yield sse_event("done", done)
+        except Exception as e:
+            print(f"Error streaming answer: {e}")
+            errors_total.inc(endpoint="chat_stream")
+            yield sse_event("error", {"error": "An error occurred while generating the answer."})
+        finally:
+            if slot is not None:
+                slot.release()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(events(), mimetype="text/event-stream", headers=headers)
+    if slot is not None:
+        # Also frees the slot when the client left before the stream started; otherwise closing
+        # the response closes events() first, which releases it once generation has stopped
+        response.call_on_close(slot.release)
+    return response
+
+@app.route("/stats")
+@requires_ready
+def stats():
+    """Report scheduler queue depth and batch sizes for tuning throughput vs. latency."""
+    return jsonify({
+        "pid": os.getpid(),
+        "passages": len(live_index),
+        "files": live_index.file_count(),
+        "scheduler": chat_scheduler.stats(),
+        "streams": stream_limit.stats(),
+        "cache": answer_cache.stats(),
+        "context": context_packer.stats(),
+        "inference": {"llm": INFERENCE_BACKEND, "embeddings": EMBED_BACKEND, "threads": TORCH_THREADS},
+    }), 200
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text format: stage latency histograms, token and error counters, queue depth."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def is_admin_request():
+    """Allow admin calls carrying ADMIN_TOKEN, or from localhost when no token is configured."""
+    if ADMIN_TOKEN:
+        return request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@app.route("/admin/reindex", methods=["POST"])
+@requires_ready
+def reindex():
+    """
+    Apply changes in DOCUMENTS_FOLDER to the live index without a restart.
+    Optional JSON payload to only refresh some files (missing files are removed):
+    {
+      "files": ["inscription_12_0.json", "examens_40_3.json"]
+    }
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
 
-    return jsonify(response), 200
+    data = request.get_json(silent=True) or {}
+    files = data.get("files")
+    if not files and not SYNC_DOCUMENTS:
+        # A full sync would drop every page the crawler indexed directly
+        return jsonify({"error": "Full reindex disabled (SYNC_DOCUMENTS=0), list the files to refresh"}), 409
+    if files:
+        summary = live_index.refresh_files(DOCUMENTS_FOLDER, [os.path.basename(name) for name in files])
+    else:
+        summary = live_index.sync_folder(DOCUMENTS_FOLDER)
+    summary["passages"] = len(live_index)
+    summary["files"] = live_index.file_count()
+    return jsonify(summary), 200
 
 @app.route("/")
 def home():
@@ -0,0 +1,359 @@
+"""
+Build the bot's index folder offline, for corpora too large to encode at start-up.
+
+    python build_index.py --documents scraped_data/ --index-folder index_artifacts/ --workers 8
+    python build_index.py --documents scraped_data/ --scaling 1,2,4,8 --output build_scaling.json
+
+Three resumable phases, with their state in <index folder>/build/:
+  1. chunk:  stream the documents one file at a time into the passage store, recording each
+             passage's key, hash and length in plan.json;
+  2. encode: order passages by length (so each batch pads to similar lengths), cut them into
+             chunks and encode the chunks on a pool of processes, each with its share of the
+             cores; vectors go straight into the memory-mapped vectors.npy and every finished
+             chunk is checkpointed, so an interrupted build picks up where it stopped;
+  3. index:  train the FAISS index on a sample, add the vectors in slices (and to the vector
+             store), build BM25 and write the manifest. The folder is then what LiveIndex would
+             have saved: the bot loads it without re-encoding anything (same models and INDEX_*
+             settings required).
+Passages already in the folder's vector store (e.g. rebuilding with another INDEX_TYPE) are not
+encoded again.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+from ann_index import index_config_from_env, index_type, make_index, auto_nlist, prepare_vectors
+from corpus_store import CorpusStore
+from index_store import (ARTIFACTS_FOLDER, ENCODE_BATCH_SIZE, MANIFEST_FILE, PASSAGES_FOLDER, VECTORS_FOLDER,
+                         content_hash, _atomic_write, iter_documents, load_manifest, save_index_folder,
+                         source_versions)
+from vector_store import VectorStore
+from index_writer import EMBED_MODEL, embed_backend_from_env, chunker_from_env
+from inference import configure_threads, load_embedder, embedding_model_id
+from lexical_index import BM25Index, tokenize
+
+BUILD_FOLDER = "build"
+PLAN_FILE = "plan.json"
+VECTORS_FILE = "vectors.npy"
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Passages per task handed to a worker (and per checkpoint)
+CHUNK_SIZE = 4096
+# Vectors used to train IVF / PQ indexes, and added to the index at a time
+TRAIN_SAMPLE = 100000
+ADD_SLICE = 65536
+# Longest the workers wait for each other to load the model before timing starts (seconds)
+WORKER_START_TIMEOUT = 600
+
+# Per-process state of an encoding worker (see _init_worker)
+_worker = {}
+
+
+def _write_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    _atomic_write(path, write)
+
+
+def _read_json(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def chunk_documents(documents, passages_folder, chunker):
+    """Phase 1: chunk every document into the passage store. Returns the plan (passages in id order)."""
+    # Stamped before reading, so a file changed meanwhile is read again by the bot's sync_folder
+    sources = source_versions(documents)
+    passages = CorpusStore(passages_folder)
+    keys, hashes, lengths, files = [], [], [], {}
+    try:
+        for file_name, content in iter_documents(documents):
+            files[file_name] = content_hash(content)
+            for key, passage in chunker(file_name, content).items():
+                passages.put(key, passage)
+                keys.append(key)
+                hashes.append(content_hash(passage["content"]))
+                lengths.append(len(passage["content"]))
+            if len(files) % 1000 == 0:
+                print(f"Chunked {len(files)} files into {len(keys)} passages")
+        passages.flush()
+    finally:
+        passages.close()
+    sources = {name: version for name, version in sources.items() if name in files}
+    return {"keys": keys, "hashes": hashes, "lengths": lengths, "files": files, "sources": sources}
+
+
+def plan_chunks(lengths, chunk_size, rows=None):
+    """Split rows (default: all) into chunks of similar lengths, longest first so no worker ends on a big one."""
+    rows = np.arange(len(lengths)) if rows is None else np.asarray(rows)
+    order = rows[np.argsort(-np.asarray(lengths)[rows], kind="stable")]
+    return [order[start:start + chunk_size].tolist() for start in range(0, len(order), chunk_size)]
+
+
+def _init_worker(backend, num_threads, passages_folder, barrier):
+    configure_threads(num_threads)
+    _worker["model"], _ = load_embedder(EMBED_MODEL, backend)
+    _worker["passages"] = CorpusStore(passages_folder)
+    try:
+        barrier.wait(WORKER_START_TIMEOUT)
+    except threading.BrokenBarrierError:
+        # Aborted by encode_chunks once the first workers are up (so a replacement worker
+        # starts at once), or they were too slow: start working anyway
+        pass
+
+
+def _encode_chunk(task):
+    chunk_id, rows, keys, batch_size = task
+    texts = [_worker["passages"].get(key)["content"] for key in keys]
+    vectors = _worker["model"].encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return chunk_id, rows, np.asarray(vectors, dtype="float32")
+
+
+def encode_chunks(chunks, keys, passages_folder, backend, workers, batch_size, on_result):
+    """
+    Encode {chunk id: rows} on a pool of workers, calling on_result(chunk_id, rows, vectors) as
+    each finishes. Returns (start-up seconds, encoding seconds), model loading excluded from the latter.
+    """
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    # Spawned, not forked: PyTorch's thread pools do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers + 1)
+    started = time.perf_counter()
+    with context.Pool(workers, _init_worker, (backend, num_threads, passages_folder, barrier)) as pool:
+        try:
+            barrier.wait(WORKER_START_TIMEOUT)
+        except threading.BrokenBarrierError:
+            print("Not every worker loaded the model in time, encoding time includes start-up")
+        # Workers the pool starts later, to replace one that died, must not wait for a next round
+        barrier.abort()
+        ready = time.perf_counter()
+        tasks = ((chunk_id, rows, [keys[row] for row in rows], batch_size) for chunk_id, rows in chunks.items())
+        for chunk_id, rows, vectors in pool.imap_unordered(_encode_chunk, tasks):
+            on_result(chunk_id, rows, vectors)
+    return ready - started, time.perf_counter() - ready
+
+
+def encode_remaining(args, plan, chunks, done, vectors, checkpoint_path, expected, passages_folder):
+    """
+    Phase 2: encode the chunks not in done into vectors, checkpointing each finished one.
+    Returns (start-up seconds, encoding seconds, passages encoded).
+    """
+    remaining = {chunk_id: rows for chunk_id, rows in chunks.items() if chunk_id not in done}
+    to_encode = sum(len(rows) for rows in remaining.values())
+    print(f"Encoding {to_encode} passages ({len(remaining)} chunks, {len(chunks) - len(remaining)} already done) "
+          f"on {args.workers} workers")
+    if not remaining:
+        return 0.0, 0.0, 0
+
+    def store(chunk_id, rows, chunk_vectors):
+        vectors[rows] = chunk_vectors
+        # Vectors reach the disk before the checkpoint claims them
+        vectors.flush()
+        done.add(chunk_id)
+        _write_json(checkpoint_path, dict(expected, done=sorted(done)))
+        print(f"Encoded {len(done)}/{len(chunks)} chunks")
+
+    startup_seconds, encode_seconds = encode_chunks(remaining, plan["keys"], passages_folder, args.backend,
+                                                    args.workers, args.batch_size, store)
+    return startup_seconds, encode_seconds, to_encode
+
+
+def write_index(folder, vectors, plan, config, model_name, vector_store):
+    """Phase 3: train and fill the FAISS index, build BM25 and save everything as LiveIndex would."""
+    n_vectors, dimension = vectors.shape
+    rng = np.random.default_rng(0)
+    sample = np.sort(rng.choice(n_vectors, min(n_vectors, TRAIN_SAMPLE), replace=False))
+    # Size IVF cells for the whole corpus, not the training sample (LiveIndex trains on everything)
+    build_config = dict(config, nlist=config["nlist"] or auto_nlist(n_vectors))
+    faiss_index = make_index(build_config, dimension, prepare_vectors(vectors[sample], config))
+    for start in range(0, n_vectors, ADD_SLICE):
+        stop = min(start + ADD_SLICE, n_vectors)
+        raw = np.array(vectors[start:stop])
+        hashes = plan["hashes"][start:stop]
+        new = [i for i, passage_hash in enumerate(hashes) if passage_hash not in vector_store]
+        if new:
+            vector_store.add([hashes[i] for i in new], raw[new])
+        faiss_index.add_with_ids(prepare_vectors(raw, config), np.arange(start, stop, dtype="int64"))
+    print(f"Added {n_vectors} vectors to the {config['type']} index")
+
+    lexical = BM25Index()
+    passages = CorpusStore(os.path.join(folder, PASSAGES_FOLDER))
+    try:
+        for doc_id, key in enumerate(plan["keys"]):
+            lexical.add(doc_id, tokenize(passages.get(key)["content"]))
+    finally:
+        passages.close()
+
+    manifest = {
+        "model": model_name,
+        "dimension": dimension,
+        "index": config,
+        "built_type": index_type(faiss_index),
+        "next_id": n_vectors,
+        "docs": {key: {"id": doc_id, "hash": passage_hash}
+                 for doc_id, (key, passage_hash) in enumerate(zip(plan["keys"], plan["hashes"]))},
+        "files": plan["files"],
+        # Per-file source stamps, as LiveIndex saves them, so the bot's first sync_folder skips unchanged files
+        "sources": plan.get("sources", {}),
+    }
+    # Journals of an index this one replaces must not be replayed on top of it
+    for name in os.listdir(folder):
+        if name.startswith("journal-"):
+            os.remove(os.path.join(folder, name))
+    save_index_folder(folder, faiss_index, lexical, manifest)
+
+
+def load_plan(args, build_folder, passages_folder, embed_model, model_name):
+    """Reuse the plan of an interrupted build of the same documents and model, or chunk from scratch."""
+    plan_path = os.path.join(build_folder, PLAN_FILE)
+    plan = _read_json(plan_path)
+    if plan is not None and plan["documents"] == os.path.abspath(args.documents) and plan["model"] == model_name:
+        print(f"Resuming build: {len(plan['keys'])} passages already chunked")
+        return plan, 0.0
+    shutil.rmtree(build_folder, ignore_errors=True)
+    shutil.rmtree(passages_folder, ignore_errors=True)
+    os.makedirs(build_folder)
+
+    started = time.perf_counter()
+    plan = chunk_documents(args.documents, passages_folder, chunker_from_env(embed_model.tokenizer))
+    seconds = time.perf_counter() - started
+    print(f"Chunked {len(plan['files'])} files into {len(plan['keys'])} passages in {seconds:.1f}s")
+    plan.update(documents=os.path.abspath(args.documents), model=model_name,
+                dimension=embed_model.get_sentence_embedding_dimension())
+    _write_json(plan_path, plan)
+    return plan, seconds
+
+
+def build(args, plan, build_folder, passages_folder, model_name):
+    """Phases 2 and 3. Returns the report."""
+    config = index_config_from_env()
+    n_passages = len(plan["keys"])
+    chunks = dict(enumerate(plan_chunks(plan["lengths"], args.chunk_size)))
+    vectors_path = os.path.join(build_folder, VECTORS_FILE)
+    checkpoint_path = os.path.join(build_folder, CHECKPOINT_FILE)
+
+    vector_store = VectorStore(os.path.join(args.index_folder, VECTORS_FOLDER), model_name, plan["dimension"])
+
+    # vectors.npy holds raw embeddings, like the vector store; they are prepared for the metric when indexed
+    checkpoint = _read_json(checkpoint_path)
+    expected = {"chunk_size": args.chunk_size}
+    if checkpoint is not None and os.path.isfile(vectors_path) and \
+            all(checkpoint.get(key) == value for key, value in expected.items()):
+        vectors = np.lib.format.open_memmap(vectors_path, mode="r+")
+        done = set(checkpoint["done"])
+    else:
+        vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype="float32",
+                                            shape=(n_passages, plan["dimension"]))
+        done = set()
+    # Chunks whose passages were all encoded before are copied from the vector store
+    for chunk_id, rows in chunks.items():
+        if chunk_id not in done:
+            stored, missing = vector_store.lookup([plan["hashes"][row] for row in rows])
+            if not missing:
+                vectors[rows] = stored
+                done.add(chunk_id)
+    startup_seconds, encode_seconds, to_encode = encode_remaining(args, plan, chunks, done, vectors, checkpoint_path,
+                                                                  expected, passages_folder)
+
+    started = time.perf_counter()
+    write_index(args.index_folder, vectors, plan, config, model_name, vector_store)
+    index_seconds = time.perf_counter() - started
+    # Unmap vectors.npy before the build folder is removed
+    del vectors
+    if not args.keep_build:
+        shutil.rmtree(build_folder)
+    return {
+        "workers": args.workers,
+        "passages": n_passages,
+        "encoded": to_encode,
+        "startup_seconds": startup_seconds,
+        "encode_seconds": encode_seconds,
+        "docs_per_second": to_encode / encode_seconds if encode_seconds else 0.0,
+        "index_seconds": index_seconds,
+    }
+
+
+def scaling(args, plan, passages_folder):
+    """Encode the same sample with each worker count and report throughput; nothing is written."""
+    n_passages = len(plan["keys"])
+    # Evenly spaced over the corpus so the sample has its mix of passage lengths
+    rows = np.linspace(0, n_passages - 1, min(args.sample, n_passages)).astype("int64")
+    rows = np.unique(rows)
+    chunks = dict(enumerate(plan_chunks(plan["lengths"], args.chunk_size, rows)))
+    results = []
+    for workers in args.scaling:
+        startup_seconds, encode_seconds = encode_chunks(chunks, plan["keys"], passages_folder, args.backend,
+                                                        workers, args.batch_size, lambda *result: None)
+        result = {
+            "workers": workers,
+            "threads_per_worker": max(1, (os.cpu_count() or 1) // workers),
+            "passages": len(rows),
+            "startup_seconds": startup_seconds,
+            "encode_seconds": encode_seconds,
+            "docs_per_second": len(rows) / encode_seconds if encode_seconds else 0.0,
+        }
+        result["speedup"] = result["docs_per_second"] / results[0]["docs_per_second"] if results else 1.0
+        results.append(result)
+        print(f"{workers:>3} workers: {result['docs_per_second']:8.1f} docs/s  "
+              f"(x{result['speedup']:.2f}, start-up {startup_seconds:.1f}s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default=os.environ.get("DOCUMENTS_FOLDER", "scraped_data/"),
+                        help="folder of scraped documents, or a corpus")
+    parser.add_argument("--index-folder", default=os.environ.get("INDEX_FOLDER", ARTIFACTS_FOLDER))
+    parser.add_argument("--backend", default=embed_backend_from_env(), help="embedding backend (as the bot)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("BUILD_WORKERS", os.cpu_count() or 1)),
+                        help="encoding processes; the cores are shared between them")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE, help="passages per encode() batch")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="passages per worker task and checkpoint")
+    parser.add_argument("--overwrite", action="store_true", help="replace an existing index in the folder")
+    parser.add_argument("--keep-build", action="store_true", help="keep plan, vectors.npy and checkpoint afterwards")
+    parser.add_argument("--scaling", type=lambda value: [int(n) for n in value.split(",")],
+                        help="comma-separated worker counts to benchmark instead of building, e.g. 1,2,4,8")
+    parser.add_argument("--sample", type=int, default=20000, help="passages encoded per worker count with --scaling")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    build_folder = os.path.join(args.index_folder, BUILD_FOLDER)
+    passages_folder = os.path.join(args.index_folder, PASSAGES_FOLDER)
+    if os.path.isfile(os.path.join(args.index_folder, MANIFEST_FILE)):
+        if not args.overwrite:
+            model = load_manifest(args.index_folder)["model"]
+            parser.error(f"{args.index_folder} already holds an index ({model}), pass --overwrite to replace it")
+        # Do not leave a manifest pointing at passages that are about to be rewritten
+        os.remove(os.path.join(args.index_folder, MANIFEST_FILE))
+
+    # Only the tokenizer and the model name are needed here, the workers load their own copies
+    embed_model, backend = load_embedder(EMBED_MODEL, args.backend)
+    model_name = embedding_model_id(EMBED_MODEL, backend)
+    plan, chunk_seconds = load_plan(args, build_folder, passages_folder, embed_model, model_name)
+    del embed_model
+    if not plan["keys"]:
+        parser.error(f"No documents found in {args.documents}")
+
+    if args.scaling:
+        report = {"cpu_count": os.cpu_count(), "batch_size": args.batch_size,
+                  "scaling": scaling(args, plan, passages_folder)}
+    else:
+        report = build(args, plan, build_folder, passages_folder, model_name)
+        report["chunk_seconds"] = chunk_seconds
+        print(f"Built index of {report['passages']} passages in {args.index_folder}: "
+              f"{report['docs_per_second']:.1f} docs/s on {report['workers']} workers")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
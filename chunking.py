@@ -0,0 +1,90 @@
+import json
+
+# Passage size in embedding-model tokens (all-MiniLM-L6-v2 reads at most 256)
+PASSAGE_TOKENS = 128
+PASSAGE_OVERLAP = 24
+
+
+def passage_key(file_name, i):
+    """Key of the i-th passage of a scraped file."""
+    return f"{file_name}#{i}"
+
+
+def source_file(key):
+    """File name a passage key was cut from."""
+    return key.rsplit("#", 1)[0]
+
+
+def flatten_table(table):
+    """Turn rows scraped by extract_table_data ({header: cell}) into one line of text per row."""
+    lines = []
+    for row in table:
+        cells = [f"{key}: {value}" if not key.startswith("column_") else value
+                 for key, value in row.items() if value]
+        if cells:
+            lines.append(", ".join(cells))
+    return lines
+
+
+def record_text(record):
+    """Readable text of a scraped record: its paragraphs followed by its table rows."""
+    # Page records list their paragraphs, older per-paragraph records have a single "text"
+    parts = list(record.get("paragraphs", [])) or [record.get("text", "")]
+    for table in record.get("tables", []):
+        parts.extend(flatten_table(table))
+    return "\n".join(part for part in parts if part)
+
+
+def split_passages(text, tokenizer, max_tokens=PASSAGE_TOKENS, overlap=PASSAGE_OVERLAP):
+    """Split text into overlapping windows of at most max_tokens tokens, cut at token boundaries."""
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return [text.strip()] if text.strip() else []
+
+    passages = []
+    step = max(1, max_tokens - overlap)
+    for start in range(0, len(offsets), step):
+        end = min(start + max_tokens, len(offsets))
+        passages.append(text[offsets[start][0]:offsets[end - 1][1]].strip())
+        if end == len(offsets):
+            break
+    return [passage for passage in passages if passage]
+
+
+def passages_from_file(file_name, content, tokenizer, max_tokens=PASSAGE_TOKENS, overlap=PASSAGE_OVERLAP):
+    """
+    Parse a file written by scrap.py and return {passage key: passage} for it.
+    Each passage keeps the record's topic, path and file links; files that are not
+    scraped JSON records are split as plain text.
+    """
+    try:
+        record = json.loads(content)
+    except ValueError:
+        record = None
+    if not isinstance(record, dict):
+        record = {"text": content}
+
+    passages = {}
+    for i, text in enumerate(split_passages(record_text(record), tokenizer, max_tokens, overlap)):
+        passages[passage_key(file_name, i)] = {
+            "content": text,
+            "url": record.get("url", ""),
+            "topic": record.get("topic", ""),
+            "path": record.get("path", ""),
+            "files": record.get("files", []),
+        }
+    return passages
+
+
+def make_chunker(embed_tokenizer, context_packer, max_tokens=PASSAGE_TOKENS, overlap=PASSAGE_OVERLAP):
+    """
+    The bot's chunker for LiveIndex: passages of a scraped record (see passages_from_file) with
+    their LLM token IDs from context_packer, so prompts are packed without tokenizing again.
+    """
+    def chunk_file(file_name, content):
+        passages = passages_from_file(file_name, content, embed_tokenizer, max_tokens, overlap)
+        token_ids = context_packer.tokenize_passages([passage["content"] for passage in passages.values()])
+        for passage, ids in zip(passages.values(), token_ids):
+            passage["token_ids"] = ids
+        return passages
+    return chunk_file
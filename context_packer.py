@@ -0,0 +1,103 @@
+import threading
+
+# Instruction template around the question and the retrieved context
+PROMPT_HEAD = (
+    "You are an assistant for IHEC Carthage, a university in Tunisia. "
+    "Answer the following question based on the provided context and ensure the response is relevant to IHEC Carthage:\n\n"
+    "Question: "
+)
+PROMPT_CONTEXT = "\n\nContext: "
+PROMPT_TAIL = "\n\nAnswer:"
+PASSAGE_SEPARATOR = "\n\n"
+
+
+class ContextPacker:
+    """
+    Assemble generation inputs directly from token IDs.
+
+    Passages are tokenized once at ingest time (see tokenize_passages); per request only the
+    question is tokenized, and passages are packed in rank order until the encoder budget
+    (max_input_tokens minus the instructions and question) is used up. The last passage that
+    does not fit is cut to the remaining budget if at least min_passage_tokens are left.
+    """
+
+    def __init__(self, tokenizer, max_input_tokens=512, max_question_tokens=64, min_passage_tokens=32):
+        self.tokenizer = tokenizer
+        self.max_input_tokens = max_input_tokens
+        self.max_question_tokens = max_question_tokens
+        self.min_passage_tokens = min_passage_tokens
+        self.head_ids = self._ids(PROMPT_HEAD)
+        self.context_ids = self._ids(PROMPT_CONTEXT)
+        self.separator_ids = self._ids(PASSAGE_SEPARATOR)
+        self.tail_ids = self._ids(PROMPT_TAIL)
+        self.eos_ids = [tokenizer.eos_token_id] if tokenizer.eos_token_id is not None else []
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._input_tokens = 0
+        self._passages = 0
+        self._truncated = 0
+        self._dropped = 0
+
+    def _ids(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def tokenize_passages(self, texts):
+        """Token IDs for each passage text, computed once when passages are indexed."""
+        if not texts:
+            return []
+        return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+
+    def pack(self, query, top_docs):
+        """Return the encoder input IDs for query with as many of top_docs as fit the budget."""
+        question_ids = self._ids(query)[:self.max_question_tokens]
+        fixed = len(self.head_ids) + len(question_ids) + len(self.context_ids) + len(self.tail_ids) + len(self.eos_ids)
+        budget = self.max_input_tokens - fixed
+
+        context = []
+        packed = truncated = 0
+        for doc in top_docs:
+            passage_ids = doc.get("token_ids")
+            if passage_ids is None:
+                passage_ids = self._ids(doc["content"])
+            needed = len(passage_ids) + (len(self.separator_ids) if context else 0)
+            if needed <= budget:
+                if context:
+                    context.extend(self.separator_ids)
+                context.extend(passage_ids)
+                budget -= needed
+                packed += 1
+                continue
+            # Cut the first passage that does not fit, then stop
+            room = budget - (len(self.separator_ids) if context else 0)
+            if room >= self.min_passage_tokens:
+                if context:
+                    context.extend(self.separator_ids)
+                context.extend(passage_ids[:room])
+                packed += 1
+                truncated = 1
+            break
+
+        input_ids = self.head_ids + question_ids + self.context_ids + context + self.tail_ids + self.eos_ids
+        with self._stats_lock:
+            self._requests += 1
+            self._input_tokens += len(input_ids)
+            self._passages += packed
+            self._truncated += truncated
+            self._dropped += len(top_docs) - packed
+        return input_ids
+
+    def pad(self, input_ids):
+        """Pad packed inputs into tensors for gen_model.generate."""
+        return self.tokenizer.pad({"input_ids": input_ids}, return_tensors="pt")
+
+    def stats(self):
+        """Average encoder input length and how many passages were packed, cut or dropped."""
+        with self._stats_lock:
+            return {
+                "requests": self._requests,
+                "mean_input_tokens": self._input_tokens / self._requests if self._requests else 0.0,
+                "max_input_tokens": self.max_input_tokens,
+                "passages_packed": self._passages,
+                "passages_truncated": self._truncated,
+                "passages_dropped": self._dropped,
+            }
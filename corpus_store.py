@@ -0,0 +1,291 @@
+"""
+Compact corpus format: append-only JSONL shards with a binary offset index.
+
+Each shard is three files written side by side:
+    shard-00000.jsonl   one compact JSON record per line
+    shard-00000.idx     12 bytes per row: byte offset (uint64) and length (uint32) of the line,
+                        length 0 marks the key as deleted
+    shard-00000.keys    the key of each row, one per line
+
+Readers memory-map the .jsonl files and only decode the records they are asked for.
+A later row for the same key replaces the earlier one; compact rewrites only live rows.
+
+    python corpus_store.py convert scraped_data/ corpus/   # from the one-file-per-page layout
+    python corpus_store.py compact corpus/
+"""
+import os
+import json
+import mmap
+import struct
+import argparse
+import threading
+
+# Start a new shard once the current one reaches this size
+SHARD_BYTES = 64 * 2 ** 20
+
+MARKER_FILE = "corpus.json"
+_ENTRY = struct.Struct("<QI")
+
+
+def is_corpus(folder):
+    """True if folder holds a corpus written by CorpusStore."""
+    return os.path.isfile(os.path.join(folder, MARKER_FILE))
+
+
+class CorpusStore:
+    """
+    Key -> JSON record store on append-only shards. Only the catalog (key -> shard, offset,
+    length) lives in memory; record text is read from memory-mapped shards on demand.
+
+    Appended rows become visible to other processes once flushed (every flush_every rows, or
+    by calling flush()); a store opened by a reader picks them up with refresh().
+    Thread-safe within a process; only one process should write to a folder at a time.
+    """
+
+    def __init__(self, folder, shard_bytes=SHARD_BYTES, flush_every=None):
+        self.folder = folder
+        self.shard_bytes = shard_bytes
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._catalog = {}  # key -> (shard, offset, length)
+        self._rows = {}  # shard -> rows loaded from its index
+        self._keys_pos = {}  # shard -> bytes of its .keys file consumed
+        self._maps = {}  # shard -> mmap of its .jsonl file
+        self._writer = None  # [shard, jsonl, idx, keys files, next offset] once something is written
+        self._pending = []  # (index entry, key line) of rows whose lines may not be on disk yet
+        if not is_corpus(folder):
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, MARKER_FILE), "w", encoding="utf-8") as f:
+                json.dump({"format": 1}, f)
+        self.refresh()
+
+    def _path(self, shard, ext):
+        return os.path.join(self.folder, f"shard-{shard:05d}.{ext}")
+
+    def _shards(self):
+        shards = []
+        for name in os.listdir(self.folder):
+            if name.startswith("shard-") and name.endswith(".idx"):
+                shards.append(int(name[len("shard-"):-len(".idx")]))
+        return sorted(shards)
+
+    def refresh(self):
+        """
+        Load index rows appended since the last call. Returns the keys that were added,
+        replaced or deleted.
+        """
+        changed = set()
+        with self._lock:
+            for shard in self._shards():
+                rows = self._rows.get(shard, 0)
+                with open(self._path(shard, "idx"), "rb") as f:
+                    f.seek(rows * _ENTRY.size)
+                    index_data = f.read()
+                with open(self._path(shard, "keys"), "rb") as f:
+                    f.seek(self._keys_pos.get(shard, 0))
+                    keys_data = f.read()
+                # Only use rows whose index entry and key line are both complete
+                keys_data = keys_data[:keys_data.rfind(b"\n") + 1]
+                keys = keys_data.decode("utf-8").split("\n")[:-1]
+                count = min(len(index_data) // _ENTRY.size, len(keys))
+                consumed = 0
+                for row in range(count):
+                    offset, length = _ENTRY.unpack_from(index_data, row * _ENTRY.size)
+                    key = keys[row]
+                    if length:
+                        self._catalog[key] = (shard, offset, length)
+                    else:
+                        self._catalog.pop(key, None)
+                    changed.add(key)
+                    consumed += len(key.encode("utf-8")) + 1
+                self._rows[shard] = rows + count
+                self._keys_pos[shard] = self._keys_pos.get(shard, 0) + consumed
+        return changed
+
+    def _open_writer(self):
+        shards = self._shards()
+        shard = shards[-1] if shards else 0
+        jsonl = open(self._path(shard, "jsonl"), "ab")
+        if jsonl.tell() >= self.shard_bytes:
+            jsonl.close()
+            shard += 1
+            jsonl = open(self._path(shard, "jsonl"), "ab")
+        self._writer = [shard, jsonl, open(self._path(shard, "idx"), "ab"), open(self._path(shard, "keys"), "ab"), jsonl.tell()]
+
+    def _append(self, key, data):
+        if "\n" in key:
+            raise ValueError(f"Corpus keys cannot contain newlines: {key!r}")
+        if self._writer is None:
+            self._open_writer()
+        if self._writer[4] and self._writer[4] + len(data) > self.shard_bytes:
+            self.flush()
+            for handle in self._writer[1:4]:
+                handle.close()
+            shard = self._writer[0] + 1
+            self._writer = [shard, open(self._path(shard, "jsonl"), "ab"), open(self._path(shard, "idx"), "ab"),
+                            open(self._path(shard, "keys"), "ab"), 0]
+        shard, jsonl, idx, keys, offset = self._writer
+        jsonl.write(data)
+        self._pending.append((_ENTRY.pack(offset, len(data)), key.encode("utf-8") + b"\n"))
+        self._writer[4] = offset + len(data)
+        self._rows[shard] = self._rows.get(shard, 0) + 1
+        self._keys_pos[shard] = self._keys_pos.get(shard, 0) + len(key.encode("utf-8")) + 1
+        if self.flush_every and len(self._pending) >= self.flush_every:
+            self.flush()
+        return shard, offset
+
+    def put(self, key, record):
+        """Append record (a dict, or a JSON string) under key, replacing any earlier version."""
+        if not isinstance(record, str):
+            record = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        data = record.encode("utf-8") + b"\n"
+        with self._lock:
+            shard, offset = self._append(key, data)
+            self._catalog[key] = (shard, offset, len(data))
+
+    def delete(self, key):
+        """Mark key as deleted."""
+        with self._lock:
+            if key in self._catalog:
+                self._append(key, b"")
+                del self._catalog[key]
+
+    def flush(self):
+        """Make appended rows visible to readers: lines are written out before their index entries."""
+        with self._lock:
+            if self._writer is None:
+                return
+            shard, jsonl, idx, keys, offset = self._writer
+            jsonl.flush()
+            idx.write(b"".join(entry for entry, _ in self._pending))
+            keys.write(b"".join(key for _, key in self._pending))
+            idx.flush()
+            keys.flush()
+            self._pending = []
+
+    def _map(self, shard, end):
+        mapped = self._maps.get(shard)
+        if mapped is None or len(mapped) < end:
+            self.flush()
+            if mapped is not None:
+                mapped.close()
+            with open(self._path(shard, "jsonl"), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = mapped
+        return mapped
+
+    def get_raw(self, key):
+        """Return the JSON text stored under key, or None."""
+        with self._lock:
+            location = self._catalog.get(key)
+            if location is None:
+                return None
+            shard, offset, length = location
+            return self._map(shard, offset + length)[offset:offset + length].decode("utf-8")
+
+    def get(self, key):
+        """Return the record stored under key, or None."""
+        raw = self.get_raw(key)
+        return None if raw is None else json.loads(raw)
+
+    def read(self, keys=None):
+        """Return {key: JSON text} for the given keys (or all of them) that exist."""
+        with self._lock:
+            keys = sorted(self._catalog) if keys is None else keys
+            records = {}
+            for key in keys:
+                raw = self.get_raw(key)
+                if raw is not None:
+                    records[key] = raw
+            return records
+
+    def locations(self):
+        """Snapshot of key -> (shard, offset): a key's location changes whenever it is rewritten."""
+        with self._lock:
+            return {key: location[:2] for key, location in self._catalog.items()}
+
+    def keys(self):
+        with self._lock:
+            return list(self._catalog)
+
+    def __len__(self):
+        return len(self._catalog)
+
+    def __contains__(self, key):
+        return key in self._catalog
+
+    def close_writer(self):
+        """Flush and close the files being appended to; the next write reopens them at their end."""
+        with self._lock:
+            self.flush()
+            if self._writer is not None:
+                for handle in self._writer[1:4]:
+                    handle.close()
+                self._writer = None
+
+    def close(self):
+        with self._lock:
+            self.close_writer()
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+
+
+def convert(documents_folder, corpus_folder):
+    """Copy every JSON file of the one-file-per-record layout into a corpus, keyed by file name."""
+    store = CorpusStore(corpus_folder)
+    count = 0
+    for file_name in sorted(os.listdir(documents_folder)):
+        file_path = os.path.join(documents_folder, file_name)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        try:
+            record = json.loads(content)
+        except ValueError:
+            record = {"text": content}
+        store.put(file_name, record)
+        count += 1
+    store.close()
+    print(f"Converted {count} files from {documents_folder} into {corpus_folder}")
+
+
+def compact(corpus_folder):
+    """Rewrite a corpus keeping only the latest version of each live key."""
+    source = CorpusStore(corpus_folder)
+    compacted_folder = corpus_folder.rstrip("/\\") + ".compact"
+    target = CorpusStore(compacted_folder)
+    for key in source.keys():
+        target.put(key, source.get_raw(key))
+    before = sum(os.path.getsize(source._path(shard, "jsonl")) for shard in source._shards())
+    source.close()
+    target.close()
+    for name in os.listdir(corpus_folder):
+        os.remove(os.path.join(corpus_folder, name))
+    for name in os.listdir(compacted_folder):
+        os.replace(os.path.join(compacted_folder, name), os.path.join(corpus_folder, name))
+    os.rmdir(compacted_folder)
+    after = sum(os.path.getsize(os.path.join(corpus_folder, name))
+                for name in os.listdir(corpus_folder) if name.endswith(".jsonl"))
+    print(f"Compacted {corpus_folder}: {before / 2 ** 20:.1f} MB -> {after / 2 ** 20:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="convert a folder of JSON files into a corpus")
+    convert_parser.add_argument("documents", help="folder of JSON files, e.g. scraped_data/")
+    convert_parser.add_argument("corpus", help="corpus folder to write, e.g. corpus/")
+    compact_parser = commands.add_parser("compact", help="drop replaced and deleted rows")
+    compact_parser.add_argument("corpus")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.documents, args.corpus)
+    else:
+        compact(args.corpus)
+
+
+if __name__ == "__main__":
+    main()
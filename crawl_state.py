@@ -0,0 +1,162 @@
+import json
+import time
+import sqlite3
+import hashlib
+
+# SQLite file holding per-URL validators, content hashes and the crawl frontier
+STATE_DB = "crawl_state.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    file_name TEXT,
+    links TEXT NOT NULL DEFAULT '[]',
+    first_seen_run INTEGER NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    changed_run INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_seen ON pages (last_seen_run);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    topic TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+"""
+
+
+def body_hash(text):
+    """Hash of a fetched page body, used to skip pages whose content did not change."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """
+    Persistent crawl state, so re-crawls only process what changed and interrupted crawls resume.
+
+    Each crawl is a run. Pages remember their ETag / Last-Modified (sent back as conditional
+    headers), a hash of their body, the file they were saved to and their internal links, so a
+    304 or unchanged page can be skipped while its links are still followed. The frontier is
+    saved as it grows; an unfinished run is resumed from it. Pages not seen by a finished run
+    are reported as removed. Only use it from one thread (the crawler's event loop).
+    """
+
+    def __init__(self, db_path=STATE_DB):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.run_id = None
+
+    def start_run(self, resume=True):
+        """
+        Start a run, or continue the last unfinished one when resume is True.
+        Returns (frontier, visited): the (url, topic, path) tuples still to crawl and the URLs
+        already handled or queued in this run.
+        """
+        row = self.conn.execute("SELECT id FROM runs WHERE finished IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None and resume:
+            self.run_id = row[0]
+            frontier = self.conn.execute("SELECT url, topic, path FROM frontier").fetchall()
+            seen = self.conn.execute("SELECT url FROM pages WHERE last_seen_run = ?", (self.run_id,)).fetchall()
+            print(f"Resuming crawl run {self.run_id}: {len(frontier)} queued, {len(seen)} already crawled")
+            return [tuple(link) for link in frontier], {url for (url,) in seen} | {link[0] for link in frontier}
+
+        with self.conn:
+            # An abandoned run is closed without reporting removals, since it never saw the whole site
+            self.conn.execute("UPDATE runs SET finished = ? WHERE finished IS NULL", (time.time(),))
+            self.conn.execute("DELETE FROM frontier")
+            self.run_id = self.conn.execute("INSERT INTO runs (started) VALUES (?)", (time.time(),)).lastrowid
+        return [], set()
+
+    def enqueue(self, links):
+        """Save newly discovered (url, topic, path) links to the frontier."""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO frontier (url, topic, path) VALUES (?, ?, ?)", links)
+
+    def dequeue(self, url):
+        """Drop a URL from the saved frontier once it has been handled."""
+        with self.conn:
+            self.conn.execute("DELETE FROM frontier WHERE url = ?", (url,))
+
+    def get_page(self, url):
+        """Return what is known about url as a dict, or None."""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash, file_name, links FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "content_hash": row[2],
+            "file_name": row[3],
+            "links": [tuple(link) for link in json.loads(row[4])],
+        }
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for a page fetched before."""
+        page = self.get_page(url)
+        headers = {}
+        if page is not None:
+            if page["etag"]:
+                headers["If-None-Match"] = page["etag"]
+            if page["last_modified"]:
+                headers["If-Modified-Since"] = page["last_modified"]
+        return headers
+
+    def touch(self, url):
+        """Mark a known page as seen in this run without changing it (304, same hash or fetch error)."""
+        with self.conn:
+            self.conn.execute("UPDATE pages SET last_seen_run = ? WHERE url = ?", (self.run_id, url))
+
+    def invalidate(self, urls):
+        """Forget the validators and body hash of pages, so the next fetch parses them again even if unchanged."""
+        with self.conn:
+            self.conn.executemany("UPDATE pages SET etag = NULL, last_modified = NULL, content_hash = NULL WHERE url = ?",
+                                  [(url,) for url in urls])
+
+    def record(self, url, etag, last_modified, content_hash, file_name, links):
+        """Store a page that was fetched and saved in this run."""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO pages (url, etag, last_modified, content_hash, file_name, links,
+                                   first_seen_run, last_seen_run, changed_run)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = excluded.etag, last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash, file_name = excluded.file_name,
+                    links = excluded.links, last_seen_run = excluded.last_seen_run,
+                    changed_run = excluded.changed_run
+                """,
+                (url, etag, last_modified, content_hash, file_name, json.dumps(links),
+                 self.run_id, self.run_id, self.run_id),
+            )
+
+    def finish_run(self):
+        """
+        Close the run and return its change-set: pages added or updated in this run, and
+        pages from earlier runs that were not seen again (which are forgotten).
+        """
+        def pages(query):
+            return [{"url": url, "file": file_name} for url, file_name in self.conn.execute(query, (self.run_id,))]
+
+        added = pages("SELECT url, file_name FROM pages WHERE first_seen_run = ?")
+        updated = pages("SELECT url, file_name FROM pages WHERE changed_run = ? AND first_seen_run < changed_run")
+        removed = pages("SELECT url, file_name FROM pages WHERE last_seen_run < ?")
+        with self.conn:
+            self.conn.execute("DELETE FROM pages WHERE last_seen_run < ?", (self.run_id,))
+            self.conn.execute("DELETE FROM frontier")
+            self.conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run_id))
+        return {"run": self.run_id, "added": added, "updated": updated, "removed": removed}
+
+    def close(self):
+        self.conn.close()
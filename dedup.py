@@ -0,0 +1,314 @@
+"""
+Drop repeated paragraphs (footers, navigation, cookie banners) from scraped pages.
+
+Exact copies are caught by hashing the normalized text, near copies by MinHash signatures
+looked up through an LSH index. The first page a paragraph appears on keeps it; every other
+page only adds its path to the canonical copy's list of sources, which is persisted with the
+canonical copy: by the crawler on its MongoDB paragraph document (see scrap.py), by the batch
+pass below in the keeping page's "paragraph_sources" ({paragraph position: [paths]}).
+A page's record lists the canonical copies of what it dropped in "duplicate_of". When the
+keeping page loses the paragraph (re-crawled without it, or removed), the paragraph is free
+again and the pages that dropped it are reported by take_released(), to be parsed again.
+
+Batch pass over an existing crawl (report only, add --apply to rewrite the files):
+
+    python dedup.py scraped_data/ --report dedup_report.json --apply
+"""
+import os
+import re
+import json
+import zlib
+import hashlib
+import argparse
+import threading
+import unicodedata
+import numpy as np
+
+# Paragraphs at least this similar (estimated Jaccard on word shingles) count as duplicates
+THRESHOLD = 0.8
+
+# Mersenne prime for the MinHash permutations; a * hash + b stays below 2**64
+_PRIME = (1 << 31) - 1
+
+
+def normalize_text(text):
+    """Lowercase, strip accents and punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class Deduplicator:
+    """
+    Decide, paragraph by paragraph, whether text was already seen on another page.
+
+    num_perm MinHash values are split into `bands` LSH bands; paragraphs sharing a band are
+    candidates, and a candidate is a duplicate when the signatures agree on at least
+    `threshold` of their values. Thread-safe. on_duplicate(owner, text, source), if set, is
+    called for every dropped paragraph with the owner and text of the copy that was kept.
+    Owners are page URLs: filter_record() called again for a page releases the paragraphs its
+    new version no longer has.
+    """
+
+    def __init__(self, threshold=THRESHOLD, num_perm=128, bands=16, shingle_size=5, seed=1, on_duplicate=None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.on_duplicate = on_duplicate
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._exact = {}  # normalized text hash -> paragraph id
+        self._buckets = {}  # (band, band values) -> paragraph ids
+        self._signatures = []  # paragraph id -> MinHash signature
+        self._texts = []  # paragraph id -> text
+        self._keys = []  # paragraph id -> hash of its normalized text
+        self._owners = []  # paragraph id -> URL of the page keeping it, None once released
+        self._sources = []  # paragraph id -> paths of the pages it was dropped from
+        self._droppers = []  # paragraph id -> URLs of the pages it was dropped from
+        self._owned = {}  # owner -> ids of the paragraphs it keeps
+        self._released = []  # URLs of pages that dropped a paragraph kept nowhere any more
+        self.kept = 0
+        self.dropped_exact = 0
+        self.dropped_near = 0
+
+    def signature(self, normalized):
+        """MinHash signature of the word shingles of normalized text."""
+        words = normalized.split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def check(self, text, owner, source):
+        """
+        Return True if text should be kept for the page at URL owner, False if it duplicates a
+        paragraph kept by another page (source, the page's path, is then added to that paragraph).
+        """
+        return self._check(text, owner, source)[0]
+
+    def _check(self, text, owner, source):
+        """check(), also returning the ID of the paragraph kept or duplicated."""
+        normalized = normalize_text(text)
+        key = hashlib.sha1(normalized.encode("utf-8")).digest()
+        signature = self.signature(normalized)
+        band_keys = self._band_keys(signature)
+
+        with self._lock:
+            paragraph = self._exact.get(key)
+            if paragraph is not None:
+                if self._owners[paragraph] == owner:
+                    return True, paragraph
+                if self._owners[paragraph] is None:
+                    # Released by the page that kept it: this page keeps it now
+                    self._owners[paragraph] = owner
+                    self._texts[paragraph] = text
+                    self._owned.setdefault(owner, set()).add(paragraph)
+                    self.kept += 1
+                    return True, paragraph
+                self.dropped_exact += 1
+            else:
+                paragraph = self._near_duplicate(signature, band_keys, owner)
+                if paragraph is None:
+                    paragraph = len(self._texts)
+                    self._exact[key] = paragraph
+                    for band_key in band_keys:
+                        self._buckets.setdefault(band_key, []).append(paragraph)
+                    self._signatures.append(signature)
+                    self._texts.append(text)
+                    self._keys.append(key)
+                    self._owners.append(owner)
+                    self._sources.append([])
+                    self._droppers.append([])
+                    self._owned.setdefault(owner, set()).add(paragraph)
+                    self.kept += 1
+                    return True, paragraph
+                self.dropped_near += 1
+            self._sources[paragraph].append(source)
+            self._droppers[paragraph].append(owner)
+            kept = (self._owners[paragraph], self._texts[paragraph])
+        # Outside the lock, the callback may write to a queue
+        if self.on_duplicate is not None:
+            self.on_duplicate(*kept, source)
+        return False, paragraph
+
+    def _near_duplicate(self, signature, band_keys, owner):
+        """ID of a paragraph kept by another page that signature nearly matches, or None; call with the lock held."""
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(self._buckets.get(band_key, ()))
+        for paragraph in candidates:
+            if self._owners[paragraph] in (owner, None):
+                continue
+            if np.mean(self._signatures[paragraph] == signature) >= self.threshold:
+                return paragraph
+        return None
+
+    def filter_record(self, record):
+        """
+        Drop the paragraphs of a page record that other pages already keep, listing their kept
+        copies in "duplicate_of", and release those the page kept before but no longer has.
+        Returns the record.
+        """
+        owner = record.get("url") or record.get("path", "")
+        paragraphs, kept, copies = [], set(), []
+        for text in record["paragraphs"]:
+            keep, paragraph = self._check(text, owner, record.get("path", ""))
+            if keep:
+                paragraphs.append(text)
+                kept.add(paragraph)
+            else:
+                copies.append(self._keys[paragraph].hex())
+        self.release(owner, kept)
+        record["paragraphs"] = paragraphs
+        if copies:
+            record["duplicate_of"] = copies
+        else:
+            record.pop("duplicate_of", None)
+        return record
+
+    def release(self, owner, keep=()):
+        """
+        Give up the paragraphs owner keeps, except the IDs in keep (all of them once its page is
+        gone): the next page with the text keeps it. The pages that dropped them are queued for
+        take_released(), since their saved records lack the text.
+        """
+        with self._lock:
+            owned = self._owned.pop(owner, set())
+            if owned & set(keep):
+                self._owned[owner] = owned & set(keep)
+            for paragraph in owned - set(keep):
+                self._owners[paragraph] = None
+                self._released.extend(self._droppers[paragraph])
+                self._droppers[paragraph] = []
+                self._sources[paragraph] = []
+
+    def add_copies(self, owner, source, copies):
+        """
+        Register the paragraphs a page saved by an earlier crawl dropped (its "duplicate_of"),
+        once the pages keeping them are registered. A copy kept nowhere any more queues the page
+        for take_released().
+        """
+        with self._lock:
+            for copy in copies:
+                paragraph = self._exact.get(bytes.fromhex(copy))
+                if paragraph is None or self._owners[paragraph] is None:
+                    self._released.append(owner)
+                elif owner not in self._droppers[paragraph]:
+                    self._sources[paragraph].append(source)
+                    self._droppers[paragraph].append(owner)
+
+    def take_released(self):
+        """URLs of the pages that dropped a paragraph no page keeps any more, since the last call."""
+        with self._lock:
+            released = sorted(set(self._released))
+            self._released = []
+            return released
+
+    def reset_counts(self):
+        """Zero the counters, e.g. after registering the paragraphs of a previous crawl."""
+        with self._lock:
+            self.kept = self.dropped_exact = self.dropped_near = 0
+
+    def kept_sources(self):
+        """{owner: {kept paragraph text: paths of the pages it was dropped from}}, for paragraphs with copies."""
+        with self._lock:
+            sources = {}
+            for paragraph, paths in enumerate(self._sources):
+                if paths:
+                    sources.setdefault(self._owners[paragraph], {})[self._texts[paragraph]] = list(paths)
+            return sources
+
+    def report(self, top=50):
+        """How much was dropped, and the most repeated paragraphs with the pages they were dropped from."""
+        with self._lock:
+            total = self.kept + self.dropped_exact + self.dropped_near
+            repeated = sorted(range(len(self._texts)), key=lambda i: len(self._sources[i]), reverse=True)
+            return {
+                "paragraphs": total,
+                "kept": self.kept,
+                "dropped_exact": self.dropped_exact,
+                "dropped_near": self.dropped_near,
+                "dropped_ratio": (self.dropped_exact + self.dropped_near) / total if total else 0.0,
+                "most_repeated": [
+                    {"text": self._texts[i][:200], "kept_on": self._owners[i], "copies": len(self._sources[i]),
+                     "sources": self._sources[i]}
+                    for i in repeated[:top] if self._sources[i]
+                ],
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", default="scraped_data/", help="folder of scraped JSON records")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="near-duplicate Jaccard threshold")
+    parser.add_argument("--report", default="dedup_report.json", help="where to write the report")
+    parser.add_argument("--apply", action="store_true", help="rewrite page files and delete duplicate records")
+    args = parser.parse_args()
+
+    deduplicator = Deduplicator(args.threshold)
+    rewritten = deleted = 0
+    kept_in = {}  # owner -> file keeping its paragraphs
+    for file_name in sorted(os.listdir(args.folder)):
+        file_path = os.path.join(args.folder, file_name)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            try:
+                record = json.load(f)
+            except ValueError:
+                continue
+        if not isinstance(record, dict):
+            continue
+
+        if "paragraphs" in record:
+            before = len(record["paragraphs"])
+            deduplicator.filter_record(record)
+            kept_in[record.get("url") or record.get("path", "")] = file_path
+            changed = len(record["paragraphs"]) != before
+            empty = not record["paragraphs"] and not record.get("tables")
+        else:
+            # Older crawls wrote one file per paragraph
+            changed = empty = not deduplicator.check(record.get("text", ""), record.get("path", ""), file_name)
+
+        if args.apply and empty:
+            os.remove(file_path)
+            deleted += 1
+        elif args.apply and changed:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=4, ensure_ascii=False)
+            rewritten += 1
+
+    if args.apply:
+        # Second pass: the sources of each kept paragraph go on the page keeping it
+        for owner, sources in deduplicator.kept_sources().items():
+            file_path = kept_in.get(owner)
+            if file_path is None or not os.path.isfile(file_path):
+                continue
+            with open(file_path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            record["paragraph_sources"] = {str(position): sources[text]
+                                           for position, text in enumerate(record["paragraphs"]) if text in sources}
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=4, ensure_ascii=False)
+
+    report = deduplicator.report()
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"{report['paragraphs']} paragraphs: {report['kept']} kept, {report['dropped_exact']} exact and "
+          f"{report['dropped_near']} near duplicates dropped ({100 * report['dropped_ratio']:.1f}%)")
+    if args.apply:
+        print(f"Rewrote {rewritten} files, deleted {deleted}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Production serving with several worker processes:
+
+    gunicorn -c gunicorn.conf.py bot01:app
+
+The app is imported once in the master (preload_app), which loads both models and the index
+before forking. Workers share those pages copy-on-write, so memory grows with the per-worker
+state (activations, answer cache, request buffers) rather than with the model weights. What is
+not shared that way is memory-mapped: the FAISS index (when FAISS can map it, see index_store.read_index)
+and the passage text in the corpus store, so every worker reads the same page cache.
+
+Each worker gets cores // workers PyTorch threads so the workers together do not oversubscribe
+the CPU. With INFERENCE_BACKEND=onnx the ONNX Runtime sessions are created in the master and
+stay single-threaded in the workers: use one worker per core instead.
+
+Measure the memory actually used per worker (PSS counts shared pages once across processes):
+
+    python worker_memory.py            # finds the gunicorn master
+    python worker_memory.py --pid 1234
+"""
+import os
+import gc
+
+os.environ["PRELOAD_FORK"] = "1"
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+preload_app = True
+workers = int(os.environ.get("WEB_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // 2)
+# Request threads per worker: generation itself runs on the worker's batch scheduler thread,
+# these only wait on it (and keep /chat/stream connections open). bot01 sizes its /chat queue
+# limit and degradation thresholds from WEB_THREADS, so there must be more threads than a batch
+# for overload to be shed (503) or degraded by the app rather than queued by gunicorn
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "64"))
+os.environ["WEB_THREADS"] = str(threads)
+# Loading the models in the master can take minutes on first run (downloads, index build)
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+
+# PyTorch intra-op threads per worker
+worker_threads = int(os.environ.get("TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+
+
+def when_ready(server):
+    """Wait for the models and index before forking, then freeze them out of the garbage collector."""
+    import bot01
+    if not bot01.startup.wait():
+        server.log.error(f"Startup failed, workers will answer 503: {bot01.startup.status()}")
+    # A collection touches the header of every object it scans, which would copy the shared
+    # pages into each worker; frozen objects are skipped
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import bot01
+    bot01.start_worker(worker_threads)
+    server.log.info(f"Worker {worker.pid} using {worker_threads} PyTorch threads")
@@ -0,0 +1,840 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+import numpy as np
+import faiss
+from ann_index import (index_config, index_type, make_index, needs_training, prepare_vectors, set_search_params,
+                       supports_remove)
+from lexical_index import BM25Index, tokenize, reciprocal_rank_fusion, weighted_fusion
+from chunking import passage_key, source_file
+from corpus_store import CorpusStore, is_corpus
+from vector_store import VectorStore
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows, where the app runs as a single process
+    fcntl = None
+
+# Folder holding the saved FAISS index and manifest
+ARTIFACTS_FOLDER = "index_artifacts/"
+
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+LEXICAL_FILE = "lexical.npz"
+# Changes since the snapshot above, one JSON line per update; named after the manifest's generation
+JOURNAL_FILE = "journal-{}.jsonl"
+# Locked while a process updates the folder, so several workers can share one index
+LOCK_FILE = "update.lock"
+# Passage store (see corpus_store.py) next to the index; passage text is read from it per hit
+PASSAGES_FOLDER = "passages"
+# Raw embeddings by content hash (see vector_store.py), what the FAISS index is (re)built from
+VECTORS_FOLDER = "vectors"
+
+# Passages encoded per embed_model.encode call while indexing
+ENCODE_BATCH_SIZE = 256
+
+# Updates are appended to the journal; the full index is saved again (a new generation) once
+# the journal covers SNAPSHOT_RATIO of the corpus, and at least SNAPSHOT_MIN_CHANGES passages.
+# Snapshots thus grow geometrically apart and the total I/O stays linear in the corpus size
+SNAPSHOT_MIN_CHANGES = int(os.environ.get("SNAPSHOT_MIN_CHANGES", "1000"))
+SNAPSHOT_RATIO = float(os.environ.get("SNAPSHOT_RATIO", "0.5"))
+
+# Changed files read and applied per update by sync_folder, bounding its memory use
+SYNC_BATCH_FILES = int(os.environ.get("SYNC_BATCH_FILES", "1000"))
+
+# Index settings that change what is stored; the others (nprobe, ef_search) are search-time only
+BUILD_KEYS = ("type", "metric", "nlist", "pq_m", "hnsw_m")
+
+
+def content_hash(text):
+    """Return a stable hash of a document's content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path, write):
+    """Write a file through a temporary name so readers never see a partial file."""
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(folder=ARTIFACTS_FOLDER):
+    """Return the saved manifest, or None if there is none yet."""
+    manifest_path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_index(index_path):
+    """Load a FAISS index memory-mapped, falling back to a normal read. Returns (index, mmapped)."""
+    try:
+        return faiss.read_index(index_path, faiss.IO_FLAG_MMAP), True
+    except RuntimeError:
+        # Older FAISS builds can only mmap some index types
+        return faiss.read_index(index_path), False
+
+
+def read_documents(folder, names=None):
+    """
+    Return {file name: content} for the given files (or every file) in folder, which is either
+    a folder of JSON files or a corpus written by corpus_store.py (keyed by file name).
+    """
+    if is_corpus(folder):
+        store = CorpusStore(folder)
+        try:
+            return store.read(names)
+        finally:
+            store.close()
+    if names is None:
+        names = sorted(os.listdir(folder))
+    docs = {}
+    for name in names:
+        file_path = os.path.join(folder, name)
+        if os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                docs[name] = f.read()
+    return docs
+
+
+def iter_documents(folder, names=None):
+    """Yield (file name, content) for the given files (or every file) in folder (or corpus) one at a time, in name order."""
+    if is_corpus(folder):
+        store = CorpusStore(folder)
+        try:
+            for name in sorted(store.keys() if names is None else names):
+                content = store.get_raw(name)
+                if content is not None:
+                    yield name, content
+        finally:
+            store.close()
+        return
+    for name in sorted(os.listdir(folder) if names is None else names):
+        file_path = os.path.join(folder, name)
+        if os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                yield name, f.read()
+
+
+def save_index_folder(folder, faiss_index, lexical, manifest):
+    """Write the FAISS index, the BM25 index and the manifest (last, so it is only valid once the rest is on disk)."""
+    os.makedirs(folder, exist_ok=True)
+    _atomic_write(os.path.join(folder, INDEX_FILE), lambda path: faiss.write_index(faiss_index, path))
+
+    def write_lexical(path):
+        with open(path, "wb") as f:
+            lexical.save(f)
+
+    _atomic_write(os.path.join(folder, LEXICAL_FILE), write_lexical)
+
+    def write_manifest(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+    _atomic_write(os.path.join(folder, MANIFEST_FILE), write_manifest)
+
+
+def source_versions(folder):
+    """
+    Cheap per-file version stamps used to spot changes: (mtime, size) for a folder of files,
+    the shard and offset of the latest row for a corpus. Lists, so they compare equal once read back from JSON.
+    """
+    if is_corpus(folder):
+        store = CorpusStore(folder)
+        try:
+            return {key: list(location) for key, location in store.locations().items()}
+        finally:
+            store.close()
+    versions = {}
+    for entry in os.scandir(folder):
+        if entry.is_file():
+            stat = entry.stat()
+            versions[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return versions
+
+
+def whole_file(file_name, content):
+    """Default chunker: one passage per file."""
+    return {passage_key(file_name, 0): {"content": content}}
+
+
+class LiveIndex:
+    """
+    FAISS index of passages that can be updated while the app is serving.
+
+    Files are cut into passages by chunker(file name, content) -> {passage key: passage dict},
+    where keys look like "file#i" and each passage has a "content" field plus any metadata.
+    Vectors live in an ID-mapped ANN index described by config (see ann_index.py), so single
+    passages can be added, replaced and removed; types that need training start flat and are
+    rebuilt from the VectorStore once there are enough vectors (see needs_training). A BM25
+    index over the same IDs is kept alongside for hybrid retrieval (config["retrieval"]).
+    Passage dicts are kept on disk in
+    a CorpusStore and only read back for search hits; files whose content hash is unchanged
+    are not chunked again. Raw embeddings are kept in a VectorStore by passage content hash, so
+    a passage is only encoded once, whatever index is built or rebuilt from it.
+    Encoding happens outside the search lock and the result is applied under it, so
+    in-flight searches never see a half-updated index.
+
+    Several processes (e.g. gunicorn workers) can use the same folder: updates hold a file
+    lock and first catch up with whatever another process saved, and follow() picks up their
+    saves. An update is saved as one journal line (its passage keys, IDs and hashes; vectors are
+    in the VectorStore, text in the passage store), so the cost of a change does not grow with
+    the corpus; the whole index is only rewritten now and then (see SNAPSHOT_RATIO). Snapshots
+    are memory-mapped, so processes share one copy of the index in the page cache. Applying a
+    journal line would copy it into the follower's own memory, so the first follower to see
+    new lines writes them into a new snapshot instead, and every follower maps that one.
+    """
+
+    def __init__(self, embed_model, model_name, folder=ARTIFACTS_FOLDER, config=None, chunker=whole_file):
+        self.embed_model = embed_model
+        self.model_name = model_name
+        self.folder = folder
+        self.config = config or index_config()
+        self.chunker = chunker
+        self.dimension = embed_model.get_sentence_embedding_dimension()
+        # Bumped on every applied update so callers can invalidate derived state
+        self.version = 0
+        # Bumped only when indexed passages are replaced or removed (or a snapshot is reloaded):
+        # what was derived from the index before stays valid when passages are only added
+        self.stale_version = 0
+
+        self._lock = threading.Lock()  # guards the index and the id maps
+        self._update_lock = threading.RLock()  # serializes writers
+        self._docs = {}  # passage key -> {"id": int, "hash": str}
+        self._names = {}  # id -> passage key
+        self._files = {}  # file name -> content hash of the version indexed
+        self._sources = {}  # file name -> source_versions() stamp of the version indexed, if read from a folder
+        self._by_file = {}  # file name -> set of passage keys
+        self.passages = CorpusStore(os.path.join(folder, PASSAGES_FOLDER))  # passage key -> passage dict
+        self.vectors = VectorStore(os.path.join(folder, VECTORS_FOLDER), model_name, self.dimension)
+        self.lexical = BM25Index()
+        self._next_id = 0
+        self._mmapped = False
+        self._watcher = None
+        self._follower = None
+        self.faiss_index = None
+        self._saved_stamp = None  # manifest version this process last loaded or saved
+        self._generation = None  # generation of the snapshot the state is based on, None if not from the folder
+        self._journal_pos = 0  # bytes of that generation's journal applied
+        self._journaled = 0  # passages changed since that snapshot
+        with self._folder_lock(exclusive=False):
+            self._saved_stamp = self._manifest_stamp()
+            state = self._read_saved(self.passages)
+            if state is not None:
+                self._apply_saved(state)
+                self._replay_journal()
+        if state is not None:
+            print(f"Loaded index for {len(self._docs)} passages from {self.folder}")
+
+    def _manifest_stamp(self):
+        try:
+            return os.stat(os.path.join(self.folder, MANIFEST_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    @contextlib.contextmanager
+    def _folder_lock(self, exclusive=True):
+        """Lock the folder against other processes: exclusive to update it, shared to read it."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_saved(self, passages):
+        """Read the saved index, manifest and BM25 index, or return None to start empty."""
+        manifest = load_manifest(self.folder)
+        index_path = os.path.join(self.folder, INDEX_FILE)
+        # The index is created on the first update, when there are vectors to train it with
+        if manifest is None or not os.path.isfile(index_path):
+            return None
+        if manifest.get("model") != self.model_name:
+            print(f"Embedding model changed ({manifest.get('model')} -> {self.model_name}), re-encoding corpus")
+            return None
+        saved_config = manifest.get("index", index_config())
+        if any(saved_config.get(key) != self.config[key] for key in BUILD_KEYS):
+            print(f"Index configuration changed ({saved_config} -> {self.config}), rebuilding from stored vectors")
+            return None
+
+        faiss_index, mmapped = read_index(index_path)
+        # Search knobs are not part of the build and can change between restarts
+        set_search_params(faiss_index, self.config)
+        docs = manifest["docs"]
+        by_file = {}
+        for name in docs:
+            by_file.setdefault(source_file(name), set()).add(name)
+        return {
+            "faiss_index": faiss_index,
+            "mmapped": mmapped,
+            "docs": docs,
+            "names": {entry["id"]: name for name, entry in docs.items()},
+            "files": manifest.get("files", {}),
+            "sources": manifest.get("sources", {}),
+            "by_file": by_file,
+            "next_id": manifest["next_id"],
+            "generation": manifest.get("generation", 0),
+            "lexical": self._read_lexical(docs, passages),
+            "passages": passages,
+        }
+
+    def _read_lexical(self, docs, passages):
+        """Restore the BM25 index, or rebuild it from the passage store if it was not saved."""
+        lexical_path = os.path.join(self.folder, LEXICAL_FILE)
+        if os.path.isfile(lexical_path):
+            with open(lexical_path, "rb") as f:
+                return BM25Index.load(f)
+        lexical = BM25Index()
+        for name, entry in docs.items():
+            passage = passages.get(name)
+            if passage is not None:
+                lexical.add(entry["id"], tokenize(passage["content"]))
+        return lexical
+
+    def _apply_saved(self, state):
+        self.faiss_index = state["faiss_index"]
+        self._mmapped = state["mmapped"]
+        self._docs = state["docs"]
+        self._names = state["names"]
+        self._files = state["files"]
+        self._sources = state["sources"]
+        self._by_file = state["by_file"]
+        self._next_id = state["next_id"]
+        self.lexical = state["lexical"]
+        self.passages = state["passages"]
+        self._generation = state["generation"]
+        self._journal_pos = 0
+        self._journaled = 0
+
+    def _journal_path(self, generation):
+        return os.path.join(self.folder, JOURNAL_FILE.format(generation))
+
+    def _journal_pending(self):
+        """True if the journal holds lines this process has not applied yet."""
+        if self._generation is None:
+            return False
+        try:
+            return os.path.getsize(self._journal_path(self._generation)) > self._journal_pos
+        except OSError:
+            return False
+
+    def _replay_journal(self, keep_mapped=False):
+        """
+        Apply the journal lines other processes appended since this one last read it; none while
+        the index is memory-mapped if keep_mapped. Returns how many.
+        """
+        if self._generation is None or (keep_mapped and self._mmapped):
+            return 0
+        try:
+            with open(self._journal_path(self._generation), "rb") as f:
+                f.seek(self._journal_pos)
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        # A line is only complete (and its passages and vectors stored) once its newline is written
+        data = data[:data.rfind(b"\n") + 1]
+        lines = data.decode("utf-8").split("\n")[:-1]
+        if lines:
+            self.passages.refresh()
+            self.vectors.refresh()
+        for line in lines:
+            delta = json.loads(line)
+            names = [name for name, _, _ in delta["add"]]
+            # A passage removed by a later line may be gone from the store already (its text is then unused)
+            texts = {name: (self.passages.get(name) or {}).get("content", "") for name in names}
+            vectors, missing = self.vectors.lookup([passage_hash for _, _, passage_hash in delta["add"]])
+            if missing:
+                vectors[missing] = self._encode([texts[names[i]] for i in missing])
+            self._apply_delta(delta, prepare_vectors(vectors, self.config), {name: tokenize(text) for name, text in texts.items()})
+            self._journaled += len(delta["add"]) + len(delta["remove"])
+        self._journal_pos += len(data)
+        return len(lines)
+
+    def _reload_if_changed(self, keep_mapped=False):
+        """
+        Catch up with what another process saved since this one last loaded or saved: replay its
+        journal lines (unless keep_mapped, see _replay_journal), or load the new snapshot it
+        wrote. Returns True if anything changed.
+        """
+        stamp = self._manifest_stamp()
+        if stamp is None or stamp == self._saved_stamp:
+            return self._replay_journal(keep_mapped) > 0
+        state = self._read_saved(CorpusStore(os.path.join(self.folder, PASSAGES_FOLDER)))
+        if state is None:
+            # Saved with another model or index type; keep serving the current index
+            return False
+        old_passages = self.passages
+        with self._lock:
+            self._apply_saved(state)
+            self.version += 1
+            self.stale_version += 1
+        self._saved_stamp = stamp
+        old_passages.close()
+        self._replay_journal(keep_mapped)
+        print(f"Reloaded index for {len(self._docs)} passages saved by another process")
+        return True
+
+    def reload_if_changed(self):
+        """Pick up an index saved by another process. Returns True if it was reloaded."""
+        with self._update_lock:
+            with self._folder_lock(exclusive=False):
+                changed = self._reload_if_changed(keep_mapped=True)
+                if not (self._mmapped and self._journal_pending()):
+                    return changed
+            # Write the journal into a new snapshot, unless another process did since
+            with self._folder_lock():
+                changed = self._reload_if_changed() or changed
+                if not self._mmapped:
+                    self._save()
+                return changed
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold this process's and the folder's update locks, with the latest saved state loaded."""
+        with self._update_lock, self._folder_lock():
+            self._reload_if_changed()
+            self.passages.refresh()
+            self.vectors.refresh()
+            try:
+                yield
+            finally:
+                # Reopened by the next write, at the end of whatever other processes append meanwhile
+                self.passages.close_writer()
+
+    def _persist(self, delta):
+        """Journal an applied update, or save a new snapshot when the journal has grown large enough."""
+        self._journaled += len(delta["add"]) + len(delta["remove"])
+        if self._generation is None or self._journaled >= max(SNAPSHOT_MIN_CHANGES, SNAPSHOT_RATIO * len(self._docs)):
+            self._save()
+            return
+        line = (json.dumps(delta, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self._journal_path(self._generation), "ab") as f:
+            # Drop a line torn by a crashed writer; every complete one was replayed before this update
+            f.truncate(self._journal_pos)
+            f.write(line)
+        self._journal_pos += len(line)
+
+    def _save(self):
+        """
+        Persist index and manifest as a new generation (manifest last, so it is only valid once
+        the index is on disk), then drop the journals it supersedes.
+        """
+        manifest = load_manifest(self.folder) or {}
+        generation = manifest.get("generation", 0) + 1
+        manifest = {
+            "model": self.model_name,
+            "dimension": self.dimension,
+            "index": self.config,
+            # Differs from the configured type while there are too few vectors to train it
+            "built_type": index_type(self.faiss_index),
+            "generation": generation,
+            "next_id": self._next_id,
+            "docs": self._docs,
+            "files": self._files,
+            "sources": self._sources,
+        }
+        save_index_folder(self.folder, self.faiss_index, self.lexical, manifest)
+        self._saved_stamp = self._manifest_stamp()
+        self._generation = generation
+        self._journal_pos = 0
+        self._journaled = 0
+        for name in os.listdir(self.folder):
+            if name.startswith("journal-") and name != JOURNAL_FILE.format(generation):
+                os.remove(os.path.join(self.folder, name))
+        # Serve from the snapshot just written, sharing its pages with the processes that map it
+        faiss_index, mmapped = read_index(os.path.join(self.folder, INDEX_FILE))
+        set_search_params(faiss_index, self.config)
+        with self._lock:
+            self.faiss_index = faiss_index
+            self._mmapped = mmapped
+
+    def save(self):
+        """Write a full snapshot now, e.g. at the end of a crawl, so the next start has no journal to replay."""
+        with self._writing():
+            if self.faiss_index is not None:
+                self._train_if_needed()
+                self._save()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def update(self, docs, removed=(), files=None, sources=None):
+        """
+        Add or replace the passages in docs ({passage key: passage dict}) and drop the keys in removed.
+        Only passages whose content hash changed are encoded. files ({file name: content hash, or
+        None once deleted}) records which file versions the change covers, sources ({file name:
+        source_versions() stamp, or None}) where they were read from. Returns a summary of the changes.
+        """
+        files = files or {}
+        sources = sources or {}
+        with self._update_lock:
+            added, updated, unchanged = [], [], []
+            hashes = {name: content_hash(doc["content"]) for name, doc in docs.items()}
+            for name in docs:
+                entry = self._docs.get(name)
+                if entry is None:
+                    added.append(name)
+                elif entry["hash"] != hashes[name]:
+                    updated.append(name)
+                else:
+                    unchanged.append(name)
+            removed = [name for name in removed if name in self._docs and name not in docs]
+            files_changed = (any(self._files.get(name) != file_hash for name, file_hash in files.items())
+                             or any(self._sources.get(name) != version for name, version in sources.items()))
+
+            to_encode = added + updated
+            vectors = None
+            if to_encode:
+                print(f"Indexing {len(to_encode)} new or changed passages ({len(unchanged)} unchanged)")
+                vectors = self._vectors_for([hashes[name] for name in to_encode],
+                                            lambda positions: [docs[to_encode[i]]["content"] for i in positions])
+
+            # New passage versions go to the store before they become searchable
+            for name, doc in docs.items():
+                self.passages.put(name, doc)
+            self.passages.flush()
+
+            delta = {
+                "add": [[name, self._next_id + i, hashes[name]] for i, name in enumerate(to_encode)],
+                "remove": removed,
+                "files": files,
+                "sources": sources,
+                "next_id": self._next_id + len(to_encode),
+            }
+            self._apply_delta(delta, vectors, {name: tokenize(docs[name]["content"]) for name in to_encode})
+
+            # Searches no longer return removed passages, drop them from the store
+            for name in removed:
+                self.passages.delete(name)
+            self.passages.flush()
+            if self._train_if_needed():
+                # Other processes cannot retrain from the journal, they load the new snapshot
+                self._journaled += len(delta["add"]) + len(delta["remove"])
+                self._save()
+            elif to_encode or removed or files_changed:
+                self._persist(delta)
+
+            return {"added": len(added), "updated": len(updated), "removed": len(removed), "unchanged": len(unchanged)}
+
+    def _apply_delta(self, delta, vectors, tokens):
+        """
+        Apply one change (as journaled by update) given the prepared vectors and BM25 tokens of
+        the added passages: the index is built or copied outside the search lock, swapped under it.
+        """
+        added = [name for name, _, _ in delta["add"]]
+        removed = [name for name in delta["remove"] if name in self._docs]
+        new_ids = np.array([doc_id for _, doc_id, _ in delta["add"]], dtype="int64")
+        # Replaced versions of added passages go too
+        old_ids = np.array([self._docs[name]["id"] for name in added + removed if name in self._docs], dtype="int64")
+
+        # Searches keep using the current index meanwhile
+        faiss_index = self.faiss_index
+        remove_in_place = len(old_ids) > 0
+        if faiss_index is None:
+            if added:
+                faiss_index = make_index(self.config, self.dimension, vectors)
+        elif len(old_ids) and not supports_remove(faiss_index):
+            faiss_index = self._rebuild(old_ids)
+            remove_in_place = False
+        elif (added or removed) and self._mmapped:
+            # A memory-mapped index is read-only, load it into memory before the first write
+            faiss_index = self._writable_index()
+
+        with self._lock:
+            if len(old_ids):
+                if remove_in_place:
+                    faiss_index.remove_ids(old_ids)
+                for doc_id in old_ids:
+                    del self._names[int(doc_id)]
+                    self.lexical.remove(int(doc_id))
+            for name in removed:
+                del self._docs[name]
+                keys = self._by_file.get(source_file(name))
+                keys.discard(name)
+                if not keys:
+                    del self._by_file[source_file(name)]
+            if added:
+                faiss_index.add_with_ids(vectors, new_ids)
+                for (name, doc_id, passage_hash) in delta["add"]:
+                    self._docs[name] = {"id": doc_id, "hash": passage_hash}
+                    self._names[doc_id] = name
+                    self._by_file.setdefault(source_file(name), set()).add(name)
+                    self.lexical.add(doc_id, tokens[name])
+            self._next_id = max(self._next_id, delta["next_id"])
+            for name, file_hash in delta["files"].items():
+                if file_hash is None:
+                    self._files.pop(name, None)
+                else:
+                    self._files[name] = file_hash
+            # Journal lines written before source stamps were recorded have none
+            for name, version in delta.get("sources", {}).items():
+                if version is None:
+                    self._sources.pop(name, None)
+                else:
+                    self._sources[name] = version
+            self.faiss_index = faiss_index
+            if added or removed:
+                self._mmapped = False
+                self.version += 1
+            if len(old_ids):
+                self.stale_version += 1
+
+    def _encode(self, texts):
+        """Encode texts in batches of ENCODE_BATCH_SIZE into one float32 matrix."""
+        vectors = np.empty((len(texts), self.dimension), dtype="float32")
+        for start in range(0, len(texts), ENCODE_BATCH_SIZE):
+            batch = texts[start:start + ENCODE_BATCH_SIZE]
+            vectors[start:start + len(batch)] = self.embed_model.encode(batch, convert_to_numpy=True)
+        return vectors
+
+    def _vectors_for(self, hashes, texts):
+        """
+        Prepared vectors of the passages with these content hashes, read from the vector store;
+        texts(positions) gives the texts of those it does not hold, which are encoded and stored.
+        """
+        vectors, missing = self.vectors.lookup(hashes)
+        if missing:
+            print(f"Encoding {len(missing)} passages ({len(hashes) - len(missing)} already encoded)")
+            encoded = self._encode(texts(missing))
+            vectors[missing] = encoded
+            self.vectors.add([hashes[i] for i in missing], encoded)
+        return prepare_vectors(vectors, self.config)
+
+    def _writable_index(self):
+        """
+        In-memory copy of the memory-mapped index, for the process writing the next change (followers
+        map the snapshot it saves, see reload_if_changed). Read from the snapshot again rather than
+        with clone_index, which cannot copy the on-disk inverted lists of a mapped IVF index. Only
+        called before the first change to a mapped index, with the folder locked, so the file
+        still holds exactly what is mapped.
+        """
+        faiss_index = faiss.read_index(os.path.join(self.folder, INDEX_FILE))
+        set_search_params(faiss_index, self.config)
+        return faiss_index
+
+    def _rebuild(self, old_ids=()):
+        """
+        Return a new index holding every vector except old_ids, trained on them: for types that
+        cannot remove, and to train an index once the corpus is large enough (see needs_training).
+        """
+        dropped = set(int(doc_id) for doc_id in old_ids)
+        kept_ids = np.array([doc_id for doc_id in self._names if doc_id not in dropped], dtype="int64")
+        print(f"Rebuilding {self.config['type']} index from {len(kept_ids)} passages ({len(dropped)} dropped)")
+        # From the vector store rather than reconstruct(), which PQ codes only approximate
+        kept_names = [self._names[int(doc_id)] for doc_id in kept_ids]
+        kept = self._vectors_for([self._docs[name]["hash"] for name in kept_names],
+                                 lambda positions: [self.passages.get(kept_names[i])["content"] for i in positions])
+        new_index = make_index(self.config, self.dimension, kept)
+        if len(kept_ids):
+            new_index.add_with_ids(kept, kept_ids)
+        return new_index
+
+    def _train_if_needed(self):
+        """
+        Rebuild the index from the vector store when needs_training says so. Returns True if it
+        did, the caller then saves a snapshot. Call with the update locks held.
+        """
+        if self.faiss_index is None or not needs_training(self.faiss_index, self.config, len(self._names)):
+            return False
+        faiss_index = self._rebuild()
+        with self._lock:
+            self.faiss_index = faiss_index
+            self._mmapped = False
+        return True
+
+    def _update_files(self, files, missing, versions=None):
+        """
+        Chunk and apply the files whose content changed; drop the passages of missing files.
+        versions ({file name: source_versions() stamp}) says where files were read from; files
+        handed over without one are read again by the next sync_folder.
+        """
+        hashes = {name: content_hash(content) for name, content in files.items()}
+        changed = [name for name in files if self._files.get(name) != hashes[name] or name not in self._by_file]
+        docs = {}
+        for file_name in changed:
+            docs.update(self.chunker(file_name, files[file_name]))
+        removed = [key for name in changed + list(missing) for key in self._by_file.get(name, ()) if key not in docs]
+        file_versions = {name: hashes[name] for name in changed}
+        file_versions.update({name: None for name in missing})
+        sources = {name: (versions or {}).get(name) for name in list(files) + list(missing)}
+        summary = self.update(docs, removed, file_versions, sources)
+        summary["unchanged_files"] = len(files) - len(changed)
+        return summary
+
+    def sync_folder(self, documents_folder):
+        """
+        Bring the index in line with every file in documents_folder (a folder of files or a corpus).
+        Only files whose source_versions() stamp differs from the one indexed are read, SYNC_BATCH_FILES at a time.
+        """
+        with self._writing():
+            # Stamped before reading: a file changed meanwhile is read again by the next sync
+            versions = source_versions(documents_folder)
+            missing = [name for name in set(self._by_file) | set(self._files) if name not in versions]
+            changed = sorted(name for name, version in versions.items()
+                             if self._sources.get(name) != version or name not in self._files)
+            total = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0,
+                     "unchanged_files": len(versions) - len(changed)}
+            if changed:
+                print(f"Reading {len(changed)} new or changed files ({total['unchanged_files']} unchanged)")
+            files, read = {}, set()
+            for name, content in iter_documents(documents_folder, changed):
+                files[name] = content
+                read.add(name)
+                if len(files) >= SYNC_BATCH_FILES:
+                    self._add_summary(total, self._update_files(files, missing, versions))
+                    files, missing = {}, []
+            # Files deleted since they were stamped count as missing
+            missing += [name for name in changed if name not in read and (name in self._files or name in self._by_file)]
+            if files or missing:
+                self._add_summary(total, self._update_files(files, missing, versions))
+            # An index saved before there were enough vectors to train it
+            if self._train_if_needed():
+                self._save()
+            return total
+
+    @staticmethod
+    def _add_summary(total, summary):
+        for key, count in summary.items():
+            total[key] += count
+
+    def refresh_files(self, documents_folder, names):
+        """Re-read only the named files: their passages are added or replaced, stale or missing ones removed."""
+        with self._writing():
+            versions = source_versions(documents_folder)
+            files = read_documents(documents_folder, names)
+            return self._update_files(files, [name for name in names if name not in files], versions)
+
+    def update_files(self, files, removed=()):
+        """Index {file name: content} handed over directly (e.g. by the crawler) and drop the removed files."""
+        with self._writing():
+            return self._update_files(files, list(removed))
+
+    def file_count(self):
+        """Number of source files with at least one indexed passage."""
+        return len(self._by_file)
+
+    def search(self, query_vecs, k, queries=None):
+        """
+        Return, for each query vector, the top-k passages as dicts with the passage fields
+        plus "name" (the passage key) and "score". Dense retrieval scores are the L2 distance
+        (lower is better) or the cosine similarity for the "ip" metric. Given the query texts,
+        the other retrieval modes also use the BM25 index and return fused scores (higher is better).
+        """
+        query_vecs = prepare_vectors(query_vecs, self.config)
+        mode = self.config["retrieval"]
+        with self._lock:
+            if self.faiss_index is None:
+                return [[] for _ in query_vecs]
+            if queries is None or mode == "dense":
+                scores, ids = self.faiss_index.search(query_vecs, k)
+                rows = [[(int(doc_id), float(score)) for score, doc_id in zip(row_scores, row_ids) if doc_id != -1]
+                        for row_scores, row_ids in zip(scores, ids)]
+            else:
+                rows = self._hybrid_search(query_vecs, queries, k, mode)
+            hits = [[(self._names[doc_id], score) for doc_id, score in row if doc_id in self._names] for row in rows]
+            passages = self.passages
+        # Only the hits are read from the memory-mapped passage store
+        results = []
+        for row in hits:
+            found = [(passages.get(name), name, score) for name, score in row]
+            results.append([dict(passage, name=name, score=score) for passage, name, score in found if passage is not None])
+        return results
+
+    def _hybrid_search(self, query_vecs, queries, k, mode):
+        """[(ID, score)] rows combining dense and BM25 hits; call with the search lock held."""
+        candidates = max(k, self.config["candidates"])
+        lexical = [self.lexical.search(query, candidates) for query in queries]
+        if mode == "prefilter":
+            # Dense scoring restricted to the BM25 candidates, plain dense search when too few match
+            rows = []
+            for query_vec, (lexical_ids, _) in zip(query_vecs, lexical):
+                if len(lexical_ids) >= k:
+                    rows.append(self._score_exactly(query_vec, lexical_ids, k))
+                else:
+                    scores, ids = self.faiss_index.search(query_vec[None, :], k)
+                    rows.append([(int(doc_id), float(score)) for score, doc_id in zip(scores[0], ids[0]) if doc_id != -1])
+            return rows
+
+        scores, ids = self.faiss_index.search(query_vecs, candidates)
+        rows = []
+        for row_scores, row_ids, (lexical_ids, lexical_scores) in zip(scores, ids, lexical):
+            dense = [(int(doc_id), float(score)) for score, doc_id in zip(row_scores, row_ids) if doc_id != -1]
+            if mode == "rrf":
+                fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense], [int(doc_id) for doc_id in lexical_ids]])
+            else:
+                # Turn L2 distances into similarities before scaling
+                sign = 1.0 if self.config["metric"] == "ip" else -1.0
+                fused = weighted_fusion({doc_id: sign * score for doc_id, score in dense},
+                                        {int(doc_id): float(score) for doc_id, score in zip(lexical_ids, lexical_scores)},
+                                        self.config["dense_weight"])
+            rows.append(fused[:k])
+        return rows
+
+    def _score_exactly(self, query_vec, ids, k):
+        """
+        Top-k [(ID, score)] among ids, scored against their stored vectors like a flat index would.
+        A handful of candidates is cheaper to score directly than to search for in the ANN index,
+        which for IVF would mean visiting every cell, and PQ codes would only approximate the score.
+        """
+        ids = [int(doc_id) for doc_id in ids if int(doc_id) in self._names]
+        vectors, missing = self.vectors.lookup([self._docs[self._names[doc_id]]["hash"] for doc_id in ids])
+        # Every indexed passage is in the vector store unless another process just dropped it
+        missing = set(missing)
+        kept = [i for i in range(len(ids)) if i not in missing]
+        vectors = prepare_vectors(vectors[kept], self.config)
+        if self.config["metric"] == "ip":
+            scores = vectors @ query_vec
+            order = np.argsort(-scores)[:k]
+        else:
+            scores = ((vectors - query_vec) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:k]
+        return [(ids[kept[i]], float(scores[i])) for i in order]
+
+    def follow(self, interval=5):
+        """Start a background thread that reloads the index whenever another process saves it."""
+        if self._follower is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"Error reloading index from {self.folder}: {e}")
+
+        self._follower = threading.Thread(target=poll, name="index-follower", daemon=True)
+        self._follower.start()
+
+    def watch(self, documents_folder, interval=30):
+        """Start a background thread that polls documents_folder and applies changed files."""
+        if self._watcher is not None:
+            return
+
+        def poll():
+            previous = source_versions(documents_folder)
+            while True:
+                time.sleep(interval)
+                try:
+                    current = source_versions(documents_folder)
+                    changed = [name for name, stat in current.items() if previous.get(name) != stat]
+                    changed += [name for name in previous if name not in current]
+                    if changed:
+                        summary = self.refresh_files(documents_folder, changed)
+                        print(f"Index refreshed: {summary['added']} added, "
+                              f"{summary['updated']} updated, {summary['removed']} removed passages")
+                    previous = current
+                except Exception as e:
+                    print(f"Error refreshing index from {documents_folder}: {e}")
+
+        self._watcher = threading.Thread(target=poll, name="index-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,147 @@
+"""
+Streaming indexer: the crawler hands each saved page to an IndexWriter, which chunks, encodes
+and appends it to the bot's index folder in small batches while the crawl goes on.
+
+Pages wait in a bounded queue; when encoding falls behind, write() blocks and the crawler
+slows down instead of piling pages up in memory. Each batch is appended to the index journal
+(see LiveIndex.update_files), and a running bot replays it through LiveIndex.follow(), so a page
+is answerable seconds after it was scraped rather than after the next restart (the bot's cached
+answers are dropped on each batch, unless CACHE_KEEP_ON_ADDITIONS keeps them while pages are only
+added); the full index is written once, when the writer is closed. An IVF / PQ index starts out flat while the
+crawl has too few passages to train it, and is rebuilt as the configured type (and its cells
+resized as the crawl grows) from the stored vectors; close() checks once more before saving.
+"""
+import os
+import time
+import threading
+from batch_writer import BatchWriter
+from chunking import PASSAGE_TOKENS, PASSAGE_OVERLAP, make_chunker
+from ann_index import index_config_from_env
+from context_packer import ContextPacker
+from index_store import ARTIFACTS_FOLDER, LiveIndex
+from inference import load_embedder, load_generation_tokenizer, embedding_model_id
+
+# The bot's models: passages must be encoded and tokenized exactly as bot01.py does
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+GEN_MODEL = "google/flan-t5-base"
+
+# Pages indexed per batch, and the longest a page waits for its batch (seconds)
+BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "32"))
+FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "5"))
+# Pages queued at most before write() blocks the crawler
+MAX_QUEUED = int(os.environ.get("STREAM_MAX_QUEUED", "256"))
+
+
+def embed_backend_from_env():
+    """Embedding backend the bot uses (EMBED_BACKEND, else INFERENCE_BACKEND)."""
+    return os.environ.get("EMBED_BACKEND", os.environ.get("INFERENCE_BACKEND", "eager"))
+
+
+def chunker_from_env(embed_tokenizer):
+    """The bot's chunker: same passage size and LLM tokenizer (environment) as bot01.py."""
+    tokenizer = load_generation_tokenizer(GEN_MODEL, os.environ.get("INFERENCE_BACKEND", "eager"))
+    context_packer = ContextPacker(tokenizer, int(os.environ.get("MAX_INPUT_TOKENS", "512")))
+    return make_chunker(embed_tokenizer, context_packer,
+                        int(os.environ.get("PASSAGE_TOKENS", PASSAGE_TOKENS)),
+                        int(os.environ.get("PASSAGE_OVERLAP", PASSAGE_OVERLAP)))
+
+
+def open_live_index(folder=ARTIFACTS_FOLDER):
+    """Load the models and open the index in folder with the same settings (environment) as the bot."""
+    embed_model, backend = load_embedder(EMBED_MODEL, embed_backend_from_env())
+    chunker = chunker_from_env(embed_model.tokenizer)
+    return LiveIndex(embed_model, embedding_model_id(EMBED_MODEL, backend), folder, index_config_from_env(), chunker)
+
+
+class IndexWriter(BatchWriter):
+    """
+    Feed pages to a LiveIndex from a background thread.
+
+    write() and remove() only queue the change (blocking while max_queued are waiting); the
+    thread applies them every batch_size pages or flush_interval seconds (see BatchWriter) with
+    one LiveIndex.update_files call, which encodes the new passages in fixed-size batches.
+    """
+
+    def __init__(self, live_index, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queued=MAX_QUEUED):
+        super().__init__("index-writer", batch_size, flush_interval, max_queued)
+        self.live_index = live_index
+        self._stats_lock = threading.Lock()
+        self.pages = 0
+        self.removed = 0
+        self.batches = 0
+        self.passages = 0
+        self.errors = 0
+        self.index_seconds = 0.0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.handed_over = 0
+        self.total_freshness = 0.0
+        self.max_freshness = 0.0
+        self.start()
+
+    def _put(self, item):
+        # Backpressure: the caller (a crawler thread) waits for the indexer to catch up
+        waited = self.put(item)
+        if waited:
+            with self._stats_lock:
+                self.blocked += 1
+                self.blocked_seconds += waited
+
+    def write(self, file_name, content):
+        """Queue a page (its JSON text, as saved) to be indexed under file_name."""
+        self._put((file_name, content, time.monotonic()))
+
+    def remove(self, file_name):
+        """Queue the removal of a page's passages."""
+        self._put((file_name, None, time.monotonic()))
+
+    def _write_batch(self, batch):
+        # The last change to a page in the batch wins
+        latest = {file_name: content for file_name, content, _ in batch}
+        files = {name: content for name, content in latest.items() if content is not None}
+        removed = [name for name, content in latest.items() if content is None]
+
+        started = time.monotonic()
+        try:
+            summary = self.live_index.update_files(files, removed)
+        except Exception as e:
+            print(f"Error indexing {len(latest)} pages: {e}")
+            with self._stats_lock:
+                self.errors += 1
+            return
+        done = time.monotonic()
+        # Freshness: from the page being handed over to it being searchable
+        freshness = [done - queued for _, _, queued in batch]
+        with self._stats_lock:
+            self.pages += len(files)
+            self.removed += len(removed)
+            self.batches += 1
+            self.passages += summary["added"] + summary["updated"]
+            self.index_seconds += done - started
+            self.handed_over += len(batch)
+            self.total_freshness += sum(freshness)
+            self.max_freshness = max(self.max_freshness, max(freshness))
+
+    def close(self):
+        """Index everything still queued, then save a snapshot so the next start has no journal to replay."""
+        self.stop()
+        try:
+            self.live_index.save()
+        except Exception as e:
+            print(f"Error saving index: {e}")
+
+    def stats(self):
+        """Pages and passages indexed, encoding throughput, freshness and time the crawler was held back."""
+        with self._stats_lock:
+            return {
+                "pages": self.pages,
+                "removed": self.removed,
+                "batches": self.batches,
+                "passages": self.passages,
+                "errors": self.errors,
+                "passages_per_second": self.passages / self.index_seconds if self.index_seconds else 0.0,
+                "mean_freshness_seconds": self.total_freshness / self.handed_over if self.handed_over else 0.0,
+                "max_freshness_seconds": self.max_freshness,
+                "blocked": self.blocked,
+                "blocked_seconds": self.blocked_seconds,
+            }
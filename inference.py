@@ -0,0 +1,119 @@
+"""
+CPU inference backends for the generation (flan-t5) and embedding (MiniLM) models.
+
+    eager   PyTorch fp32, as loaded by transformers / sentence-transformers
+    int8    PyTorch with dynamic int8 quantization of every nn.Linear
+    onnx    ONNX Runtime: encoder, decoder and decoder-with-past sessions exported by optimum
+            (needs `pip install optimum[onnxruntime]`; exports are cached in ONNX_FOLDER)
+
+Every backend returns an object with the usual generate() / encode() methods, so callers do
+not change. Run bench_inference.py to compare them.
+
+INFERENCE_BACKEND=stub swaps in the tiny offline models of stub_models.py, for load tests.
+"""
+import os
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from sentence_transformers import SentenceTransformer
+
+INFERENCE_BACKENDS = ("eager", "int8", "onnx")
+# Not a real backend: fake models that need no download (see stub_models.py)
+STUB_BACKEND = "stub"
+
+# Where ONNX exports are kept between restarts
+ONNX_FOLDER = "onnx_models/"
+
+
+def configure_threads(num_threads=None):
+    """Set PyTorch's intra-op thread count (default: one per CPU core). Returns it."""
+    num_threads = num_threads or os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    # Inter-op parallelism only helps graphs with independent branches; generate() is sequential
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once, before any parallel work started
+        pass
+    return num_threads
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization: Linear weights stored as int8, activations quantized on the fly."""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_folder(model_name):
+    return os.path.join(ONNX_FOLDER, model_name.replace("/", "__"))
+
+
+def load_generator(model_name, backend="eager", num_threads=None):
+    """
+    Load the seq2seq model for the given backend, ready for generate().
+    Returns (model, backend actually used), falling back to int8 when ONNX Runtime is missing.
+    """
+    if backend == STUB_BACKEND:
+        from stub_models import StubGenerator
+        return StubGenerator(), backend
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+    if backend == "onnx":
+        try:
+            import onnxruntime
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            print(f"ONNX Runtime backend unavailable ({e}), using int8 PyTorch instead")
+            backend = "int8"
+        else:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+            options.inter_op_num_threads = 1
+            folder = _onnx_folder(model_name)
+            if os.path.isdir(folder):
+                return ORTModelForSeq2SeqLM.from_pretrained(folder, use_cache=True, session_options=options), backend
+            print(f"Exporting {model_name} to ONNX in {folder}")
+            model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True, session_options=options)
+            model.save_pretrained(folder)
+            return model, backend
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name).eval()
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model, backend
+
+
+def load_embedder(model_name, backend="eager"):
+    """Load the sentence-transformers model for the given backend. Returns (model, backend actually used)."""
+    if backend == STUB_BACKEND:
+        from stub_models import StubEmbedder
+        return StubEmbedder(), backend
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, backend="onnx"), backend
+        except (TypeError, ImportError, ValueError) as e:
+            # sentence-transformers < 3.2, or optimum / onnxruntime not installed
+            print(f"ONNX Runtime backend unavailable for {model_name} ({e}), using int8 PyTorch instead")
+            backend = "int8"
+
+    model = SentenceTransformer(model_name)
+    model.eval()
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model, backend
+
+
+def load_generation_tokenizer(model_name, backend="eager"):
+    """The generation tokenizer: the same for every backend but the stub."""
+    if backend == STUB_BACKEND:
+        from stub_models import StubTokenizer
+        return StubTokenizer()
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def embedding_model_id(model_name, backend):
+    """
+    Name the index is built under: quantized or exported models give slightly different vectors,
+    so switching backend re-encodes the corpus instead of mixing the two.
+    """
+    return model_name if backend == "eager" else f"{model_name}@{backend}"
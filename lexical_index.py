@@ -0,0 +1,195 @@
+import re
+import math
+import unicodedata
+from array import array
+import numpy as np
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal-rank fusion constant (the usual 60 keeps low ranks from dominating)
+RRF_K = 60
+
+# French function words (accent-folded) plus a few English ones seen in mixed queries
+STOPWORDS = frozenset("""
+a ai aie aient aies ait as au aux avaient avais avait avec avez aviez avions avoir avons ayant
+c ca ce ceci cela celle celles celui ces cet cette ceux chez d dans de des du elle elles en
+est et etaient etais etait etant ete etes etre eu eux fait faut il ils j je l la le les leur
+leurs lui m ma mais me meme mes moi mon n ne nos notre nous on ont ou par pas peut plus pour
+qu quand que quel quelle quelles quels qui s sa sans se ses si son sont sur t ta te tes toi
+ton tous tout toute toutes tu un une vos votre vous y
+the of and or to in on for is are what how when where which who
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(text):
+    """Lowercase and strip accents, so "Réinscription" matches "reinscription"."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Accent-folded word tokens of text without stopwords; course codes and dates stay whole."""
+    return [token for token in _TOKEN.findall(fold(text)) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index with BM25 scoring, keyed by the same integer IDs as the FAISS index.
+
+    Postings are compact arrays (int32 IDs, uint16 term frequencies) per term. Removed IDs keep
+    their postings until compact() but get length 0 and are skipped when scoring; since
+    LiveIndex gives a changed passage a new ID, updates are an add plus a remove.
+    Not thread-safe: LiveIndex calls it under its search lock.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> (array of IDs, array of term frequencies)
+        self._lengths = np.zeros(0, dtype="float32")  # ID -> tokens, 0 once removed
+        self._live = 0
+        self._total_length = 0
+        self._removed = 0  # IDs removed since the last compact()
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, doc_id):
+        return doc_id < len(self._lengths) and self._lengths[doc_id] > 0
+
+    def add(self, doc_id, tokens):
+        """Index the tokens (from tokenize) of a passage under doc_id, which must not be indexed already."""
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        if not counts:
+            return
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("H"))
+            postings[0].append(doc_id)
+            postings[1].append(min(count, 65535))
+        if doc_id >= len(self._lengths):
+            grown = np.zeros(max(doc_id + 1, 2 * len(self._lengths)), dtype="float32")
+            grown[:len(self._lengths)] = self._lengths
+            self._lengths = grown
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._live += 1
+        self._total_length += length
+
+    def remove(self, doc_id):
+        """Stop returning doc_id; its postings are dropped by the next compact()."""
+        if doc_id not in self:
+            return
+        length = int(self._lengths[doc_id])
+        self._lengths[doc_id] = 0
+        self._live -= 1
+        self._total_length -= length
+        self._removed += 1
+        if self._removed > self._live:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the postings without the entries of removed IDs."""
+        postings = {}
+        for term, (ids, tfs) in self._postings.items():
+            ids_np = np.frombuffer(ids, dtype="int32")
+            live = self._lengths[ids_np] > 0
+            if live.any():
+                postings[term] = (array("i", ids_np[live].tobytes()),
+                                  array("H", np.frombuffer(tfs, dtype="uint16")[live].tobytes()))
+        self._postings = postings
+        self._removed = 0
+
+    def scores(self, text):
+        """Dense array of BM25 scores of every ID for the query text."""
+        scores = np.zeros(len(self._lengths), dtype="float32")
+        if not self._live:
+            return scores
+        average_length = self._total_length / self._live
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            ids = np.frombuffer(postings[0], dtype="int32")
+            lengths = self._lengths[ids]
+            live = lengths > 0
+            ids, lengths = ids[live], lengths[live]
+            if not len(ids):
+                continue
+            tfs = np.frombuffer(postings[1], dtype="uint16")[live].astype("float32")
+            idf = math.log(1 + (self._live - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / average_length))
+        return scores
+
+    def search(self, text, k):
+        """Return (IDs, scores) of the k best-scoring passages, best first; fewer if fewer match."""
+        scores = self.scores(text)
+        ids = np.flatnonzero(scores)
+        if len(ids) > k:
+            ids = ids[np.argpartition(-scores[ids], k - 1)[:k]]
+        ids = ids[np.argsort(-scores[ids])]
+        return ids.astype("int64"), scores[ids]
+
+    def save(self, f):
+        """Write the index to the binary file object f."""
+        terms = list(self._postings)
+        sizes = np.array([len(self._postings[term][0]) for term in terms], dtype="int64")
+        np.savez(
+            f,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype="uint8"),
+            offsets=np.concatenate([[0], np.cumsum(sizes)]),
+            ids=np.concatenate([np.frombuffer(self._postings[term][0], dtype="int32") for term in terms] or [np.zeros(0, "int32")]),
+            tfs=np.concatenate([np.frombuffer(self._postings[term][1], dtype="uint16") for term in terms] or [np.zeros(0, "uint16")]),
+            lengths=self._lengths,
+            params=np.array([self.k1, self.b]),
+        )
+
+    @classmethod
+    def load(cls, f):
+        """Read an index written by save()."""
+        data = np.load(f)
+        k1, b = data["params"]
+        index = cls(float(k1), float(b))
+        terms = data["terms"].tobytes().decode("utf-8").split("\n") if len(data["terms"]) else []
+        offsets, ids, tfs = data["offsets"], data["ids"], data["tfs"]
+        for i, term in enumerate(terms):
+            start, end = offsets[i], offsets[i + 1]
+            index._postings[term] = (array("i", ids[start:end].tobytes()), array("H", tfs[start:end].tobytes()))
+        index._lengths = data["lengths"].astype("float32")
+        index._live = int(np.count_nonzero(index._lengths))
+        index._total_length = int(index._lengths.sum())
+        index._removed = len(np.unique(ids[index._lengths[ids] == 0])) if len(ids) else 0
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse several best-first ID lists: each ID scores the sum of 1 / (k + rank). Returns [(ID, score)]."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(dense, lexical, dense_weight=0.5):
+    """
+    Fuse {ID: similarity} (higher is better) from dense and lexical search after min-max
+    scaling each to [0, 1]; IDs missing from one list get 0 there. Returns [(ID, score)].
+    """
+    def scaled(scores):
+        if not scores:
+            return {}
+        low, high = min(scores.values()), max(scores.values())
+        return {doc_id: (score - low) / (high - low) if high > low else 1.0 for doc_id, score in scores.items()}
+
+    dense, lexical = scaled(dense), scaled(lexical)
+    fused = {doc_id: dense_weight * dense.get(doc_id, 0.0) + (1 - dense_weight) * lexical.get(doc_id, 0.0)
+             for doc_id in set(dense) | set(lexical)}
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
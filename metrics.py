@@ -0,0 +1,172 @@
+import time
+import bisect
+import threading
+import contextlib
+
+# Latency buckets in seconds, from a cached answer to a long CPU generation
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram:
+    """Observations counted into fixed buckets, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [counts per bucket (last one is +Inf), sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labels, key, [("le", _format_value(bound))]), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total
+            yield f"{self.name}_count", _format_labels(self.labels, key), cumulative
+
+
+class Callback:
+    """A value read when the metrics are scraped, e.g. a queue depth or a count kept elsewhere."""
+
+    def __init__(self, name, help, read, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            # Not available (yet), e.g. before the component it reads is loaded
+            return
+        if value is not None:
+            yield self.name, "", value
+
+
+class Registry:
+    """
+    Metrics exposed in the Prometheus text format (render() is what /metrics returns).
+
+    Recording is a lock and a few additions, cheap enough to stay on in production. Each process
+    keeps its own values: under gunicorn every worker reports its own metrics, tagged with its pid.
+    """
+
+    def __init__(self, prefix="", constant_labels=None):
+        self.prefix = f"{prefix}_" if prefix else ""
+        # Added to every sample; values may be callables, read at each scrape (e.g. os.getpid after a fork)
+        self.constant_labels = dict(constant_labels or {})
+        self._metrics = []
+
+    def _register(self, metric):
+        metric.name = self.prefix + metric.name
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, read, kind="gauge"):
+        return self._register(Callback(name, help, read, kind))
+
+    def render(self):
+        constant = ",".join(f'{name}="{value() if callable(value) else value}"'
+                            for name, value in self.constant_labels.items())
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if constant:
+                    labels = f"{{{constant}}}" if not labels else f"{{{constant},{labels[1:]}"
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Time the stages of answering one request (or one batch of them): each stage is observed in
+    the histogram as it ends, and seconds keeps the breakdown to report back to the client.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.histogram.observe(seconds, stage=name)
+
+    def milliseconds(self):
+        return {name: round(seconds * 1000, 2) for name, seconds in self.seconds.items()}
+
+
+def format_server_timing(seconds):
+    """Server-Timing header value for {stage: seconds}, shown per request in the browser's network panel."""
+    return ", ".join(f"{name};dur={value * 1000:.1f}" for name, value in seconds.items())
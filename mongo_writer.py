@@ -0,0 +1,218 @@
+"""
+Buffered MongoDB writer for scraped pages.
+
+Run it directly to measure write throughput:
+
+    python mongo_writer.py --records 20000             # against MONGO_URI
+    python mongo_writer.py --records 20000 --mock      # against mongomock, no server needed
+"""
+import os
+import time
+import hashlib
+import argparse
+import threading
+from pymongo import MongoClient, UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import PyMongoError
+from batch_writer import BatchWriter
+
+# Records buffered before a bulk write, and the longest a record waits in the buffer (seconds)
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2.0
+
+
+def record_id(url, text):
+    """Stable ID of a paragraph: its page URL plus a hash of its text."""
+    return f"{url}#{hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]}"
+
+
+def page_operations(record):
+    """
+    Upserts for one page record: the page itself (files and tables) in `pages`, keyed by URL,
+    and one document per paragraph in `web`, keyed by record_id and pointing back to its page.
+    Paragraphs the page no longer has are deleted in the same bulk write.
+    """
+    page = {
+        "topic": record["topic"],
+        "path": record["path"],
+        "files": record["files"],
+        "tables": record["tables"],
+        "paragraph_count": len(record["paragraphs"]),
+    }
+    pages = [UpdateOne({"_id": record["url"]}, {"$set": page}, upsert=True)]
+    paragraphs = []
+    ids = []
+    for position, text in enumerate(record["paragraphs"]):
+        paragraph = {
+            "url": record["url"],
+            "topic": record["topic"],
+            "path": record["path"],
+            "text": text,
+            "position": position,
+        }
+        ids.append(record_id(record["url"], text))
+        paragraphs.append(UpdateOne({"_id": ids[-1]}, {"$set": paragraph}, upsert=True))
+    # Never matches the paragraphs upserted above, so the order within the bulk does not matter
+    paragraphs.append(DeleteMany({"url": record["url"], "_id": {"$nin": ids}}))
+    return pages, paragraphs
+
+
+def removal_operations(url):
+    """Deletes for a page gone from the site: its `pages` document and all its paragraphs."""
+    return [DeleteOne({"_id": url})], [DeleteMany({"url": url})]
+
+
+def source_operation(url, text, source):
+    """Record that the paragraph text kept on page url was dropped as a duplicate from the page at path source."""
+    # Upserted, in case it runs before the paragraph's own write in an unordered bulk
+    return UpdateOne({"_id": record_id(url, text)}, {"$addToSet": {"sources": source}}, upsert=True)
+
+
+class _Removal:
+    """Queued by remove() in place of a page record."""
+
+    def __init__(self, url):
+        self.url = url
+
+
+class _Source:
+    """Queued by add_source() in place of a page record."""
+
+    def __init__(self, url, text, source):
+        self.url = url
+        self.text = text
+        self.source = source
+
+
+class MongoWriter(BatchWriter):
+    """
+    Write page records through one long-lived, pooled MongoClient.
+
+    write() only queues the record; a background thread sends unordered bulk upserts every
+    batch_size records or flush_interval seconds (see BatchWriter), so re-crawls update
+    documents instead of duplicating them, and drop the paragraphs a page lost.
+    """
+
+    def __init__(self, uri, db_name, client=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__("mongo-writer", batch_size, flush_interval)
+        self._owns_client = client is None
+        self.client = client or MongoClient(uri, serverSelectionTimeoutMS=5000)
+        db = self.client[db_name]
+        self.paragraphs = db.web
+        self.pages = db.pages
+        for collection in (self.paragraphs, self.pages):
+            collection.create_index("path")
+            collection.create_index("topic")
+        self.paragraphs.create_index("url")
+
+        self._stats_lock = threading.Lock()
+        self.records = 0
+        self.upserted = 0
+        self.modified = 0
+        self.deleted = 0
+        self.removed = 0
+        self.errors = 0
+        self.write_seconds = 0.0
+        self.start()
+
+    def write(self, record):
+        """Queue a page record for the next bulk write."""
+        self.put(record)
+
+    def remove(self, url):
+        """Queue the deletion of a page and its paragraphs, in order with the writes."""
+        self.put(_Removal(url))
+
+    def add_source(self, url, text, source):
+        """Queue adding source to the "sources" of the paragraph text of page url (see dedup.py)."""
+        self.put(_Source(url, text, source))
+
+    def _write_batch(self, records):
+        pages, paragraphs = [], []
+        removals = sources = 0
+        for record in records:
+            if isinstance(record, _Source):
+                paragraphs.append(source_operation(record.url, record.text, record.source))
+                sources += 1
+                continue
+            if isinstance(record, _Removal):
+                page_ops, paragraph_ops = removal_operations(record.url)
+                removals += 1
+            else:
+                page_ops, paragraph_ops = page_operations(record)
+            pages.extend(page_ops)
+            paragraphs.extend(paragraph_ops)
+
+        started = time.monotonic()
+        for collection, operations in ((self.pages, pages), (self.paragraphs, paragraphs)):
+            if not operations:
+                continue
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                with self._stats_lock:
+                    self.upserted += result.upserted_count
+                    self.modified += result.modified_count
+                    self.deleted += result.deleted_count
+            except PyMongoError as e:
+                print(f"Error writing {len(operations)} documents to MongoDB: {e}")
+                with self._stats_lock:
+                    self.errors += 1
+        with self._stats_lock:
+            self.records += len(records) - removals - sources
+            self.removed += removals
+            self.write_seconds += time.monotonic() - started
+
+    def close(self):
+        """Flush everything still queued and release the client."""
+        self.stop()
+        if self._owns_client:
+            self.client.close()
+
+    def stats(self):
+        """Records written, documents upserted/modified and write throughput."""
+        with self._stats_lock:
+            return {
+                "records": self.records,
+                "upserted": self.upserted,
+                "modified": self.modified,
+                "deleted": self.deleted,
+                "removed_pages": self.removed,
+                "errors": self.errors,
+                "records_per_second": self.records / self.write_seconds if self.write_seconds else 0.0,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10000, help="synthetic page records to write")
+    parser.add_argument("--paragraphs", type=int, default=10, help="paragraphs per page record")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--mock", action="store_true", help="write to mongomock instead of MONGO_URI")
+    args = parser.parse_args()
+
+    client = None
+    if args.mock:
+        import mongomock
+        client = mongomock.MongoClient()
+    uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+    writer = MongoWriter(uri, os.environ.get("MONGO_DB", "ihec_benchmark"), client, batch_size=args.batch_size)
+
+    started = time.monotonic()
+    for n in range(args.records):
+        writer.write({
+            "url": f"https://example.org/page/{n}",
+            "topic": f"topic{n % 50}",
+            "path": f"fr/topic{n % 50}/{n}",
+            "paragraphs": [f"Paragraph {i} of page {n}" for i in range(args.paragraphs)],
+            "files": [],
+            "tables": [],
+        })
+    writer.close()
+    elapsed = time.monotonic() - started
+
+    stats = writer.stats()
+    print(f"Wrote {stats['records']} page records ({stats['upserted']} upserted, {stats['modified']} modified, "
+          f"{stats['errors']} failed batches) in {elapsed:.2f}s: {stats['records'] / elapsed:.0f} records/sec")
+
+
+if __name__ == "__main__":
+    main()
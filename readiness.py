@@ -0,0 +1,92 @@
+import time
+import threading
+import traceback
+
+
+class Startup:
+    """
+    Load the app's heavy components in background threads so the HTTP server can bind at once.
+
+    Components are registered with add() and launched together by start(); components added
+    later (e.g. a per-worker warmup after a fork) run on the next start(). Each runs in its
+    own thread as soon as the components it needs are ready, so
+    independent ones (the index and the LLM) load concurrently. status() feeds /ready, and a
+    timing breakdown is printed once everything has finished.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._components = {}  # name -> status dict
+        self._done = {}  # name -> Event set once the component finished (or failed)
+        self._threads = []
+        self._logged = False
+
+    def add(self, name, load, after=()):
+        """Register a component: load() is called once every component in after is ready."""
+        self._components[name] = {"status": "pending", "after": list(after)}
+        self._done[name] = threading.Event()
+        self._threads.append(threading.Thread(target=self._load, args=(name, load, after),
+                                              name=f"startup-{name}", daemon=True))
+
+    def start(self):
+        """Start loading every component registered since the last start()."""
+        self.started = time.monotonic()
+        with self._lock:
+            self._logged = False
+        for thread in self._threads:
+            if thread.ident is None:
+                thread.start()
+
+    def _load(self, name, load, after):
+        component = self._components[name]
+        for dependency in after:
+            self._done[dependency].wait()
+        failed = [dependency for dependency in after if self._components[dependency]["status"] != "ready"]
+        started = time.monotonic()
+        component["waited_seconds"] = started - self.started
+        try:
+            if failed:
+                raise RuntimeError(f"needs {', '.join(failed)}")
+            component["status"] = "loading"
+            load()
+            component["status"] = "ready"
+        except Exception as e:
+            traceback.print_exc()
+            component["status"] = "failed"
+            component["error"] = str(e)
+        component["seconds"] = time.monotonic() - started
+        self._done[name].set()
+        if all(done.is_set() for done in self._done.values()):
+            self._log_timing()
+
+    def _log_timing(self):
+        with self._lock:
+            if self._logged:
+                return
+            self._logged = True
+        parts = [f"{name} {c['seconds']:.1f}s" + (f" (after {c['waited_seconds']:.1f}s)" if c["after"] else "")
+                 + ("" if c["status"] == "ready" else f" {c['status'].upper()}")
+                 for name, c in self._components.items()]
+        print(f"Startup: {', '.join(parts)}; {'ready' if self.is_ready() else 'NOT ready'} "
+              f"after {time.monotonic() - self.started:.1f}s")
+
+    def is_ready(self):
+        """True once every component loaded successfully."""
+        return all(component["status"] == "ready" for component in self._components.values())
+
+    def wait(self, timeout=None):
+        """Block until every component finished; returns is_ready()."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for done in list(self._done.values()):
+            done.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return self.is_ready()
+
+    def status(self):
+        """Per-component status, for the /ready endpoint."""
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": time.monotonic() - self.started,
+            "components": {name: {key: value for key, value in component.items() if key != "after"}
+                           for name, component in self._components.items()},
+        }
@@ -0,0 +1,284 @@
+import math
+import time
+import queue
+import threading
+from collections import Counter, deque
+
+
+class QueueFull(Exception):
+    """Raised by submit() when max_queued items are already waiting; retry_after estimates when to retry (seconds)."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Queue full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised by submit() when the item's deadline passed before its result was ready."""
+
+
+class _Pending:
+    """A submitted item waiting for its batch to be processed."""
+
+    def __init__(self, item, deadline=None):
+        self.item = item
+        self.deadline = deadline
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+    def expired(self, now):
+        return self.cancelled or (self.deadline is not None and now >= self.deadline)
+
+
+class _Call(_Pending):
+    """A function queued with call(), run on the worker thread when no submitted item waits."""
+
+
+class _Slot:
+    """A place held in a ConcurrencyLimit; release() may be called more than once."""
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        with self._limit._lock:
+            if self._released:
+                return
+            self._released = True
+        self._limit._release(time.monotonic() - self._started)
+
+
+class ConcurrencyLimit:
+    """
+    Admission control for work that is not batched by a BatchScheduler (e.g. streamed answers,
+    each decoded on its own thread): at most max_active slots are held at once, and acquire()
+    fails fast with QueueFull beyond that rather than letting the work pile up.
+    """
+
+    def __init__(self, max_active):
+        self.max_active = max_active
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._held = 0.0
+
+    def active(self):
+        """Slots currently held."""
+        return self._active
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from the mean time a slot is held (at least 1)."""
+        with self._lock:
+            held = self._held / self._completed if self._completed else 1.0
+        return max(1, math.ceil(held))
+
+    def acquire(self):
+        """Return a slot to release() once the work is done. Raises QueueFull when every slot is held."""
+        with self._lock:
+            if self._active >= self.max_active:
+                self._rejected += 1
+                full = True
+            else:
+                self._active += 1
+                full = False
+        if full:
+            raise QueueFull(self.retry_after())
+        return _Slot(self)
+
+    def _release(self, seconds):
+        with self._lock:
+            self._active -= 1
+            self._completed += 1
+            self._held += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_active": self.max_active,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "mean_held_ms": 1000.0 * self._held / self._completed if self._completed else 0.0,
+            }
+
+
+class BatchScheduler:
+    """
+    Collect items submitted from many threads into small batches and process them on one worker thread.
+
+    A batch is closed when it reaches max_batch_size or max_wait_ms after its first item arrived,
+    then process_batch(items) is called once and must return one result per item, in order.
+
+    Admission control: with max_queued set, submit() fails fast with QueueFull instead of
+    queueing more work than can be done in time. Items carry an optional deadline (time.monotonic()
+    value); those whose deadline passed while queued are dropped before processing, so no batch
+    is spent on a client that already gave up.
+
+    Low priority work that must run on the same thread (e.g. bulk generation, so the model has
+    a single user) goes through call(): it only runs while no submitted item is waiting, so
+    interactive batches wait for at most one such call.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=5.0, name="batch-scheduler", max_queued=0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queued = max_queued
+        self._queue = queue.Queue()
+        self._calls = deque()  # call()s taken off the queue, run when it is empty
+        self._calls_queued = 0  # call()s still in the queue, not counted by depth()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._rejected = 0
+        self._expired = 0
+        self._call_count = 0
+        self._busy = 0.0
+        self._batch_sizes = Counter()
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def depth(self):
+        """Items waiting for a batch."""
+        return max(0, self._queue.qsize() - self._calls_queued)
+
+    def retry_after(self):
+        """Seconds until the current queue is likely drained, from the mean batch duration (at least 1)."""
+        with self._stats_lock:
+            batch_seconds = self._busy / self._batches if self._batches else 1.0
+        return max(1, math.ceil(self.depth() / self.max_batch_size * batch_seconds))
+
+    def submit(self, item, deadline=None):
+        """
+        Queue item and block until its result is ready. Re-raises errors from process_batch.
+        Raises QueueFull when the queue is full and DeadlineExceeded once deadline has passed.
+        """
+        if self.max_queued and self.depth() >= self.max_queued:
+            with self._stats_lock:
+                self._rejected += 1
+            raise QueueFull(self.retry_after())
+        pending = _Pending(item, deadline)
+        self._queue.put(pending)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not pending.done.wait(timeout):
+            # The worker skips it if its batch has not started yet
+            pending.cancelled = True
+            raise DeadlineExceeded()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def call(self, fn):
+        """
+        Run fn() on the worker thread once no submitted item is waiting, block until it is done
+        and return its result. Re-raises errors from fn. Calls run one at a time, in order.
+        """
+        pending = _Call(fn)
+        with self._stats_lock:
+            self._calls_queued += 1
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _take(self, pending, batch):
+        """Add pending to batch, or drop it if its deadline has passed. Calls are set aside."""
+        if isinstance(pending, _Call):
+            with self._stats_lock:
+                self._calls_queued -= 1
+            self._calls.append(pending)
+        elif pending.expired(time.monotonic()):
+            pending.error = DeadlineExceeded()
+            pending.done.set()
+            with self._stats_lock:
+                self._expired += 1
+        else:
+            batch.append(pending)
+
+    def _next_batch(self):
+        """The next batch of submitted items, or an empty one when a call() can run instead."""
+        batch = []
+        while not batch:
+            if self._calls and self._queue.empty():
+                return batch
+            self._take(self._queue.get(), batch)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._take(self._queue.get(timeout=remaining), batch)
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_call(self, pending):
+        try:
+            pending.result = pending.item()
+        except Exception as e:
+            pending.error = e
+        finally:
+            pending.done.set()
+        with self._stats_lock:
+            self._call_count += 1
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                self._run_call(self._calls.popleft())
+                continue
+            started = time.monotonic()
+            try:
+                results = self.process_batch([pending.item for pending in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+            waits = [started - pending.submitted for pending in batch]
+            with self._stats_lock:
+                self._busy += time.monotonic() - started
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._total_wait += sum(waits)
+                self._max_wait_seen = max(self._max_wait_seen, max(waits))
+                if batch[0].error is not None:
+                    self._errors += 1
+
+    def stats(self):
+        """Return queue depth and batch-size statistics for tuning max_batch_size / max_wait_ms."""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queued": self.max_queued,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "items": self._items,
+                "failed_batches": self._errors,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "calls": self._call_count,
+                "mean_batch_ms": 1000.0 * self._busy / self._batches if self._batches else 0.0,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "mean_queue_wait_ms": 1000.0 * self._total_wait / self._items if self._items else 0.0,
+                "max_queue_wait_ms": 1000.0 * self._max_wait_seen,
+            }
@@ -1,8 +1,14 @@
 import os
 import json
-import time  # For adding delay
-import requests
-from pymongo import MongoClient
+import time
+import asyncio
+import hashlib
+import argparse
+import aiohttp
+from mongo_writer import MongoWriter
+from crawl_state import STATE_DB, CrawlState, body_hash
+from dedup import Deduplicator
+from corpus_store import CorpusStore
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 
@@ -14,20 +20,85 @@ base_url = "https://ihec.rnu.tn/fr"  # Replace with your target website
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")  # Use localhost if MongoDB is running locally
 MONGO_DB = os.environ.get("MONGO_DB", "ihec")
 
-# Delay between requests (in seconds)
+# Folder the page records are saved to, one JSON file per page (with --output files)
+OUTPUT_DIR = "scraped_data"
+SAVE_FILES = True
+
+# Compact corpus the page records are appended to (see corpus_store.py), opened by open_corpus()
+CORPUS_DIR = os.environ.get("CORPUS_FOLDER", "corpus")
+corpus = None
+
+# Page records written between two corpus flushes (flushed rows become visible to the bot)
+CORPUS_FLUSH_EVERY = 100
+
+# Crawl state for incremental re-crawls, and where each run's change-set is written
+CRAWL_STATE_DB = os.environ.get("CRAWL_STATE_DB", STATE_DB)
+CHANGES_FILE = "crawl_changes.json"
+
+# Drops paragraphs already kept by another page, opened by open_deduplicator()
+deduplicator = None
+DEDUP_REPORT_FILE = "dedup_report.json"
+
+# Shared MongoDB writer, opened by open_mongo_writer() (None when MongoDB is disabled or unreachable)
+mongo_writer = None
+
+# Streaming indexer feeding saved pages straight into the bot's index (see index_writer.py),
+# opened by open_index_writer()
+index_writer = None
+INDEX_FOLDER = os.environ.get("INDEX_FOLDER", "index_artifacts/")
+
+# Delay between requests to the same host (in seconds)
 REQUEST_DELAY = 2  # Adjust this value as needed
 
-def is_html_page(url):
+# Crawler settings
+CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "8"))  # Pages fetched in parallel
+REQUEST_TIMEOUT = 30  # Seconds per request
+MAX_RETRIES = 3  # Retries after a network error, 429 or 5xx
+RETRY_BACKOFF = 1.0  # Seconds before the first retry, doubled after each attempt
+
+# Links with these extensions are recorded as files instead of being crawled
+FILE_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.doc', '.docx')
+
+# lxml parses several times faster than the built-in parser, use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = os.environ.get("HTML_PARSER", "lxml")
+except ImportError:
+    HTML_PARSER = os.environ.get("HTML_PARSER", "html.parser")
+
+class TokenBucket:
     """
-    Check if the URL points to a valid HTML page by inspecting the Content-Type header.
+    Politeness limiter for one host: allows `rate` requests per second on average,
+    with bursts of up to `capacity` requests.
     """
-    try:
-        response = requests.head(url, allow_redirects=True)
-        content_type = response.headers.get('Content-Type', '')
-        return 'text/html' in content_type
-    except Exception as e:
-        print(f"Error checking {url}: {e}")
-        return False
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so requests to a host go out in order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# One limiter per host
+host_limiters = {}
+
+def get_limiter(url, rate):
+    host = urlparse(url).netloc
+    if host not in host_limiters:
+        host_limiters[host] = TokenBucket(rate)
+    return host_limiters[host]
 
 def extract_table_data(table):
     """
@@ -50,100 +121,410 @@ def extract_table_data(table):
 
     return table_data
 
-def scrape_page(url, topic, path):
-    if url in visited_urls:
+async def fetch_page(session, url, rate, headers=None):
+    """
+    GET url through the host's rate limiter, retrying network errors, 429 and 5xx with backoff.
+    Returns (status, text, response headers): status is None if the page could not be fetched,
+    and text is None unless the page is HTML and was modified (not a 304).
+    """
+    limiter = get_limiter(url, rate)
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            async with session.get(url, headers=headers, allow_redirects=True) as response:
+                if response.status == 429 or response.status >= 500:
+                    error = f"HTTP {response.status}"
+                else:
+                    response.raise_for_status()
+                    if response.status == 304:
+                        return 304, None, response.headers
+                    # Check the Content-Type of the GET itself instead of sending a HEAD first
+                    if 'text/html' not in response.headers.get('Content-Type', ''):
+                        print(f"Skipping non-HTML page: {url}")
+                        return response.status, None, response.headers
+                    # Decode as UTF-8 regardless of the announced charset
+                    return response.status, await response.text(encoding='utf-8', errors='replace'), response.headers
+        except aiohttp.ClientResponseError as e:
+            print(f"Error scraping {url}: {e}")
+            return e.status, None, {}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+
+        if attempt < MAX_RETRIES:
+            delay = RETRY_BACKOFF * 2 ** attempt
+            print(f"Retrying {url} in {delay:.0f}s ({error})")
+            await asyncio.sleep(delay)
+    print(f"Error scraping {url}: giving up after {MAX_RETRIES + 1} attempts ({error})")
+    return None, None, {}
+
+def extract_page(url, topic, path, html):
+    """
+    Parse a page once and return (record, links): one record holding all its paragraphs
+    plus the page's file links and tables, and the internal links as (url, topic, path) tuples.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+
+    # Extract all paragraphs
+    paragraphs = []
+    for p in soup.find_all('p'):
+        paragraph_text = p.get_text(strip=True)
+        if paragraph_text:
+            paragraphs.append(paragraph_text)
+
+    # Extract file links (e.g., PDFs, images) and internal links in the same pass
+    files = []
+    links = []
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        full_url = urljoin(url, href)
+        if any(href.endswith(ext) for ext in FILE_EXTENSIONS):
+            files.append({"name": os.path.basename(full_url), "url": full_url})
+        elif full_url.startswith(base_url):
+            # Extract the new topic and path
+            parsed_url = urlparse(full_url)
+            new_topic = parsed_url.path.strip('/').split('/')[-1]
+            new_path = parsed_url.path.strip('/')
+            links.append((full_url, new_topic, new_path))
+
+    # Extract tables
+    table_data = [extract_table_data(table) for table in soup.find_all('table')]
+
+    record = {
+        "url": url,
+        "topic": topic,
+        "path": path,
+        "paragraphs": paragraphs,
+        "files": files,
+        "tables": table_data  # Include table data in the JSON
+    }
+    return record, links
+
+def page_file_name(record):
+    """File name of a page record, stable across crawls so a changed page overwrites its old file."""
+    return f"{record['topic']}_{hashlib.sha1(record['url'].encode('utf-8')).hexdigest()[:12]}.json"
+
+def save_page(record):
+    """Save a page record to the corpus (or scraped_data/), MongoDB and the index, returning its file name."""
+    file_name = page_file_name(record)
+    if corpus is not None:
+        # Appended to the current shard, keyed by the file name it would have had
+        content = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        corpus.put(file_name, content)
+    else:
+        content = json.dumps(record, indent=4, ensure_ascii=False)  # Ensure non-ASCII characters are preserved
+        if SAVE_FILES:
+            # Save JSON to a file with UTF-8 encoding
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            with open(os.path.join(OUTPUT_DIR, file_name), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+    # Queue the page for the next bulk upsert into MongoDB
+    if mongo_writer is not None:
+        mongo_writer.write(record)
+    # Indexed with the same text as saved, so the bot's own sync sees the file as unchanged.
+    # Blocks while the indexer is behind, which slows the crawl down
+    if index_writer is not None:
+        index_writer.write(file_name, content)
+    return file_name
+
+def remove_page(url, file_name):
+    """Delete a page's record from the corpus (or scraped_data/), MongoDB and the index."""
+    if mongo_writer is not None:
+        mongo_writer.remove(url)
+    # Pages recorded by older crawls without content have no file name
+    if not file_name:
         return
-    visited_urls.add(url)
+    if corpus is not None:
+        corpus.delete(file_name)
+    elif os.path.isfile(os.path.join(OUTPUT_DIR, file_name)):
+        os.remove(os.path.join(OUTPUT_DIR, file_name))
+    if index_writer is not None:
+        index_writer.remove(file_name)
+
+def process_page(url, topic, path, html):
+    """
+    Extract and save a fetched page. Returns (file name, internal links to crawl next).
+    A page left without paragraphs or tables is not saved, and the record an earlier crawl
+    saved for it is deleted; it keeps its file name, so the change-set lists it.
+    """
+    record, links = extract_page(url, topic, path, html)
+    if deduplicator is not None:
+        deduplicator.filter_record(record)
+    if record["paragraphs"] or record["tables"]:
+        return save_page(record), links
+    remove_page(url, page_file_name(record))
+    return page_file_name(record), links
+
+def apply_changes(changes):
+    """Delete the records of removed pages (files or corpus, MongoDB, index) and write the change-set for the indexer."""
+    for page in changes["removed"]:
+        remove_page(page["url"], page["file"])
+        # The paragraphs it kept go to the next page that has them
+        if deduplicator is not None:
+            deduplicator.release(page["url"])
+    if corpus is not None:
+        corpus.flush()
+    # "files" can be posted as is to the bot's /admin/reindex endpoint
+    changes["files"] = sorted({page["file"] for kind in ("added", "updated", "removed")
+                               for page in changes[kind] if page["file"]})
+    with open(CHANGES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(changes, f, indent=4, ensure_ascii=False)
+    print(f"Changes: {len(changes['added'])} added, {len(changes['updated'])} updated, "
+          f"{len(changes['removed'])} removed pages (saved to {CHANGES_FILE})")
+
+def saved_records():
+    """Yield the page records saved by earlier crawls, from the corpus or scraped_data/."""
+    if corpus is not None:
+        for file_name in corpus.keys():
+            yield corpus.get(file_name)
+        return
+    if not os.path.isdir(OUTPUT_DIR):
+        return
+    for file_name in os.listdir(OUTPUT_DIR):
+        try:
+            with open(os.path.join(OUTPUT_DIR, file_name), 'r', encoding='utf-8') as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+def open_deduplicator(seed=False):
+    """
+    Start dropping repeated paragraphs. With seed, the pages saved by earlier crawls are
+    registered first, since an incremental crawl does not re-parse unchanged pages.
+    Open the corpus first so they are read from it, and the MongoDB writer to persist sources.
+    """
+    global deduplicator
+    deduplicator = Deduplicator()
+    if seed:
+        copies = []
+        for record in saved_records():
+            if isinstance(record, dict) and "paragraphs" in record:
+                if record.get("duplicate_of"):
+                    copies.append((record.get("url") or record.get("path", ""), record.get("path", ""),
+                                   record["duplicate_of"]))
+                deduplicator.filter_record(record)
+        # Once every kept paragraph is registered
+        for owner, source, keys in copies:
+            deduplicator.add_copies(owner, source, keys)
+        deduplicator.reset_counts()
+    # The pages a paragraph was dropped from are kept on its MongoDB document
+    if mongo_writer is not None:
+        deduplicator.on_duplicate = mongo_writer.add_source
+
+def invalidate_released(state):
+    """
+    Make the crawl parse again the pages that dropped a paragraph no page keeps any more
+    (see Deduplicator.release), even if they did not change: the next one keeps it.
+    """
+    if state is not None and deduplicator is not None:
+        state.invalidate(deduplicator.take_released())
 
-    print(f"Scraping: {url}")
+def close_deduplicator():
+    """Write the deduplication report."""
+    global deduplicator
+    if deduplicator is None:
+        return
+    report = deduplicator.report()
+    with open(DEDUP_REPORT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"Deduplication: {report['kept']} paragraphs kept, {report['dropped_exact']} exact and "
+          f"{report['dropped_near']} near duplicates dropped ({100 * report['dropped_ratio']:.1f}%)")
+    deduplicator = None
+
+def open_corpus(folder=CORPUS_DIR):
+    """Append page records to the corpus in folder instead of writing one file per page."""
+    global corpus
+    corpus = CorpusStore(folder, flush_every=CORPUS_FLUSH_EVERY)
+
+def close_corpus():
+    """Flush the rows still buffered and close the corpus."""
+    global corpus
+    if corpus is None:
+        return
+    corpus.close()
+    print(f"Corpus: {len(corpus)} pages in {corpus.folder}")
+    corpus = None
 
+def open_mongo_writer():
+    """Connect the shared MongoDB writer, or disable MongoDB output if the server is unreachable."""
+    global mongo_writer
     try:
-        # Fetch the page with explicit UTF-8 encoding
-        response = requests.get(url)
-        response.encoding = 'utf-8'  # Ensure UTF-8 encoding
-        response.raise_for_status()
-
-        # Check if the page is HTML
-        if not is_html_page(url):
-            print(f"Skipping non-HTML page: {url}")
-            return
-
-        # Parse the page with BeautifulSoup using UTF-8 encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extract all paragraphs
-        paragraphs = soup.find_all('p')
-        for i, p in enumerate(paragraphs):
-            paragraph_text = p.get_text(strip=True)
-            if not paragraph_text:
-                continue
-
-            # Extract file links (e.g., PDFs, images)
-            files = []
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if any(href.endswith(ext) for ext in ['.pdf', '.png', '.jpg', '.jpeg', '.doc', '.docx']):
-                    file_url = urljoin(url, href)
-                    file_name = os.path.basename(file_url)
-                    files.append({"name": file_name, "url": file_url})
-
-            # Extract tables
-            tables = soup.find_all('table')
-            table_data = [extract_table_data(table) for table in tables]
-
-            # Create JSON data for the paragraph
-            data = {
-                "topic": topic,
-                "path": path,
-                "text": paragraph_text,
-                "files": files,
-                "tables": table_data  # Include table data in the JSON
-            }
-
-            # Save JSON to a file with UTF-8 encoding
-            output_dir = "scraped_data"
-            os.makedirs(output_dir, exist_ok=True)
-            file_name = f"{output_dir}/{topic}_{len(visited_urls)}_{i}.json"
-            with open(file_name, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)  # Ensure non-ASCII characters are preserved
-
-            # Insert data into MongoDB
-            try:
-                client = MongoClient(MONGO_URI)
-                db = client[MONGO_DB]
-                site_collection = db.web
-                site_collection.insert_one(data)
-                print(f"Inserted data into MongoDB for {url}")
-            except Exception as e:
-                print(f"Error inserting data into MongoDB: {e}")
-            finally:
-                client.close()  # Close the MongoDB connection
-
-        # Recursively scrape all internal links
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            full_url = urljoin(url, href)
-
-            # Ensure the link is from the same domain and not already visited
-            if full_url.startswith(base_url) and full_url not in visited_urls:
-                # Extract the new topic and path
-                parsed_url = urlparse(full_url)
-                new_topic = parsed_url.path.strip('/').split('/')[-1]
-                new_path = parsed_url.path.strip('/')
-
-                # Recursively scrape the new page
-                time.sleep(REQUEST_DELAY)  # Add delay between requests
-                scrape_page(full_url, new_topic, new_path)
-
+        mongo_writer = MongoWriter(MONGO_URI, MONGO_DB)
     except Exception as e:
-        print(f"Error scraping {url}: {e}")
+        print(f"MongoDB unavailable, writing to scraped_data/ only: {e}")
+        mongo_writer = None
 
-# Start scraping from the base URL
-parsed_base_url = urlparse(base_url)
-initial_topic = parsed_base_url.path.strip('/').split('/')[-1]
-initial_path = parsed_base_url.path.strip('/')
-
-scrape_page(base_url, initial_topic, initial_path)
+def close_mongo_writer():
+    """Flush pending MongoDB writes and report throughput."""
+    global mongo_writer
+    if mongo_writer is None:
+        return
+    mongo_writer.close()
+    stats = mongo_writer.stats()
+    print(f"MongoDB: {stats['records']} pages written ({stats['upserted']} new, {stats['modified']} updated, "
+          f"{stats['deleted']} deleted documents, {stats['errors']} failed batches), {stats['records_per_second']:.0f} pages/sec")
+    mongo_writer = None
+
+def open_index_writer(folder=INDEX_FOLDER):
+    """Index every saved page as the crawl goes, into the bot's index folder."""
+    global index_writer
+    # Heavy imports (torch, FAISS, the models) only when streaming into the index
+    from index_writer import IndexWriter, open_live_index
+    index_writer = IndexWriter(open_live_index(folder))
+
+def close_index_writer():
+    """Index the pages still queued and report freshness."""
+    global index_writer
+    if index_writer is None:
+        return
+    index_writer.close()
+    stats = index_writer.stats()
+    print(f"Index: {stats['pages']} pages ({stats['passages']} passages) indexed in {stats['batches']} batches, "
+          f"{stats['removed']} removed, {stats['errors']} failed batches, {stats['passages_per_second']:.0f} passages/sec; "
+          f"searchable {stats['mean_freshness_seconds']:.1f}s after scraping on average "
+          f"(max {stats['max_freshness_seconds']:.1f}s), crawl held back {stats['blocked_seconds']:.1f}s")
+    index_writer = None
+
+async def crawl(start_url, concurrency=CONCURRENCY, rate=1 / REQUEST_DELAY, state=None, resume=True):
+    """
+    Crawl the site breadth-first from start_url with `concurrency` workers sharing one
+    HTTP session, at most `rate` requests per second per host. Returns crawl statistics.
+    Call open_corpus() first to append pages to the corpus instead of scraped_data/,
+    open_mongo_writer() to also write them to MongoDB, and open_index_writer() to index them
+    into the bot's index while crawling.
+
+    With a CrawlState, pages are fetched conditionally and only re-parsed and re-written
+    when they changed, an interrupted crawl is resumed (unless resume is False), and a
+    completed crawl writes its change-set to CHANGES_FILE.
+    """
+    parsed_start_url = urlparse(start_url)
+    start = (start_url, parsed_start_url.path.strip('/').split('/')[-1], parsed_start_url.path.strip('/'))
+    frontier = asyncio.Queue()
+    queued = [start]
+    if state is not None:
+        saved_frontier, visited = state.start_run(resume)
+        invalidate_released(state)
+        visited_urls.update(visited)
+        if saved_frontier:
+            queued = saved_frontier
+        else:
+            state.enqueue(queued)
+    for link in queued:
+        frontier.put_nowait(link)
+        visited_urls.add(link[0])
+    fetched = pages = unchanged = 0
+
+    started = time.monotonic()
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=concurrency)  # Connections are reused across requests
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+
+        async def worker():
+            nonlocal fetched, pages, unchanged
+            while True:
+                url, topic, path = await frontier.get()
+                try:
+                    print(f"Scraping: {url}")
+                    known = state.get_page(url) if state is not None else None
+                    headers = state.conditional_headers(url) if known is not None else None
+                    status, html, response_headers = await fetch_page(session, url, rate, headers)
+                    fetched += 1
+
+                    links = []
+                    if known is not None and (status is None or status == 304 or
+                                              (html is not None and body_hash(html) == known["content_hash"])):
+                        # Not modified (or unreachable this time): keep the page and follow its known links
+                        state.touch(url)
+                        links = known["links"]
+                        unchanged += 1
+                    elif html is not None:
+                        pages += 1
+                        # Parsing and writing block, keep them off the event loop
+                        file_name, links = await asyncio.to_thread(process_page, url, topic, path, html)
+                        if state is not None:
+                            state.record(url, response_headers.get('ETag'), response_headers.get('Last-Modified'),
+                                         body_hash(html), file_name, links)
+                            invalidate_released(state)
+
+                    new_links = [link for link in links if link[0] not in visited_urls]
+                    visited_urls.update(link[0] for link in new_links)
+                    if state is not None and new_links:
+                        state.enqueue(new_links)
+                    for link in new_links:
+                        frontier.put_nowait(link)
+                except Exception as e:
+                    print(f"Error scraping {url}: {e}")
+                finally:
+                    if state is not None:
+                        state.dequeue(url)
+                    frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        await frontier.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    elapsed = time.monotonic() - started
+    stats = {
+        "fetched": fetched,
+        "pages": pages,
+        "unchanged": unchanged,
+        "seconds": elapsed,
+        "pages_per_second": fetched / elapsed if elapsed else 0.0,
+        "concurrency": concurrency,
+    }
+    print(f"Crawled {fetched} pages ({pages} parsed, {unchanged} unchanged) in {elapsed:.1f}s "
+          f"({stats['pages_per_second']:.2f} pages/sec, concurrency {concurrency})")
+
+    # Only a completed crawl knows which pages disappeared
+    if state is not None:
+        stats["changes"] = state.finish_run()
+        apply_changes(stats["changes"])
+        invalidate_released(state)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl the IHEC website into a page corpus and MongoDB.")
+    parser.add_argument("--url", default=base_url, help="page to start from; only links under it are followed")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="pages fetched in parallel")
+    parser.add_argument("--rate", type=float, default=1 / REQUEST_DELAY, help="requests per second per host")
+    parser.add_argument("--output", choices=("corpus", "files", "none"), default="corpus",
+                        help=f"append pages to the {CORPUS_DIR}/ corpus, write one JSON file each to {OUTPUT_DIR}/, "
+                             "or keep them only in MongoDB and the index")
+    parser.add_argument("--no-mongo", action="store_true", help="do not write pages to MongoDB")
+    parser.add_argument("--index", action="store_true",
+                        help="index pages into the bot's index as they are scraped (a running bot reloads it); "
+                             "with --output none, run the bot with SYNC_DOCUMENTS=0")
+    parser.add_argument("--index-folder", default=INDEX_FOLDER, help="index folder for --index")
+    parser.add_argument("--state", default=CRAWL_STATE_DB, help="SQLite crawl state for incremental re-crawls")
+    parser.add_argument("--no-state", action="store_true", help="refetch and rewrite every page")
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming an interrupted crawl")
+    parser.add_argument("--no-dedup", action="store_true", help="keep paragraphs repeated across pages")
+    args = parser.parse_args()
+
+    if args.output == "corpus":
+        open_corpus()
+    SAVE_FILES = args.output == "files"
+    if not args.no_mongo:
+        open_mongo_writer()
+    if args.index:
+        open_index_writer(args.index_folder)
+    crawl_state = None if args.no_state else CrawlState(args.state)
+    if not args.no_dedup:
+        open_deduplicator(seed=crawl_state is not None)
+
+    # Start scraping from the base URL
+    base_url = args.url
+    try:
+        asyncio.run(crawl(base_url, args.concurrency, args.rate, crawl_state, resume=not args.restart))
+    finally:
+        close_corpus()
+        close_mongo_writer()
+        close_index_writer()
+        close_deduplicator()
+        if crawl_state is not None:
+            crawl_state.close()
 
 # import os
 # import json
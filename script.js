@@ -10,6 +10,7 @@ const closeChatbot = document.querySelector("#close-chatbot");
 // API setup
 // const API_KEY = "PASTE-YOUR-API-KEY";
 const API_URL = "http://127.0.0.1:5000/chat"
+const STREAM_API_URL = "http://127.0.0.1:5000/chat/stream"
 // Initialize user message and file data
 const userData = {
   message: null,
@@ -48,18 +49,64 @@ const generateBotResponse = async (incomingMessageDiv) => {
   };
 
   try {
-    // Fetch bot response from API
-    const response = await fetch(API_URL, requestOptions);
-    const data = await response.json();
+    // Fetch bot response from the streaming API
+    const response = await fetch(STREAM_API_URL, requestOptions);
 
-    if (!response.ok) throw new Error(data.error || "An error occurred while processing your request.");
+    if (!response.ok) {
+      const data = await response.json();
+      throw new Error(data.error || "An error occurred while processing your request.");
+    }
 
-    // Extract the answer and sources from the response
-    const apiAnswer = data.answer;
-    const apiSources = data.sources;
+    let apiAnswer = "";
+    let firstToken = true;
+
+    // Handle one Server-Sent Event from the stream
+    const handleEvent = (event, data) => {
+      if (event === "sources") {
+        // Display each source snippet as a separate message
+        data.forEach((snippet, index) => {
+          const sourceContent = `<div class="source-snippet">Source ${index + 1}: ${snippet}</div>`;
+          const sourceMessageDiv = createMessageElement(sourceContent, "bot-source");
+          chatBody.appendChild(sourceMessageDiv);
+        });
+      } else if (event === "token") {
+        // Replace the thinking indicator with the answer as soon as the first token arrives
+        if (firstToken) {
+          incomingMessageDiv.classList.remove("thinking");
+          firstToken = false;
+        }
+        apiAnswer += data.text;
+        messageElement.innerText = apiAnswer;
+        chatBody.scrollTo({ top: chatBody.scrollHeight, behavior: "smooth" });
+      } else if (event === "done") {
+        apiAnswer = data.answer;
+        messageElement.innerText = apiAnswer;
+      } else if (event === "error") {
+        throw new Error(data.error);
+      }
+    };
 
-    // Display the answer in the message element
-    messageElement.innerText = apiAnswer;
+    // Read the event stream, splitting it into "event:/data:" blocks
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        block.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (data) handleEvent(event, JSON.parse(data));
+      }
+    }
 
     // Add bot response to chat history (optional)
     chatHistory.push({
@@ -67,15 +114,6 @@ const generateBotResponse = async (incomingMessageDiv) => {
       parts: [{ text: apiAnswer }],
     });
 
-    // Display each source snippet as a separate message
-    if (apiSources && apiSources.length > 0) {
-      apiSources.forEach((snippet, index) => {
-        const sourceContent = `<div class="source-snippet">Source ${index + 1}: ${snippet}</div>`;
-        const sourceMessageDiv = createMessageElement(sourceContent, "bot-source");
-        chatBody.appendChild(sourceMessageDiv);
-      });
-    }
-
   } catch (error) {
     // Handle error in API response
     console.error('Error:', error);
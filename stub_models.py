@@ -0,0 +1,139 @@
+"""
+Tiny stand-ins for the tokenizer, embedding model and LLM, selected with INFERENCE_BACKEND=stub.
+
+They need no download and almost no CPU, so the whole app (retrieval, batching, caching, HTTP)
+can be load-tested offline, e.g. in CI (see bench_load.py). Answers are meaningless: the
+"LLM" echoes the end of its input, taking STUB_TOKEN_MS per generated token to mimic decoding.
+"""
+import os
+import re
+import time
+import zlib
+import threading
+import numpy as np
+import torch
+
+STUB_DIMENSION = 64
+STUB_ANSWER_TOKENS = 20
+STUB_TOKEN_MS = float(os.environ.get("STUB_TOKEN_MS", "2"))
+
+_WORD = re.compile(r"\S+")
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with a vocabulary grown on the fly; 0 is padding, 1 end of sequence."""
+
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._words = ["<pad>", "</s>"]
+
+    def _id(self, word):
+        with self._lock:
+            word_id = self._ids.get(word)
+            if word_id is None:
+                word_id = self._ids[word] = len(self._words)
+                self._words.append(word)
+            return word_id
+
+    def _encode(self, text, add_special_tokens, return_offsets_mapping):
+        matches = list(_WORD.finditer(text))
+        ids = [self._id(match.group()) for match in matches]
+        offsets = [match.span() for match in matches]
+        if add_special_tokens:
+            ids.append(self.eos_token_id)
+            offsets.append((len(text), len(text)))
+        return ids, offsets
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, **kwargs):
+        texts = [text] if isinstance(text, str) else text
+        encoded = [self._encode(t, add_special_tokens, return_offsets_mapping) for t in texts]
+        result = {"input_ids": [ids for ids, _ in encoded]}
+        if return_offsets_mapping:
+            result["offset_mapping"] = [offsets for _, offsets in encoded]
+        if isinstance(text, str):
+            result = {key: value[0] for key, value in result.items()}
+        return result
+
+    def pad(self, encoded, return_tensors="pt"):
+        rows = encoded["input_ids"]
+        width = max((len(row) for row in rows), default=0)
+        input_ids = torch.zeros((len(rows), width), dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, :len(row)] = torch.tensor(row, dtype=torch.long)
+            attention_mask[i, :len(row)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    def decode(self, ids, skip_special_tokens=True, **kwargs):
+        if isinstance(ids, torch.Tensor):
+            ids = ids.tolist()
+        special = (self.pad_token_id, self.eos_token_id) if skip_special_tokens else ()
+        return " ".join(self._words[i] for i in ids if i not in special)
+
+    def batch_decode(self, sequences, skip_special_tokens=True, **kwargs):
+        return [self.decode(ids, skip_special_tokens) for ids in sequences]
+
+
+class StubEmbedder:
+    """Hashed bag-of-words vectors: texts sharing words get similar vectors."""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer or StubTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return STUB_DIMENSION
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.zeros((len(texts), STUB_DIMENSION), dtype="float32")
+        for i, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                vectors[i, zlib.crc32(word.encode("utf-8")) % STUB_DIMENSION] += 1.0
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+class StubGenerator:
+    """'Generates' the last STUB_ANSWER_TOKENS input tokens of each row, in the same batch."""
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=STUB_ANSWER_TOKENS, streamer=None,
+                 max_time=None, stopping_criteria=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = (input_ids != StubTokenizer.pad_token_id).long()
+        length = min(max_new_tokens, STUB_ANSWER_TOKENS)
+        answers = []
+        for row, mask in zip(input_ids, attention_mask):
+            tokens = row[mask.bool()]
+            tokens = tokens[tokens != StubTokenizer.eos_token_id][-length:]
+            answers.append(tokens.tolist() + [StubTokenizer.eos_token_id])
+
+        # Decoder start token, then the answer tokens, padded to the longest answer
+        width = 1 + max((len(answer) for answer in answers), default=0)
+        outputs = torch.zeros((len(answers), width), dtype=torch.long)
+        for i, answer in enumerate(answers):
+            outputs[i, 1:1 + len(answer)] = torch.tensor(answer, dtype=torch.long)
+
+        started = time.monotonic()
+        if streamer is not None:
+            streamer.put(outputs[:, :1])
+        for step in range(1, width):
+            # Like the real model, stop decoding once max_time seconds have passed or a criterion says so
+            if max_time is not None and time.monotonic() - started > max_time:
+                outputs = outputs[:, :step]
+                break
+            if stopping_criteria is not None and bool(stopping_criteria(outputs[:, :step], None).all()):
+                outputs = outputs[:, :step]
+                break
+            # One decoding step costs the same for the whole batch, like the real model
+            time.sleep(STUB_TOKEN_MS / 1000.0)
+            if streamer is not None:
+                streamer.put(outputs[:, step])
+        if streamer is not None:
+            streamer.end()
+        return outputs
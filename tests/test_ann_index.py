@@ -0,0 +1,19 @@
+from ann_index import DEFAULT_INDEX_CONFIG, index_config_from_env
+
+ENVIRONMENT = ("INDEX_TYPE", "INDEX_METRIC", "IVF_NLIST", "PQ_M", "HNSW_M", "IVF_NPROBE", "HNSW_EF_SEARCH",
+               "RETRIEVAL_MODE", "RETRIEVAL_CANDIDATES", "DENSE_WEIGHT")
+
+
+def test_config_from_env_defaults(monkeypatch):
+    for name in ENVIRONMENT:
+        monkeypatch.delenv(name, raising=False)
+    assert index_config_from_env() == DEFAULT_INDEX_CONFIG
+    assert index_config_from_env()["retrieval"] == "dense"
+
+
+def test_config_from_env_overrides(monkeypatch):
+    monkeypatch.setenv("INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("RETRIEVAL_MODE", "rrf")
+    monkeypatch.setenv("IVF_NPROBE", "4")
+    config = index_config_from_env()
+    assert (config["type"], config["retrieval"], config["nprobe"]) == ("hnsw", "rrf", 4)
@@ -0,0 +1,12 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+
+
+def test_trivial_variants_share_an_entry():
+    cache = AnswerCache(4)
+    cache.put("Quand ont lieu les examens ?", np.ones(4), "en juin", 0)
+    assert cache.lookup_exact("quand ont lieu   les EXAMENS", 0) == "en juin"
+    assert cache.lookup_exact("Quand ont lieu les éxamens?", 0) == "en juin"
+    # Another index version drops the entry
+    assert cache.lookup_exact("Quand ont lieu les examens ?", 1) is None
@@ -0,0 +1,29 @@
+import time
+
+from batch_writer import BatchWriter
+
+
+class RecordingWriter(BatchWriter):
+    def __init__(self, batch_size, flush_interval, max_queued=0):
+        super().__init__("recording-writer", batch_size, flush_interval, max_queued)
+        self.batches = []
+        self.start()
+
+    def _write_batch(self, batch):
+        self.batches.append(batch)
+
+
+def test_batches_are_cut_by_size_and_flushed_on_stop():
+    writer = RecordingWriter(batch_size=3, flush_interval=60)
+    for item in range(7):
+        writer.put(item)
+    writer.stop()
+    assert writer.batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_partial_batch_is_flushed_after_the_interval():
+    writer = RecordingWriter(batch_size=100, flush_interval=0.05)
+    writer.put("a")
+    time.sleep(0.5)
+    assert writer.batches == [["a"]]
+    writer.stop()
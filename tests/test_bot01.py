@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import threading
+import importlib
+
+import pytest
+
+import stub_models
+from answer_cache import AnswerCache
+from readiness import Startup
+from scheduler import BatchScheduler, ConcurrencyLimit
+
+QUESTIONS = [f"Quand a lieu l'examen numéro {i} ?" for i in range(20)]
+
+
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
+    """bot01 running on the stub models over a few scraped-style records, loaded once per module."""
+    folder = tmp_path_factory.mktemp("bot")
+    documents = folder / "documents"
+    documents.mkdir()
+    for i, question in enumerate(QUESTIONS):
+        record = {"url": f"https://ihec.rnu.tn/test/{i}", "topic": f"test {i}",
+                  "paragraphs": [question, f"Réponse de test numéro {i} : le lundi {i} juin."]}
+        (documents / f"test_{i}.json").write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+    environ = dict(os.environ)
+    os.environ.update({
+        "INFERENCE_BACKEND": "stub",
+        "EMBED_BACKEND": "stub",
+        "DOCUMENTS_FOLDER": str(documents),
+        "CORPUS_FOLDER": str(documents),
+        "INDEX_FOLDER": str(folder / "index"),
+        "CACHE_MAX_ENTRIES": "0",
+    })
+    try:
+        bot01 = importlib.import_module("bot01")
+        assert bot01.startup.wait(120), bot01.startup.status()
+        yield bot01
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def stream_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "stream-generate"]
+
+
+def test_stream_slot_is_released_on_disconnect(bot, monkeypatch):
+    monkeypatch.setattr(stub_models, "STUB_TOKEN_MS", 100)
+    monkeypatch.setattr(bot, "stream_limit", ConcurrencyLimit(1))
+    client = bot.app.test_client()
+    for question in QUESTIONS[:3]:
+        response = client.post("/chat/stream", json={"question": question}, buffered=False)
+        assert response.status_code == 200
+        events = iter(response.response)
+        assert next(events).startswith(b"event: sources")
+        assert next(events).startswith(b"event: token")
+        # The client goes away mid-answer: generation stops at once, before the slot is given back
+        started = time.monotonic()
+        response.close()
+        assert time.monotonic() - started < 0.5
+        assert bot.stream_limit.active() == 0
+        assert stream_threads() == []
+
+
+def bulk_cached(client, questions):
+    response = client.post("/chat/batch", json={"questions": questions})
+    assert response.status_code == 200
+    return [json.loads(line)["cached"] for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize("keep", [False, True])
+def test_cached_answers_follow_index_additions(bot, monkeypatch, keep):
+    monkeypatch.setattr(bot, "answer_cache", AnswerCache(bot.live_index.dimension, 10))
+    monkeypatch.setattr(bot, "CACHE_KEEP_ON_ADDITIONS", keep)
+    client = bot.app.test_client()
+    assert bulk_cached(client, QUESTIONS[:1]) == [False]
+    assert bulk_cached(client, QUESTIONS[:1]) == [True]
+
+    # A newly crawled page drops the cached answers, unless they are kept on additions
+    record = {"url": f"https://ihec.rnu.tn/added/{keep}", "topic": "ajout", "paragraphs": ["Nouvelle page."]}
+    bot.live_index.update_files({f"added_{keep}.json": json.dumps(record, ensure_ascii=False)})
+    assert bulk_cached(client, QUESTIONS[:1]) == [keep]
+
+
+def test_ready_once_every_component_is_loaded(bot, monkeypatch):
+    client = bot.app.test_client()
+    assert client.get("/ready").status_code == 200
+    assert set(client.get("/ready").get_json()["components"]) >= {"embeddings", "tokenizer", "index", "llm", "warmup"}
+
+    # While a component is still loading the server answers, but is not ready
+    loaded = threading.Event()
+    starting = Startup()
+    starting.add("index", loaded.wait)
+    starting.add("warmup", lambda: None, after=("index",))
+    starting.start()
+    monkeypatch.setattr(bot, "startup", starting)
+    assert client.get("/health").status_code == 200
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["components"]["warmup"]["status"] == "pending"
+    response = client.post("/chat", json={"question": QUESTIONS[0]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+    loaded.set()
+    assert starting.wait(5)
+    assert client.get("/ready").status_code == 200
+    assert client.post("/chat", json={"question": QUESTIONS[0]}).status_code == 200
+
+
+def metric_value(client, name, **labels):
+    """Value of one sample on /metrics, the pid label aside; 0 if it is not there yet."""
+    text = client.get("/metrics").get_data(as_text=True)
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}\{{([^}}]*)\}} (\S+)", line)
+        if match and all(f'{key}="{value}"' in match.group(1).split(",") for key, value in labels.items()):
+            return float(match.group(2))
+    return 0.0
+
+
+def test_answer_stages_are_timed_and_counted(bot):
+    client = bot.app.test_client()
+    generated = metric_value(client, "ihec_chat_stage_seconds_count", stage="generate")
+    answered = metric_value(client, "ihec_chat_requests_total", endpoint="chat", status="200")
+
+    response = client.post("/chat?timings=1", json={"question": QUESTIONS[5]})
+    assert response.status_code == 200
+    assert {"encode", "search", "generate", "queue", "total"} <= set(response.get_json()["timings"])
+    assert "generate;dur=" in response.headers["Server-Timing"]
+
+    assert metric_value(client, "ihec_chat_stage_seconds_count", stage="generate") == generated + 1
+    assert metric_value(client, "ihec_chat_requests_total", endpoint="chat", status="200") == answered + 1
+    assert metric_value(client, "ihec_chat_output_tokens_total") > 0
+
+
+def test_bulk_answers_stream_as_ndjson(bot, monkeypatch):
+    threads = []
+    generate = bot.gen_model.generate
+    monkeypatch.setattr(bot.gen_model, "generate", lambda *args, **kwargs: (
+        threads.append(threading.current_thread().name) or generate(*args, **kwargs)))
+    client = bot.app.test_client()
+    body = "\n".join(json.dumps({"question": question}) for question in [QUESTIONS[7], " ", QUESTIONS[8]]) + "\n"
+    response = client.post("/chat/batch?cache=0", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = {line["index"]: line for line in map(json.loads, response.get_data(as_text=True).splitlines())}
+    assert sorted(lines) == [0, 1, 2]
+    assert lines[1] == {"index": 1, "error": "Empty question"}
+    for i, question in ((0, QUESTIONS[7]), (2, QUESTIONS[8])):
+        assert lines[i]["question"] == question
+        assert lines[i]["answer"] and lines[i]["sources"]
+        assert lines[i]["cached"] is False
+    # The LLM is only used by the /chat scheduler's worker
+    assert threads and set(threads) == {"chat-scheduler"}
+
+    assert client.post("/chat/batch", data="{not json\n", content_type="application/x-ndjson").status_code == 400
+    assert client.post("/chat/batch", json={"questions": []}).status_code == 400
+    remote = bot.app.test_client()
+    remote.environ_base["REMOTE_ADDR"] = "10.0.0.1"
+    assert remote.post("/chat/batch", json={"questions": QUESTIONS[:1]}).status_code == 403
+
+
+def block_chat_worker(bot, monkeypatch, max_queued):
+    """Give bot a /chat scheduler whose worker is busy until the returned event is set."""
+    scheduler = BatchScheduler(bot.answer_batch, 1, 1, name="chat-scheduler", max_queued=max_queued)
+    monkeypatch.setattr(bot, "chat_scheduler", scheduler)
+    busy, release = threading.Event(), threading.Event()
+    threading.Thread(target=scheduler.call, args=(lambda: busy.set() or release.wait(),), daemon=True).start()
+    assert busy.wait(5)
+    return release
+
+
+def test_full_queue_is_shed_with_retry_after(bot, monkeypatch):
+    release = block_chat_worker(bot, monkeypatch, max_queued=1)
+    shed = metric_value(bot.app.test_client(), "ihec_chat_shed_total", reason="queue_full")
+    waiting = []
+    thread = threading.Thread(target=lambda: waiting.append(
+        bot.app.test_client().post("/chat", json={"question": QUESTIONS[9]}).status_code))
+    thread.start()
+    while bot.chat_scheduler.depth() < 1:
+        time.sleep(0.01)
+
+    client = bot.app.test_client()
+    response = client.post("/chat", json={"question": QUESTIONS[10]})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert metric_value(client, "ihec_chat_shed_total", reason="queue_full") == shed + 1
+
+    # The question already queued is still answered
+    release.set()
+    thread.join(30)
+    assert waiting == [200]
+
+
+def test_expired_deadline_answers_504(bot, monkeypatch):
+    release = block_chat_worker(bot, monkeypatch, max_queued=0)
+    client = bot.app.test_client()
+    started = time.monotonic()
+    response = client.post("/chat", json={"question": QUESTIONS[11]}, headers={"X-Request-Timeout": "0.2"})
+    assert response.status_code == 504
+    assert time.monotonic() - started < 5
+    release.set()
+    assert client.post("/chat", json={"question": QUESTIONS[11]}).status_code == 200
+
+
+def test_answers_degrade_under_load(bot, monkeypatch):
+    client = bot.app.test_client()
+    full = client.post("/chat", json={"question": QUESTIONS[12]}).get_json()
+    assert "degraded" not in full
+    assert len(full["answer"].split()) > 3
+
+    # A stream in progress is load enough to shorten answers, then to skip the LLM
+    monkeypatch.setattr(bot, "stream_limit", ConcurrencyLimit(4))
+    slot = bot.stream_limit.acquire()
+    monkeypatch.setattr(bot, "DEGRADE_QUEUE_DEPTH", 1)
+    monkeypatch.setattr(bot, "RETRIEVAL_ONLY_QUEUE_DEPTH", 0)
+    monkeypatch.setattr(bot, "DEGRADED_MAX_NEW_TOKENS", 3)
+    short = client.post("/chat", json={"question": QUESTIONS[12]}).get_json()
+    assert short["degraded"] == "short"
+    assert 0 < len(short["answer"].split()) <= 3
+
+    monkeypatch.setattr(bot, "RETRIEVAL_ONLY_QUEUE_DEPTH", 1)
+    retrieval = client.post("/chat", json={"question": QUESTIONS[12]}).get_json()
+    assert retrieval["degraded"] == "retrieval_only"
+    assert retrieval["answer"] == retrieval["sources"][0]
+    slot.release()
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+import build_index
+import index_store
+from index_store import LiveIndex
+from index_writer import EMBED_MODEL
+from inference import embedding_model_id
+from stub_models import StubEmbedder
+
+
+def write_documents(folder, count):
+    folder.mkdir()
+    for i in range(count):
+        record = {"url": f"https://ihec.rnu.tn/test/{i}", "topic": f"test {i}",
+                  "paragraphs": [f"Examen numéro {i} : le lundi {i} juin.", f"Salle {i % 5}, bloc {i % 3}."]}
+        (folder / f"test_{i}.json").write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+
+
+def run_build(monkeypatch, documents, index_folder, *options):
+    monkeypatch.setenv("INFERENCE_BACKEND", "stub")
+    monkeypatch.setenv("EMBED_BACKEND", "stub")
+    monkeypatch.setattr(sys, "argv", ["build_index.py", "--documents", str(documents),
+                                      "--index-folder", str(index_folder), "--workers", "1", *options])
+    build_index.main()
+
+
+def test_bot_sync_skips_built_documents(tmp_path, monkeypatch):
+    documents = tmp_path / "documents"
+    write_documents(documents, 30)
+    run_build(monkeypatch, documents, tmp_path / "index")
+
+    read = []
+    iter_documents = index_store.iter_documents
+    monkeypatch.setattr(index_store, "iter_documents", lambda folder, names=None: (
+        read.extend(names) or iter_documents(folder, names)))
+    live_index = LiveIndex(StubEmbedder(), embedding_model_id(EMBED_MODEL, "stub"), str(tmp_path / "index"))
+    summary = live_index.sync_folder(str(documents))
+    assert summary["unchanged_files"] == 30
+    assert read == []
+
+
+def read_built(index_folder):
+    """Manifest and (ids, vectors) of a built index."""
+    with open(index_folder / "manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    faiss_index = faiss.read_index(str(index_folder / "index.faiss"))
+    ids = faiss.vector_to_array(faiss_index.id_map)
+    return manifest, ids, faiss_index.index.reconstruct_n(0, faiss_index.ntotal)
+
+
+def test_resumed_build_matches_an_uninterrupted_one(tmp_path, monkeypatch):
+    documents = tmp_path / "documents"
+    write_documents(documents, 30)
+    run_build(monkeypatch, documents, tmp_path / "whole", "--chunk-size", "8")
+
+    # Interrupted once two chunks are encoded and checkpointed
+    checkpoints = []
+    write_json = build_index._write_json
+
+    def interrupt(path, data):
+        write_json(path, data)
+        if path.endswith(build_index.CHECKPOINT_FILE):
+            checkpoints.append(len(data["done"]))
+            if len(checkpoints) == 2:
+                raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(build_index, "_write_json", interrupt)
+    with pytest.raises(RuntimeError):
+        run_build(monkeypatch, documents, tmp_path / "resumed", "--chunk-size", "8")
+    assert not os.path.isfile(tmp_path / "resumed" / "manifest.json")
+    monkeypatch.setattr(build_index, "_write_json", write_json)
+    report_path = tmp_path / "report.json"
+    run_build(monkeypatch, documents, tmp_path / "resumed", "--chunk-size", "8", "--output", str(report_path))
+
+    with open(report_path, encoding="utf-8") as f:
+        report = json.load(f)
+    assert 0 < report["encoded"] < report["passages"]
+    whole_manifest, whole_ids, whole_vectors = read_built(tmp_path / "whole")
+    resumed_manifest, resumed_ids, resumed_vectors = read_built(tmp_path / "resumed")
+    assert resumed_manifest["docs"] == whole_manifest["docs"]
+    assert resumed_manifest["files"] == whole_manifest["files"]
+    assert np.array_equal(resumed_ids, whole_ids)
+    assert np.allclose(resumed_vectors, whole_vectors)
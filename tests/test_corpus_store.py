@@ -0,0 +1,89 @@
+import os
+
+from corpus_store import CorpusStore, compact
+
+
+def test_put_get_and_delete(tmp_path):
+    store = CorpusStore(str(tmp_path))
+    store.put("a.json", {"text": "première page"})
+    store.put("b.json", '{"text":"raw"}')
+    assert store.get("a.json") == {"text": "première page"}
+    assert store.get_raw("b.json") == '{"text":"raw"}\n'
+    store.delete("a.json")
+    assert store.get("a.json") is None
+    assert "a.json" not in store and len(store) == 1
+    store.close()
+
+    reopened = CorpusStore(str(tmp_path))
+    assert reopened.keys() == ["b.json"]
+    reopened.close()
+
+
+def test_shards_roll_over_and_rewrites_move(tmp_path):
+    store = CorpusStore(str(tmp_path), shard_bytes=64)
+    for i in range(10):
+        store.put(f"{i}.json", {"text": "x" * 20, "i": i})
+    locations = store.locations()
+    assert len({shard for shard, _ in locations.values()}) > 1
+    assert all(store.get(f"{i}.json")["i"] == i for i in range(10))
+
+    store.put("0.json", {"text": "changed"})
+    assert store.locations()["0.json"] != locations["0.json"]
+    assert store.locations()["1.json"] == locations["1.json"]
+    store.close()
+
+    reopened = CorpusStore(str(tmp_path), shard_bytes=64)
+    assert reopened.locations() == store.locations()
+    assert reopened.get("0.json") == {"text": "changed"}
+    reopened.close()
+
+
+def test_reader_sees_flushed_rows_only(tmp_path):
+    writer = CorpusStore(str(tmp_path))
+    reader = CorpusStore(str(tmp_path))
+    writer.put("a.json", {"text": "a"})
+    assert reader.refresh() == set()
+    assert reader.get("a.json") is None
+
+    writer.flush()
+    assert reader.refresh() == {"a.json"}
+    assert reader.get("a.json") == {"text": "a"}
+
+    writer.delete("a.json")
+    writer.flush()
+    assert reader.refresh() == {"a.json"}
+    assert reader.get("a.json") is None
+    writer.close()
+    reader.close()
+
+
+def test_torn_rows_are_ignored(tmp_path):
+    store = CorpusStore(str(tmp_path))
+    store.put("a.json", {"text": "a"})
+    store.close()
+    # A writer killed while appending: a line and half an index entry without its key
+    with open(os.path.join(str(tmp_path), "shard-00000.jsonl"), "ab") as f:
+        f.write(b'{"text":"torn"}\n')
+    with open(os.path.join(str(tmp_path), "shard-00000.idx"), "ab") as f:
+        f.write(b"\x00" * 5)
+
+    reopened = CorpusStore(str(tmp_path))
+    assert reopened.keys() == ["a.json"]
+    assert reopened.get("a.json") == {"text": "a"}
+    reopened.close()
+
+
+def test_compact_keeps_live_keys(tmp_path):
+    folder = str(tmp_path / "corpus")
+    store = CorpusStore(folder)
+    for i in range(5):
+        store.put("a.json", {"text": "a", "version": i})
+    store.put("b.json", {"text": "b"})
+    store.delete("b.json")
+    store.close()
+
+    compact(folder)
+    compacted = CorpusStore(folder)
+    assert compacted.keys() == ["a.json"]
+    assert compacted.get("a.json") == {"text": "a", "version": 4}
+    compacted.close()
@@ -0,0 +1,74 @@
+from crawl_state import CrawlState, body_hash
+
+HOME = ("https://example.org/", "home", "/")
+NEWS = ("https://example.org/news", "news", "/news")
+OLD = ("https://example.org/old", "old", "/old")
+
+
+def crawl(state, pages):
+    """Record pages as fetched in the current run, with their conditional GET validators."""
+    for url, _, _ in pages:
+        state.record(url, f'"{url}"', "Mon, 01 Jan 2024 00:00:00 GMT", body_hash(url), url.rsplit("/", 1)[-1] or "index", [])
+        state.dequeue(url)
+
+
+def test_interrupted_run_resumes(tmp_path):
+    state = CrawlState(str(tmp_path / "state.db"))
+    assert state.start_run() == ([], set())
+    state.enqueue([HOME, NEWS])
+    crawl(state, [HOME])
+    run = state.run_id
+    state.close()
+
+    state = CrawlState(str(tmp_path / "state.db"))
+    frontier, visited = state.start_run()
+    assert state.run_id == run
+    assert frontier == [NEWS]
+    assert visited == {HOME[0], NEWS[0]}
+    state.close()
+
+
+def test_abandoned_run_starts_over(tmp_path):
+    state = CrawlState(str(tmp_path / "state.db"))
+    state.start_run()
+    state.enqueue([HOME, NEWS])
+    run = state.run_id
+    assert state.start_run(resume=False) == ([], set())
+    assert state.run_id != run
+    assert state.start_run() == ([], set())
+    state.close()
+
+
+def test_finished_run_reports_changes(tmp_path):
+    state = CrawlState(str(tmp_path / "state.db"))
+    state.start_run()
+    crawl(state, [HOME, NEWS, OLD])
+    first = state.finish_run()
+    assert sorted(page["url"] for page in first["added"]) == [HOME[0], NEWS[0], OLD[0]]
+    assert first["updated"] == [] and first["removed"] == []
+
+    state.start_run()
+    assert state.conditional_headers(HOME[0]) == {
+        "If-None-Match": f'"{HOME[0]}"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    state.touch(HOME[0])
+    crawl(state, [NEWS])
+    second = state.finish_run()
+    assert second["added"] == []
+    assert second["updated"] == [{"url": NEWS[0], "file": "news"}]
+    assert second["removed"] == [{"url": OLD[0], "file": "old"}]
+    assert state.get_page(OLD[0]) is None
+    assert state.get_page(HOME[0])["content_hash"] == body_hash(HOME[0])
+    state.close()
+
+
+def test_invalidated_page_is_fetched_again(tmp_path):
+    state = CrawlState(str(tmp_path / "state.db"))
+    state.start_run()
+    crawl(state, [HOME, NEWS])
+    state.invalidate([NEWS[0]])
+    assert state.conditional_headers(NEWS[0]) == {}
+    assert state.get_page(NEWS[0])["content_hash"] is None
+    assert state.get_page(HOME[0])["content_hash"] == body_hash(HOME[0])
+    state.close()
@@ -0,0 +1,68 @@
+from dedup import Deduplicator
+
+FOOTER = "Institut des Hautes Etudes Commerciales de Carthage, tous droits reserves, contactez nous"
+
+
+def page(url, paragraphs):
+    return {"url": url, "path": f"fr/{url}", "paragraphs": paragraphs}
+
+
+def test_duplicates_are_reported_to_the_kept_copy():
+    dropped = []
+    deduplicator = Deduplicator(on_duplicate=lambda *args: dropped.append(args))
+    deduplicator.filter_record(page("a", ["Exams start in June", FOOTER]))
+    record = deduplicator.filter_record(page("b", ["Registration opens in September", FOOTER + "."]))
+
+    assert record["paragraphs"] == ["Registration opens in September"]
+    assert dropped == [("a", FOOTER, "fr/b")]
+    assert deduplicator.kept_sources() == {"a": {FOOTER: ["fr/b"]}}
+
+
+def test_same_page_keeps_its_repeats():
+    deduplicator = Deduplicator(on_duplicate=lambda *args: 1 / 0)
+    record = deduplicator.filter_record(page("a", [FOOTER, FOOTER]))
+    assert record["paragraphs"] == [FOOTER, FOOTER]
+    assert deduplicator.kept_sources() == {}
+
+
+def test_paragraph_moves_on_when_its_owner_loses_it():
+    deduplicator = Deduplicator()
+    deduplicator.filter_record(page("a", ["Exams start in June", FOOTER]))
+    record = deduplicator.filter_record(page("b", ["Registration opens in September", FOOTER]))
+    assert record["paragraphs"] == ["Registration opens in September"]
+    assert len(record["duplicate_of"]) == 1
+
+    # a is re-crawled without the footer: b, which dropped it, must be parsed again
+    assert deduplicator.filter_record(page("a", ["Exams start in June"]))["paragraphs"] == ["Exams start in June"]
+    assert deduplicator.take_released() == ["b"]
+    assert deduplicator.take_released() == []
+    record = deduplicator.filter_record(page("b", ["Registration opens in September", FOOTER]))
+    assert record["paragraphs"] == ["Registration opens in September", FOOTER]
+    assert "duplicate_of" not in record
+
+    # b is removed: the next page with the footer keeps it
+    assert deduplicator.filter_record(page("c", [FOOTER]))["paragraphs"] == []
+    deduplicator.release("b")
+    assert deduplicator.take_released() == ["c"]
+    assert deduplicator.filter_record(page("c", [FOOTER]))["paragraphs"] == [FOOTER]
+
+
+def test_seeded_copies_are_tracked():
+    # Records saved by an earlier crawl
+    earlier = Deduplicator()
+    saved_a = earlier.filter_record(page("a", [FOOTER]))
+    saved_b = earlier.filter_record(page("b", [FOOTER]))
+
+    # A later crawl registers the saved records, then a loses the footer
+    deduplicator = Deduplicator()
+    deduplicator.filter_record(saved_a)
+    deduplicator.filter_record(dict(saved_b))
+    deduplicator.add_copies("b", "fr/b", saved_b["duplicate_of"])
+    assert deduplicator.kept_sources() == {"a": {FOOTER: ["fr/b"]}}
+    deduplicator.filter_record(page("a", ["Exams start in June"]))
+    assert deduplicator.take_released() == ["b"]
+
+    # A copy whose keeping page is not in the corpus any more
+    orphan = Deduplicator()
+    orphan.add_copies("b", "fr/b", saved_b["duplicate_of"])
+    assert orphan.take_released() == ["b"]
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+import index_store
+from ann_index import INDEX_TYPES, base_index, index_config, index_type
+from index_store import LiveIndex, load_manifest
+from stub_models import StubEmbedder
+
+DOCUMENTS = {f"doc{i}.json": f"document {i} about topic {i % 7} exams registration" for i in range(400)}
+
+
+def top_name(live_index, text):
+    return live_index.search(live_index.embed_model.encode([text]), 1)[0][0]["name"]
+
+
+def update_in_batches(live_index, documents, size):
+    names = sorted(documents)
+    for start in range(0, len(names), size):
+        live_index.update_files({name: documents[name] for name in names[start:start + size]})
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_update_after_reload(tmp_path, index_type):
+    config = index_config(type=index_type, nlist=4, pq_m=4)
+    LiveIndex(StubEmbedder(), "stub", str(tmp_path), config).update_files(DOCUMENTS)
+
+    # Loaded from the saved (memory-mapped) index, then changed more than once
+    live_index = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    live_index.update_files({"doc1.json": "changed alpha", "new.json": "brand new beta"}, ["doc2.json"])
+    live_index.update_files({"doc3.json": "changed gamma"}, ["doc4.json"])
+    live_index.save()
+
+    assert len(live_index) == 399
+    assert top_name(live_index, "changed alpha") == "doc1.json#0"
+
+    reloaded = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    assert len(reloaded) == 399
+    assert top_name(reloaded, "brand new beta") == "new.json#0"
+    reloaded.update_files({"doc5.json": "changed delta"})
+    assert top_name(reloaded, "changed delta") == "doc5.json#0"
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_follower_maps_journaled_changes(tmp_path, index_type):
+    config = index_config(type=index_type, nlist=4, pq_m=4)
+    writer = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    writer.update_files(DOCUMENTS)
+    follower = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    other = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    assert follower._mmapped and other._mmapped
+
+    writer.update_files({"doc1.json": "changed alpha"}, ["doc2.json"])
+    assert os.path.isfile(tmp_path / "journal-1.jsonl")
+    # The first follower writes the journal into a new snapshot, both keep the index mapped
+    assert follower.reload_if_changed()
+    assert load_manifest(str(tmp_path))["generation"] == 2
+    assert other.reload_if_changed()
+    for live_index in (follower, other):
+        assert live_index._mmapped
+        assert len(live_index) == 399
+        assert top_name(live_index, "changed alpha") == "doc1.json#0"
+    assert not follower.reload_if_changed()
+
+    # The follower can write too, on top of the replayed journal
+    follower.update_files({"doc3.json": "changed gamma"}, ["doc4.json"])
+    assert writer.reload_if_changed()
+    assert len(writer) == 398
+    assert top_name(writer, "changed gamma") == "doc3.json#0"
+
+
+def test_sync_folder_reads_changed_files_only(tmp_path, monkeypatch):
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    for i in range(5):
+        (documents / f"doc{i}.json").write_text(f"document {i} about exams", encoding="utf-8")
+    folder = str(tmp_path / "index")
+    assert LiveIndex(StubEmbedder(), "stub", folder).sync_folder(str(documents))["added"] == 5
+
+    read = []
+    iter_documents = index_store.iter_documents
+    monkeypatch.setattr(index_store, "iter_documents", lambda folder, names=None: (
+        read.extend(names) or iter_documents(folder, names)))
+    live_index = LiveIndex(StubEmbedder(), "stub", folder)
+    assert live_index.sync_folder(str(documents))["unchanged_files"] == 5
+    assert read == []
+
+    (documents / "doc1.json").write_text("changed alpha", encoding="utf-8")
+    os.remove(documents / "doc2.json")
+    summary = live_index.sync_folder(str(documents))
+    assert read == ["doc1.json"]
+    assert (summary["updated"], summary["removed"], len(live_index)) == (1, 1, 4)
+
+
+def test_stale_version_ignores_additions(tmp_path):
+    live_index = LiveIndex(StubEmbedder(), "stub", str(tmp_path))
+    live_index.update_files({"doc0.json": "first"})
+    stale_version = live_index.stale_version
+    live_index.update_files({"doc1.json": "second"})
+    assert live_index.stale_version == stale_version
+    live_index.update_files({"doc1.json": "second, edited"})
+    assert live_index.stale_version > stale_version
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_pq"])
+def test_prefilter_scores_candidates_exactly(tmp_path, index_type):
+    config = index_config(type=index_type, nlist=4, pq_m=4, retrieval="prefilter", candidates=20)
+    live_index = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    live_index.update_files(DOCUMENTS)
+    query = "topic 3 exams"
+    vector = live_index.embed_model.encode([query])
+    hits = live_index.search(vector, 3, [query])[0]
+    assert len(hits) == 3
+    assert all(hit["content"].endswith("topic 3 exams registration") for hit in hits)
+    # Squared L2 distances of the raw vectors, as a flat index reports them
+    expected = [float(((StubEmbedder().encode([hit["content"]])[0] - vector[0]) ** 2).sum()) for hit in hits]
+    assert [hit["score"] for hit in hits] == pytest.approx(expected)
+
+
+def test_index_is_trained_once_large_enough(tmp_path):
+    config = index_config(type="ivf_pq", pq_m=4)
+    live_index = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    live_index.update_files({name: DOCUMENTS[name] for name in sorted(DOCUMENTS)[:32]})
+    # Too few vectors to train PQ yet
+    assert index_type(live_index.faiss_index) == "flat"
+    assert load_manifest(str(tmp_path))["built_type"] == "flat"
+
+    update_in_batches(live_index, DOCUMENTS, 32)
+    assert index_type(live_index.faiss_index) == "ivf_pq"
+    assert load_manifest(str(tmp_path))["built_type"] == "ivf_pq"
+    reloaded = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    assert index_type(reloaded.faiss_index) == "ivf_pq"
+    assert len(reloaded) == 400
+
+
+def test_ivf_cells_grow_with_the_corpus(tmp_path):
+    config = index_config(type="ivf_flat", nprobe=1000)
+    live_index = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    update_in_batches(live_index, DOCUMENTS, 32)
+    # Sized for the corpus (4 * sqrt(400) = 80 cells), not for the first batch of 32
+    assert base_index(live_index.faiss_index).nlist >= 40
+    assert top_name(live_index, DOCUMENTS["doc123.json"]) == "doc123.json#0"
@@ -0,0 +1,21 @@
+from ann_index import index_config, index_type
+from index_store import LiveIndex, load_manifest
+from index_writer import IndexWriter
+from stub_models import StubEmbedder
+
+PAGES = {f"page{i}.json": f"page {i} about topic {i % 7} exams registration" for i in range(400)}
+
+
+def test_streamed_crawl_builds_the_configured_index(tmp_path):
+    config = index_config(type="ivf_pq", pq_m=4)
+    writer = IndexWriter(LiveIndex(StubEmbedder(), "stub", str(tmp_path), config), batch_size=16, flush_interval=0.01)
+    for name, content in PAGES.items():
+        writer.write(name, content)
+    writer.close()
+    assert writer.stats()["pages"] == 400
+    assert index_type(writer.live_index.faiss_index) == "ivf_pq"
+
+    reloaded = LiveIndex(StubEmbedder(), "stub", str(tmp_path), config)
+    assert load_manifest(str(tmp_path))["built_type"] == "ivf_pq"
+    assert index_type(reloaded.faiss_index) == "ivf_pq"
+    assert len(reloaded) == 400
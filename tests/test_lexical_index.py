@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize, weighted_fusion
+
+PASSAGES = [
+    "Les inscriptions en licence ouvrent en juillet.",
+    "La réinscription se fait en ligne avant septembre.",
+    "Le cours INF1010 a lieu le lundi, le cours INF2020 le mardi.",
+    "The library opens at eight.",
+]
+
+
+def make_index():
+    index = BM25Index()
+    for doc_id, text in enumerate(PASSAGES):
+        index.add(doc_id, tokenize(text))
+    return index
+
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert tokenize("La Réinscription de l'INF1010") == ["reinscription", "inf1010"]
+
+
+def test_search_ranks_matching_passages():
+    index = make_index()
+    ids, scores = index.search("reinscription en ligne", 3)
+    assert list(ids) == [1]
+    assert scores[0] > 0
+    ids, _ = index.search("cours inf2020 licence", 3)
+    assert list(ids) == [2, 0]
+    assert len(index.search("introuvable", 3)[0]) == 0
+
+
+def test_removed_ids_are_not_returned():
+    index = make_index()
+    index.remove(2)
+    assert 2 not in index and len(index) == 3
+    assert len(index.search("inf1010", 3)[0]) == 0
+    index.add(4, tokenize("Le cours INF1010 change de salle."))
+    index.compact()
+    assert list(index.search("inf1010", 3)[0]) == [4]
+
+
+def test_save_load_roundtrip():
+    index = make_index()
+    index.remove(3)
+    f = io.BytesIO()
+    index.save(f)
+    f.seek(0)
+    loaded = BM25Index.load(f)
+    assert len(loaded) == len(index)
+    assert 3 not in loaded
+    assert loaded.scores("cours licence septembre") == pytest.approx(index.scores("cours licence septembre"))
+
+
+def test_reciprocal_rank_fusion():
+    fused = dict(reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60))
+    assert fused[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2] == pytest.approx(1 / 62)
+    assert fused[3] == pytest.approx(1 / 63 + 1 / 61)
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([[1, 2, 3], [3, 1]])] == [1, 3, 2]
+
+
+def test_weighted_fusion_scales_each_list():
+    fused = weighted_fusion({1: 0.9, 2: 0.5}, {2: 12.0, 3: 4.0}, dense_weight=0.5)
+    assert dict(fused) == pytest.approx({1: 0.5, 2: 0.5, 3: 0.0})
+    fused = dict(weighted_fusion({1: 0.9, 2: 0.5}, {2: 12.0, 3: 4.0}, dense_weight=0.8))
+    assert fused == pytest.approx({1: 0.8, 2: 0.2, 3: 0.0})
+    assert weighted_fusion({}, {5: 1.0}) == [(5, 0.5)]
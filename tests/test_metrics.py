@@ -0,0 +1,33 @@
+from metrics import Registry, StageTimer, format_server_timing
+
+
+def test_render_prometheus_text():
+    registry = Registry("app", {"pid": lambda: 42})
+    requests = registry.counter("requests_total", "Requests", ("status",))
+    latency = registry.histogram("seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    latency.observe(0.05, stage="search")
+    latency.observe(0.5, stage="search")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE app_requests_total counter" in lines
+    assert 'app_requests_total{pid="42",status="200"} 3' in lines
+    assert "# TYPE app_seconds histogram" in lines
+    assert 'app_seconds_bucket{pid="42",stage="search",le="0.1"} 1' in lines
+    assert 'app_seconds_bucket{pid="42",stage="search",le="1.0"} 2' in lines
+    assert 'app_seconds_bucket{pid="42",stage="search",le="+Inf"} 2' in lines
+    assert 'app_seconds_sum{pid="42",stage="search"} 0.55' in lines
+    assert 'app_seconds_count{pid="42",stage="search"} 2' in lines
+
+
+def test_stage_timer_reports_each_stage():
+    registry = Registry()
+    timer = StageTimer(registry.histogram("seconds", "Latency", ("stage",)))
+    with timer.stage("encode"):
+        pass
+    timer.add("generate", 0.25)
+    timer.add("generate", 0.25)
+    assert timer.seconds["generate"] == 0.5
+    assert 'seconds_count{stage="encode"} 1' in registry.render()
+    assert format_server_timing({"search": 0.0123, "generate": 0.5}) == "search;dur=12.3, generate;dur=500.0"
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("pymongo")
+mongomock = pytest.importorskip("mongomock")
+
+from mongo_writer import MongoWriter, record_id  # noqa: E402
+
+
+def page(url, paragraphs):
+    return {"url": url, "topic": "topic", "path": f"fr/{url}", "paragraphs": paragraphs, "files": [], "tables": []}
+
+
+def test_changed_page_drops_its_old_paragraphs():
+    client = mongomock.MongoClient()
+    writer = MongoWriter("", "test", client)
+    writer._write_batch([page("a", ["one", "two"]), page("b", ["three"])])
+    writer._write_batch([page("a", ["two", "four"])])
+    writer.close()
+
+    ids = sorted(doc["_id"] for doc in client.test.web.find())
+    assert ids == sorted([record_id("a", "two"), record_id("a", "four"), record_id("b", "three")])
+    assert writer.stats()["deleted"] == 1
+
+
+def test_removed_page_is_deleted():
+    client = mongomock.MongoClient()
+    writer = MongoWriter("", "test", client)
+    writer.write(page("a", ["one", "two"]))
+    writer.write(page("b", ["three"]))
+    writer.remove("a")
+    writer.close()
+
+    assert [doc["_id"] for doc in client.test.pages.find()] == ["b"]
+    assert [doc["url"] for doc in client.test.web.find()] == ["b"]
+    assert writer.stats()["removed_pages"] == 1
+
+
+def test_sources_are_added_to_the_kept_paragraph():
+    client = mongomock.MongoClient()
+    writer = MongoWriter("", "test", client)
+    writer.write(page("a", ["footer"]))
+    writer.add_source("a", "footer", "fr/b")
+    writer.add_source("a", "footer", "fr/c")
+    writer.add_source("a", "footer", "fr/b")
+    writer.close()
+
+    paragraph = client.test.web.find_one({"_id": record_id("a", "footer")})
+    assert (paragraph["text"], paragraph["sources"]) == ("footer", ["fr/b", "fr/c"])
+    assert writer.stats()["records"] == 1
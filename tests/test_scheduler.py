@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import BatchScheduler, ConcurrencyLimit, DeadlineExceeded, QueueFull
+
+
+def test_concurrency_limit_rejects_beyond_max_active():
+    limit = ConcurrencyLimit(2)
+    first = limit.acquire()
+    limit.acquire()
+    with pytest.raises(QueueFull) as error:
+        limit.acquire()
+    assert error.value.retry_after >= 1
+    assert limit.active() == 2
+
+    # Releasing twice frees a single slot
+    first.release()
+    first.release()
+    assert limit.active() == 1
+    limit.acquire()
+    assert limit.stats()["rejected"] == 1
+
+
+def test_calls_run_on_the_worker_after_waiting_items():
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(items):
+        if "block" in items:
+            started.set()
+            release.wait()
+        order.extend(items)
+        return items
+
+    scheduler = BatchScheduler(process, max_batch_size=4, max_wait_ms=1)
+    threading.Thread(target=scheduler.submit, args=("block",), daemon=True).start()
+    assert started.wait(5)
+
+    # Queued behind the blocked batch: the call first, then an item, which still goes first
+    call_result = []
+    caller = threading.Thread(target=lambda: call_result.append(
+        scheduler.call(lambda: order.append("call") or threading.current_thread().name)), daemon=True)
+    caller.start()
+    while scheduler.stats()["queue_depth"] < 1:
+        time.sleep(0.001)
+    submitter = threading.Thread(target=scheduler.submit, args=("item",), daemon=True)
+    submitter.start()
+    while scheduler.depth() < 1:
+        time.sleep(0.001)
+    release.set()
+    caller.join(5)
+    submitter.join(5)
+
+    assert order == ["block", "item", "call"]
+    assert call_result == ["batch-scheduler"]
+    assert scheduler.stats()["calls"] == 1
+
+
+def test_call_reraises_errors():
+    scheduler = BatchScheduler(lambda items: items)
+    with pytest.raises(ZeroDivisionError):
+        scheduler.call(lambda: 1 / 0)
+    assert scheduler.submit("still running") == "still running"
+
+
+def submit_all(scheduler, items, deadline=None):
+    """Submit items from one thread each; returns {item: result or exception}."""
+    results = {}
+
+    def submit(item):
+        try:
+            results[item] = scheduler.submit(item, deadline)
+        except Exception as e:
+            results[item] = e
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_items_are_batched():
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    scheduler = BatchScheduler(process, max_batch_size=4, max_wait_ms=200)
+    results = submit_all(scheduler, range(8))
+    assert results == {item: item * 2 for item in range(8)}
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) < 8
+    assert scheduler.stats()["items"] == 8
+
+
+def test_errors_reach_every_item_of_the_batch():
+    def process(items):
+        raise ValueError("model failed")
+
+    scheduler = BatchScheduler(process, max_batch_size=4, max_wait_ms=50)
+    results = submit_all(scheduler, range(3))
+    assert all(isinstance(result, ValueError) for result in results.values())
+    assert scheduler.stats()["failed_batches"] >= 1
+
+
+def test_full_queue_rejects_at_once():
+    release = threading.Event()
+    started = threading.Event()
+
+    def process(items):
+        started.set()
+        release.wait()
+        return items
+
+    scheduler = BatchScheduler(process, max_batch_size=1, max_wait_ms=0, max_queued=2)
+    threading.Thread(target=scheduler.submit, args=("busy",), daemon=True).start()
+    assert started.wait(5)
+    waiting = [threading.Thread(target=scheduler.submit, args=(item,), daemon=True) for item in ("a", "b")]
+    for thread in waiting:
+        thread.start()
+    while scheduler.depth() < 2:
+        time.sleep(0.001)
+
+    with pytest.raises(QueueFull) as error:
+        scheduler.submit("c")
+    assert error.value.retry_after >= 1
+    assert scheduler.stats()["rejected"] == 1
+    release.set()
+    for thread in waiting:
+        thread.join(5)
+
+
+def test_expired_items_are_not_processed():
+    processed = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def process(items):
+        started.set()
+        release.wait()
+        processed.extend(items)
+        return items
+
+    scheduler = BatchScheduler(process, max_batch_size=1, max_wait_ms=0)
+    threading.Thread(target=scheduler.submit, args=("busy",), daemon=True).start()
+    assert started.wait(5)
+
+    # Gives up while the worker is busy, and is dropped instead of processed afterwards
+    with pytest.raises(DeadlineExceeded):
+        scheduler.submit("late", time.monotonic() + 0.05)
+    release.set()
+    assert scheduler.submit("next") == "next"
+    assert processed == ["busy", "next"]
+    assert scheduler.stats()["expired"] == 1
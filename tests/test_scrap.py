@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("bs4")
+
+import scrap
+from corpus_store import CorpusStore
+from crawl_state import CrawlState
+
+
+def test_token_bucket_paces_requests():
+    async def take(bucket, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # The burst goes out at once, the rest at `rate` per second
+    assert asyncio.run(take(scrap.TokenBucket(rate=20, capacity=3), 3)) < 0.04
+    assert asyncio.run(take(scrap.TokenBucket(rate=20, capacity=3), 5)) >= 0.09
+
+
+def test_concurrent_acquires_share_the_rate():
+    async def run():
+        bucket = scrap.TokenBucket(rate=50)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_one_limiter_per_host(monkeypatch):
+    monkeypatch.setattr(scrap, "host_limiters", {})
+    first = scrap.get_limiter("https://example.org/a", 1)
+    assert scrap.get_limiter("https://example.org/b?page=2", 1) is first
+    assert scrap.get_limiter("https://other.example.org/a", 1) is not first
+
+
+class RecordingWriter:
+    """Stands in for the IndexWriter."""
+
+    def __init__(self):
+        self.written = []
+        self.removed = []
+
+    def write(self, file_name, content):
+        self.written.append(file_name)
+
+    def remove(self, file_name):
+        self.removed.append(file_name)
+
+
+def test_emptied_page_is_deleted_everywhere(tmp_path, monkeypatch):
+    monkeypatch.setattr(scrap, "corpus", CorpusStore(str(tmp_path / "corpus")))
+    monkeypatch.setattr(scrap, "CHANGES_FILE", str(tmp_path / "changes.json"))
+    index_writer = RecordingWriter()
+    monkeypatch.setattr(scrap, "index_writer", index_writer)
+    state = CrawlState(str(tmp_path / "state.db"))
+    url = "https://ihec.rnu.tn/fr/examens"
+
+    state.start_run()
+    file_name, _ = scrap.process_page(url, "examens", "fr/examens", "<p>Session de juin</p>")
+    state.record(url, None, None, "v1", file_name, [])
+    state.finish_run()
+    assert file_name in scrap.corpus
+
+    # The page still exists but lost its only paragraph
+    state.start_run()
+    assert scrap.process_page(url, "examens", "fr/examens", "<div>Bientôt</div>")[0] == file_name
+    state.record(url, None, None, "v2", file_name, [])
+    changes = state.finish_run()
+    scrap.apply_changes(changes)
+    assert file_name not in scrap.corpus
+    assert index_writer.removed == [file_name]
+    assert changes["files"] == [file_name]
+    state.close()
+    scrap.corpus.close()
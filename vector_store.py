@@ -0,0 +1,141 @@
+"""
+Raw passage embeddings kept on disk, keyed by content hash: the source FAISS indexes are built from.
+
+    vectors.json   {"model": ..., "dimension": ...} the rows were encoded with
+    vectors.f32    float32 rows, appended, memory-mapped by readers
+    vectors.keys   "<content hash> <row>" per appended row
+
+LiveIndex looks passages up here before encoding them, so a passage is encoded once per model:
+changing INDEX_TYPE, or rebuilding an index type that cannot remove vectors, re-reads the rows
+instead of running the embedding model over the corpus again. Vectors are stored as the model
+returned them (not normalized), so the metric can change too. A hash written again later
+points at its latest row.
+"""
+import os
+import json
+import threading
+import numpy as np
+
+META_FILE = "vectors.json"
+DATA_FILE = "vectors.f32"
+KEYS_FILE = "vectors.keys"
+
+
+class VectorStore:
+    """
+    Content hash -> embedding store on an append-only float32 file. Only the hash -> row map
+    lives in memory. Thread-safe within a process; only one process should write at a time
+    (LiveIndex holds its folder lock), others pick up appended rows with refresh().
+    """
+
+    def __init__(self, folder, model_name, dimension):
+        self.folder = folder
+        self.model_name = model_name
+        self.dimension = dimension
+        self._lock = threading.RLock()
+        self._rows = {}  # content hash -> row
+        self._keys_pos = 0  # bytes of the keys file consumed
+        self._map = None  # memmap of the data file, remapped when it grows
+        os.makedirs(folder, exist_ok=True)
+        meta = self._read_meta()
+        if meta is None:
+            self._write_meta()
+        # Rows of another model are ignored, and dropped on the first add()
+        self.valid = meta is None or meta == self._meta()
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _meta(self):
+        return {"model": self.model_name, "dimension": self.dimension}
+
+    def _read_meta(self):
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._meta(), f)
+
+    def refresh(self):
+        """Load the rows appended (by any process) since the last call."""
+        if not self.valid:
+            return
+        with self._lock:
+            try:
+                with open(self._path(KEYS_FILE), "rb") as f:
+                    f.seek(self._keys_pos)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            # Only use complete lines
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.decode("utf-8").split("\n")[:-1]:
+                content_hash, row = line.split(" ")
+                self._rows[content_hash] = int(row)
+            self._keys_pos += len(data)
+
+    def _rows_on_disk(self):
+        try:
+            return os.path.getsize(self._path(DATA_FILE)) // (4 * self.dimension)
+        except OSError:
+            return 0
+
+    def _mapped(self, rows):
+        """The data file mapped over at least rows rows."""
+        if self._map is None or len(self._map) < rows:
+            self._map = np.memmap(self._path(DATA_FILE), dtype="float32", mode="r",
+                                  shape=(self._rows_on_disk(), self.dimension))
+        return self._map
+
+    def lookup(self, hashes):
+        """Return (float32 matrix with a row per hash, positions of the hashes not stored, whose rows are zero)."""
+        vectors = np.zeros((len(hashes), self.dimension), dtype="float32")
+        with self._lock:
+            rows = [self._rows.get(content_hash) for content_hash in hashes]
+            found = [i for i, row in enumerate(rows) if row is not None]
+            if found:
+                mapped = self._mapped(max(rows[i] for i in found) + 1)
+                vectors[found] = mapped[[rows[i] for i in found]]
+        return vectors, [i for i, row in enumerate(rows) if row is None]
+
+    def add(self, hashes, vectors):
+        """Append the vectors of passages with these content hashes."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self._lock:
+            if not self.valid:
+                # Encoded with another model: start over
+                for name in (DATA_FILE, KEYS_FILE):
+                    if os.path.exists(self._path(name)):
+                        os.remove(self._path(name))
+                self._write_meta()
+                self._rows = {}
+                self._keys_pos = 0
+                self._map = None
+                self.valid = True
+            self.refresh()
+            # Rows are located by file size, so a torn earlier append cannot shift them
+            first = self._rows_on_disk()
+            with open(self._path(DATA_FILE), "ab") as f:
+                f.truncate(first * 4 * self.dimension)
+                f.write(vectors.tobytes())
+            lines = "".join(f"{content_hash} {first + i}\n" for i, content_hash in enumerate(hashes))
+            with open(self._path(KEYS_FILE), "ab") as f:
+                # Drop a torn last line, refresh() consumed every complete one
+                f.truncate(self._keys_pos)
+                f.write(lines.encode("utf-8"))
+            self.refresh()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, content_hash):
+        return content_hash in self._rows
+
+    def close(self):
+        with self._lock:
+            self._map = None
@@ -0,0 +1,92 @@
+"""
+Memory of the gunicorn master and its workers, from /proc/<pid>/smaps_rollup (Linux).
+
+RSS counts every resident page, shared ones included, so summing it over workers overstates
+the total. PSS splits each shared page between the processes mapping it: the PSS total is
+the memory the whole server really uses. Private is what a worker adds on its own.
+
+    python worker_memory.py
+    python worker_memory.py --pid 1234 --output memory.json
+"""
+import os
+import json
+import argparse
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_rollup(pid):
+    """The FIELDS of /proc/<pid>/smaps_rollup, in MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in FIELDS:
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def processes():
+    """(pid, parent pid, command line) of every process."""
+    found = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # The command name is in parentheses and may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+        except (OSError, IndexError, ValueError):
+            continue
+        found.append((int(name), ppid, cmdline))
+    return found
+
+
+def find_master(procs):
+    """The gunicorn process whose parent is not gunicorn."""
+    gunicorn = {pid for pid, _, cmdline in procs if "gunicorn" in cmdline}
+    masters = [pid for pid, ppid, _ in procs if pid in gunicorn and ppid not in gunicorn]
+    return masters[0] if masters else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, help="gunicorn master PID (default: found from the process list)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    procs = processes()
+    master = args.pid or find_master(procs)
+    if master is None:
+        parser.error("no gunicorn master found, pass --pid")
+    workers = sorted(pid for pid, ppid, _ in procs if ppid == master)
+
+    rows = []
+    for role, pid in [("master", master)] + [("worker", pid) for pid in workers]:
+        try:
+            rows.append(dict(read_rollup(pid), pid=pid, role=role))
+        except OSError as e:
+            print(f"Skipping {pid}: {e}")
+
+    print(f"{'pid':>8} {'role':<7}{'rss MB':>10}{'pss MB':>10}{'shared MB':>11}{'private MB':>12}")
+    for row in rows:
+        print(f"{row['pid']:>8} {row['role']:<7}{row['rss_mb']:>10.0f}{row['pss_mb']:>10.0f}"
+              f"{row['shared_mb']:>11.0f}{row['private_mb']:>12.0f}")
+    totals = {key: sum(row[key] for row in rows) for key in ("rss_mb", "pss_mb", "private_mb")}
+    print(f"{len(workers)} workers: RSS sum {totals['rss_mb']:.0f} MB, "
+          f"PSS sum {totals['pss_mb']:.0f} MB (actual), private sum {totals['private_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"master": master, "processes": rows, "totals": totals}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()